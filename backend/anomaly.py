@@ -0,0 +1,230 @@
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# Baseline smoothing: ~1/alpha records of memory per Area/Line/shift
+BASELINE_ALPHA = float(os.environ.get("ANOMALY_BASELINE_ALPHA", 0.02))
+# Short-term failure rate, compared against the baseline rate
+BURST_ALPHA = float(os.environ.get("ANOMALY_BURST_ALPHA", 0.2))
+# Records a baseline needs before it can raise alerts
+MIN_SAMPLES = int(os.environ.get("ANOMALY_MIN_SAMPLES", 30))
+REWORK_TIME_Z = float(os.environ.get("ANOMALY_REWORK_TIME_Z", 3.0))
+FAILURE_RATE_Z = float(os.environ.get("ANOMALY_FAILURE_RATE_Z", 3.0))
+# Alert messages: at most ALERT_BURST at once, refilled at ALERT_RATE per second;
+# one key alerts again only after ALERT_COOLDOWN seconds
+ALERT_RATE = float(os.environ.get("ANOMALY_ALERT_RATE", 0.2))
+ALERT_BURST = int(os.environ.get("ANOMALY_ALERT_BURST", 3))
+ALERT_COOLDOWN = float(os.environ.get("ANOMALY_ALERT_COOLDOWN", 60.0))
+
+KEY_FIELDS = ("Area", "Line", "shift")
+
+
+# ------------------ Rolling baselines ------------------
+class Baseline:
+    """Exponentially weighted statistics of one Area/Line/shift.
+
+    Each record updates the mean and variance of its rework time and two
+    failure rates (slow baseline, fast burst) in constant time and memory.
+    """
+
+    __slots__ = ("count", "time_mean", "time_var", "failure_rate", "burst_rate")
+
+    def __init__(self):
+        self.count = 0
+        self.time_mean = 0.0
+        self.time_var = 0.0
+        self.failure_rate = 0.0
+        self.burst_rate = 0.0
+
+    def update(self, rework_time: Optional[float], failed: Optional[int]) -> None:
+        self.count += 1
+        # Plain averages until the window fills, so the first records do not dominate
+        alpha = max(BASELINE_ALPHA, 1.0 / self.count)
+        if rework_time is not None:
+            delta = rework_time - self.time_mean
+            self.time_mean += alpha * delta
+            self.time_var = (1 - alpha) * (self.time_var + alpha * delta * delta)
+        if failed is not None:
+            self.failure_rate += alpha * (failed - self.failure_rate)
+            self.burst_rate += max(BURST_ALPHA, 1.0 / self.count) * (failed - self.burst_rate)
+
+    def rework_time_score(self, rework_time: float) -> float:
+        return (rework_time - self.time_mean) / math.sqrt(max(self.time_var, 1.0))
+
+    def failure_rate_score(self) -> float:
+        # Standard deviation of a fast EWMA of Bernoulli draws at the baseline rate
+        p = min(max(self.failure_rate, 0.01), 0.99)
+        sigma = math.sqrt(p * (1 - p) * BURST_ALPHA / (2 - BURST_ALPHA))
+        return (self.burst_rate - self.failure_rate) / sigma
+
+
+def _rework_time(record: Dict[str, Any]) -> Optional[float]:
+    try:
+        return float(record["Rework_time"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _failed(record: Dict[str, Any]) -> Optional[int]:
+    if record.get("Success") in (None, ""):
+        return None
+    return 0 if int(record["Success"]) else 1
+
+
+class AnomalyDetector:
+    """Scores incoming records against the baseline of their Area/Line/shift.
+
+    A record is scored before it joins its baseline. Two kinds of spikes are
+    reported: a rework time far above the usual ones (z-score), and a short
+    run of failures pushing the burst failure rate above the baseline rate.
+
+    Only new reworks are absorbed: a patch of a rework already seen
+    corrects one that was counted, it is not another one.
+    """
+
+    def __init__(self):
+        self.baselines: Dict[Tuple[str, ...], Baseline] = {}
+        self.seen: Set[str] = set()
+
+    @staticmethod
+    def rework(record: Dict[str, Any]) -> str:
+        # REWORK_ID identifies a rework; ORDNR for records without one
+        rework_id = record.get("REWORK_ID")
+        return f"id:{rework_id}" if rework_id is not None else f"order:{record.get('ORDNR')}"
+
+    @staticmethod
+    def key(record: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(record.get(field, "")) for field in KEY_FIELDS)
+
+    def reset(self, records: Iterable[Dict[str, Any]] = ()) -> None:
+        """Rebuild every baseline from ``records`` (startup, full replacement)."""
+        self.baselines = {}
+        self.seen = set()
+        for record in records:
+            self.seen.add(self.rework(record))
+            self._baseline(record).update(_rework_time(record), _failed(record))
+
+    def _baseline(self, record: Dict[str, Any]) -> Baseline:
+        key = self.key(record)
+        baseline = self.baselines.get(key)
+        if baseline is None:
+            baseline = self.baselines[key] = Baseline()
+        return baseline
+
+    def observe(self, records: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Score then absorb the new reworks; returns the anomalies found."""
+        # A rework appended then patched in the same batch counts once, as it ended up
+        new = {}
+        for record in records:
+            rework = self.rework(record)
+            if rework not in self.seen:
+                new[rework] = record
+        self.seen.update(new)
+        anomalies = []
+        for record in new.values():
+            baseline = self._baseline(record)
+            rework_time, failed = _rework_time(record), _failed(record)
+            ready = baseline.count >= MIN_SAMPLES
+            if ready and rework_time is not None:
+                score = baseline.rework_time_score(rework_time)
+                if score >= REWORK_TIME_Z:
+                    anomalies.append(self._anomaly("rework_time", record, rework_time,
+                                                   baseline.time_mean, score))
+            was_spiking = ready and baseline.failure_rate_score() >= FAILURE_RATE_Z
+            baseline.update(rework_time, failed)
+            # Report the failure burst once, when it crosses the threshold
+            if ready and failed and not was_spiking:
+                score = baseline.failure_rate_score()
+                if score >= FAILURE_RATE_Z:
+                    anomalies.append(self._anomaly("failure_rate", record, baseline.burst_rate,
+                                                   baseline.failure_rate, score))
+        return anomalies
+
+    def _anomaly(self, kind: str, record: Dict[str, Any], value: float,
+                 baseline: float, score: float) -> Dict[str, Any]:
+        area, line, shift = self.key(record)
+        return {
+            "kind": kind,
+            "Area": area,
+            "Line": line,
+            "shift": shift,
+            "ORDNR": record.get("ORDNR"),
+            "REWORK_DATE": record.get("REWORK_DATE"),
+            "value": round(value, 3),
+            "baseline": round(baseline, 3),
+            "score": round(score, 2),
+        }
+
+    def summary(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                **dict(zip(KEY_FIELDS, key)),
+                "count": baseline.count,
+                "rework_time_mean": round(baseline.time_mean, 2),
+                "rework_time_std": round(math.sqrt(baseline.time_var), 2),
+                "failure_rate": round(baseline.failure_rate, 4),
+                "burst_failure_rate": round(baseline.burst_rate, 4),
+            }
+            for key, baseline in sorted(self.baselines.items())
+        ]
+
+
+# ------------------ Alert rate limiting ------------------
+class AlertLimiter:
+    """Decides which anomalies become ``alert`` messages.
+
+    An Area/Line/shift/kind alerts at most once per cooldown, and alert
+    messages draw from a token bucket. Whatever is held back is counted and
+    reported with the next message, so a failure burst yields a handful of
+    messages instead of one per record.
+    """
+
+    def __init__(self, rate: float = ALERT_RATE, burst: int = ALERT_BURST,
+                 cooldown: float = ALERT_COOLDOWN, history: int = 100):
+        self.rate = rate
+        self.burst = burst
+        self.cooldown = cooldown
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.last_alert: Dict[Tuple[str, ...], float] = {}
+        self.suppressed = 0
+        self.recent: deque = deque(maxlen=history)
+
+    def admit(self, anomalies: List[Dict[str, Any]],
+              now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """The alert message to send for ``anomalies``, or None if rate limited."""
+        if not anomalies:
+            return None
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        fresh = {}
+        for anomaly in anomalies:
+            key = (anomaly["kind"],) + tuple(anomaly[field] for field in KEY_FIELDS)
+            if key in fresh or now - self.last_alert.get(key, -math.inf) < self.cooldown:
+                self.suppressed += 1
+            else:
+                fresh[key] = anomaly
+        if not fresh:
+            return None
+        if self.tokens < 1:
+            # Not sent, so not muted either: the next spike may alert
+            self.suppressed += len(fresh)
+            return None
+
+        self.tokens -= 1
+        for key in fresh:
+            self.last_alert[key] = now
+        fresh = list(fresh.values())
+        message = {
+            "type": "alert",
+            "alerts": fresh,
+            "suppressed": self.suppressed,
+            "message": f"{len(fresh)} anomal{'y' if len(fresh) == 1 else 'ies'} detected",
+        }
+        self.suppressed = 0
+        self.recent.extend(fresh)
+        return message
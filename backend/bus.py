@@ -0,0 +1,344 @@
+import asyncio
+import json
+import logging
+import os
+import struct
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+# Where node sockets of the unix bus live by default
+DEFAULT_UNIX_DIR = "/tmp/rework-bus"
+DEFAULT_CHANNEL = "rework"
+
+
+class Bus:
+    """Relays client-facing messages between backend nodes.
+
+    A node delivers its own messages to its own clients directly, then
+    publishes them once on the bus; every other node receives them exactly
+    once and pushes them to its clients. Messages are JSON-encoded once per
+    publish, whatever the number of nodes.
+    """
+
+    def __init__(self):
+        self.node_id = uuid.uuid4().hex
+        self.handler: Optional[Handler] = None
+
+    async def start(self, handler: Handler) -> None:
+        self.handler = handler
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, message: Dict[str, Any]) -> None:
+        pass
+
+    def _encode(self, message: Dict[str, Any]) -> bytes:
+        return json.dumps({"node": self.node_id, "message": message},
+                          separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    async def _receive(self, payload: bytes) -> None:
+        try:
+            envelope = json.loads(payload)
+            if envelope.get("node") != self.node_id and self.handler is not None:
+                await self.handler(envelope["message"])
+        except Exception as e:
+            logging.warning(f"Dropped bus message: {e}")
+
+
+class InProcessBus(Bus):
+    """Single node: nothing to relay (the default)."""
+
+
+# ------------------ Local multi-process bus ------------------
+class UnixSocketBus(Bus):
+    """Nodes on one host, each listening on <directory>/<node>.sock.
+
+    Publishing writes one length-prefixed frame to each peer socket found
+    in the directory; connections are kept open and sockets left behind by
+    dead nodes are removed.
+    """
+
+    def __init__(self, directory: str = DEFAULT_UNIX_DIR):
+        super().__init__()
+        self.directory = Path(directory)
+        self.path = self.directory / f"{self.node_id}.sock"
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._peers: Dict[Path, asyncio.StreamWriter] = {}
+        self._connections: set = set()
+        self._lock = asyncio.Lock()
+
+    async def start(self, handler: Handler) -> None:
+        await super().start(handler)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._server = await asyncio.start_unix_server(self._serve, path=str(self.path))
+
+    async def stop(self) -> None:
+        self.path.unlink(missing_ok=True)
+        if self._server is not None:
+            self._server.close()
+        for writer in list(self._peers.values()) + list(self._connections):
+            writer.close()
+        self._peers = {}
+        # Let the reading side of the closed connections finish
+        await asyncio.sleep(0)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections.add(writer)
+        try:
+            while True:
+                (size,) = struct.unpack("!I", await reader.readexactly(4))
+                await self._receive(await reader.readexactly(size))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def publish(self, message: Dict[str, Any]) -> None:
+        payload = self._encode(message)
+        frame = struct.pack("!I", len(payload)) + payload
+        async with self._lock:
+            peers = [path for path in self.directory.glob("*.sock") if path != self.path]
+            for path in peers:
+                try:
+                    writer = self._peers.get(path)
+                    if writer is None or writer.is_closing():
+                        _, writer = await asyncio.open_unix_connection(str(path))
+                        self._peers[path] = writer
+                    writer.write(frame)
+                    await writer.drain()
+                except (ConnectionError, FileNotFoundError, OSError):
+                    # Socket file of a node that is gone
+                    self._peers.pop(path, None)
+                    path.unlink(missing_ok=True)
+            for path in set(self._peers) - set(peers):
+                self._peers.pop(path).close()
+
+
+# ------------------ Redis-protocol bus ------------------
+def _bulk(part: Any) -> bytes:
+    part = part if isinstance(part, bytes) else str(part).encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(part), part)
+
+
+def resp_command(*parts: Any) -> bytes:
+    return b"*%d\r\n" % len(parts) + b"".join(_bulk(part) for part in parts)
+
+
+async def resp_read(reader: asyncio.StreamReader) -> Any:
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode()
+    if kind == b"-":
+        raise ConnectionError(body.decode())
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        size = int(body)
+        return None if size < 0 else (await reader.readexactly(size + 2))[:-2]
+    if kind == b"*":
+        size = int(body)
+        return None if size < 0 else [await resp_read(reader) for _ in range(size)]
+    raise ConnectionError(f"Unexpected RESP reply {line!r}")
+
+
+class RedisBus(Bus):
+    """PUBLISH/SUBSCRIBE on one channel of a Redis-protocol server.
+
+    Speaks RESP directly over asyncio streams (no client library), on two
+    connections: one subscribed, one for PUBLISH. The server does the
+    fan-out to every node.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, channel: str = DEFAULT_CHANNEL):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.channel = channel
+        self._publisher: Optional[asyncio.StreamWriter] = None
+        self._publisher_reader: Optional[asyncio.StreamReader] = None
+        self._subscriber: Optional[asyncio.Task] = None
+        self._subscribed = asyncio.Event()
+        self._lock = asyncio.Lock()
+
+    async def start(self, handler: Handler) -> None:
+        await super().start(handler)
+        self._subscriber = asyncio.create_task(self._subscribe_loop())
+        await asyncio.wait_for(self._subscribed.wait(), 5)
+
+    async def stop(self) -> None:
+        if self._subscriber is not None:
+            self._subscriber.cancel()
+            await asyncio.gather(self._subscriber, return_exceptions=True)
+        if self._publisher is not None:
+            self._publisher.close()
+            self._publisher = None
+
+    async def _subscribe_loop(self) -> None:
+        while True:
+            writer = None
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+                writer.write(resp_command("SUBSCRIBE", self.channel))
+                await writer.drain()
+                while True:
+                    reply = await resp_read(reader)
+                    if reply[0] == b"subscribe":
+                        self._subscribed.set()
+                    elif reply[0] == b"message":
+                        await self._receive(reply[2])
+            except asyncio.CancelledError:
+                if writer is not None:
+                    writer.close()
+                raise
+            except (ConnectionError, OSError, asyncio.IncompleteReadError) as e:
+                logging.warning(f"Bus subscription lost ({e}), reconnecting")
+                await asyncio.sleep(1)
+
+    async def publish(self, message: Dict[str, Any]) -> None:
+        command = resp_command("PUBLISH", self.channel, self._encode(message))
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._publisher is None or self._publisher.is_closing():
+                        self._publisher_reader, self._publisher = await asyncio.open_connection(
+                            self.host, self.port)
+                    self._publisher.write(command)
+                    await self._publisher.drain()
+                    await resp_read(self._publisher_reader)
+                    return
+                except (ConnectionError, OSError) as e:
+                    self._publisher = None
+                    if attempt:
+                        logging.error(f"Bus publish failed: {e}")
+
+
+class LocalRedisStandIn:
+    """Minimal Redis-protocol server (PING, PUBLISH, SUBSCRIBE) for tests
+    and benchmarks of RedisBus without a Redis install."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.channels: Dict[bytes, set] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: set = set()
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self) -> None:
+        self._server.close()
+        for writer in list(self._connections):
+            writer.close()
+        await asyncio.sleep(0)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        subscribed = []
+        self._connections.add(writer)
+        try:
+            while True:
+                command = await resp_read(reader)
+                name = command[0].upper()
+                if name == b"PING":
+                    writer.write(b"+PONG\r\n")
+                elif name == b"SUBSCRIBE":
+                    for i, channel in enumerate(command[1:], 1):
+                        self.channels.setdefault(channel, set()).add(writer)
+                        subscribed.append(channel)
+                        writer.write(b"*3\r\n" + _bulk("subscribe") + _bulk(channel) + b":%d\r\n" % i)
+                elif name == b"PUBLISH":
+                    receivers = list(self.channels.get(command[1], ()))
+                    message = resp_command("message", command[1], command[2])
+                    for receiver in receivers:
+                        receiver.write(message)
+                    writer.write(b":%d\r\n" % len(receivers))
+                else:
+                    writer.write(b"-ERR unknown command\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            for channel in subscribed:
+                self.channels.get(channel, set()).discard(writer)
+            writer.close()
+
+
+def create_bus(url: Optional[str] = None) -> Bus:
+    """Bus for BUS_URL: "memory" (default), "unix:///dir" or "redis://host:port/channel"."""
+    url = url or os.environ.get("BUS_URL", "memory")
+    parsed = urlparse(url)
+    if parsed.scheme in ("", "memory"):
+        return InProcessBus()
+    if parsed.scheme == "unix":
+        return UnixSocketBus(parsed.path or DEFAULT_UNIX_DIR)
+    if parsed.scheme == "redis":
+        return RedisBus(parsed.hostname or "127.0.0.1", parsed.port or 6379,
+                        parsed.path.strip("/") or DEFAULT_CHANNEL)
+    raise ValueError(f"Unknown bus {url!r}")
+
+
+# ------------------ Benchmark ------------------
+async def _bench(kind: str, nodes: int, messages: int, size: int) -> Dict[str, Any]:
+    import tempfile
+    stand_in = None
+    if kind == "redis":
+        stand_in = LocalRedisStandIn()
+        port = await stand_in.start()
+        buses = [RedisBus(port=port) for _ in range(nodes)]
+    else:
+        directory = tempfile.mkdtemp()
+        buses = [UnixSocketBus(directory) for _ in range(nodes)]
+
+    received: List[float] = []
+    done = asyncio.Event()
+    expected = messages * (nodes - 1)
+
+    async def handler(message):
+        received.append(time.perf_counter() - message["sent"])
+        if len(received) == expected:
+            done.set()
+
+    for bus in buses:
+        await bus.start(handler)
+    start = time.perf_counter()
+    for i in range(messages):
+        await buses[i % nodes].publish({"type": "data_patch", "sent": time.perf_counter(), "pad": "x" * size})
+        # Writes arrive one at a time, letting receivers run in between
+        await asyncio.sleep(0)
+    await asyncio.wait_for(done.wait(), 60)
+    elapsed = time.perf_counter() - start
+    for bus in buses:
+        await bus.stop()
+    if stand_in is not None:
+        await stand_in.stop()
+    received.sort()
+    return {
+        "bus": kind,
+        "nodes": nodes,
+        "messages": messages,
+        "bytes": size,
+        "deliveries_per_s": round(expected / elapsed),
+        "p50_ms": round(received[len(received) // 2] * 1000, 2),
+        "p99_ms": round(received[int(len(received) * 0.99)] * 1000, 2),
+    }
+
+
+if __name__ == "__main__":
+    nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    for kind in ("unix", "redis"):
+        for size in (200, 20000):
+            print(asyncio.run(_bench(kind, nodes, 2000, size)))
@@ -0,0 +1,117 @@
+import asyncio
+import os
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+from dataset import lock_path
+
+try:
+    import fcntl
+except ImportError:  # Windows: no lock, one writer per DATA_DIR is assumed
+    fcntl = None
+
+# Request headers passed on to the writer node, and response headers passed back
+FORWARDED_REQUEST_HEADERS = ("Content-Type", "Accept", "Accept-Encoding", "If-None-Match", "If-Modified-Since")
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "content-length", "server", "date"}
+FORWARD_TIMEOUT = float(os.environ.get("REWORK_FORWARD_TIMEOUT", 30))
+STREAM_CHUNK = 64 * 1024
+
+
+class WriterLocked(RuntimeError):
+    pass
+
+
+class WriterLock:
+    """Exclusive ownership of a data file, for the whole life of a node.
+
+    Several nodes may serve one DATA_DIR, but only one of them may write
+    it: data.json, its journal and revision file, the analytics store and
+    the history are all rewritten from the writer's memory, so a second
+    writer would silently drop the first one's changes. The lock is an
+    flock on ``<data>.lock``, released by the OS if the node dies.
+    """
+
+    def __init__(self, data_path: Path):
+        self.data_path = data_path
+        self.path = lock_path(data_path)
+        self._file = None
+
+    def acquire(self) -> None:
+        if fcntl is None:
+            return
+        handle = open(self.path, "a+", encoding="utf-8")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            handle.seek(0)
+            owner = handle.read().strip() or "another process"
+            handle.close()
+            raise WriterLocked(
+                f"{self.data_path.name} is already written by {owner}; "
+                f"start this node with REWORK_WRITER_URL=<writer url> to forward its writes there"
+            )
+        handle.seek(0)
+        handle.truncate()
+        handle.write(f"pid {os.getpid()}")
+        handle.flush()
+        self._file = handle
+
+    def release(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class WriterClient:
+    """HTTP client of the writer node, used by follower nodes.
+
+    Requests run in a thread (urllib); error statuses are returned like
+    any other response, an unreachable writer raises ConnectionError.
+    """
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+
+    def _open(self, method: str, path: str, body: Optional[bytes], headers: Dict[str, str]):
+        request = urllib.request.Request(self.url + path, data=body, method=method, headers=headers)
+        try:
+            return urllib.request.urlopen(request, timeout=FORWARD_TIMEOUT)
+        except urllib.error.HTTPError as e:
+            # 4xx/5xx from the writer: a response to pass on as is
+            return e
+        except (urllib.error.URLError, OSError) as e:
+            raise ConnectionError(f"Writer node {self.url} is unreachable: {e}")
+
+    @staticmethod
+    def _headers(response) -> Dict[str, str]:
+        # Lower-cased names, as Starlette reads them
+        return {name.lower(): value for name, value in response.headers.items()
+                if name.lower() not in HOP_BY_HOP_HEADERS}
+
+    def _fetch(self, method: str, path: str, body: Optional[bytes],
+               headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+        with self._open(method, path, body, headers) as response:
+            return response.status, self._headers(response), response.read()
+
+    async def fetch(self, method: str, path: str, body: Optional[bytes] = None,
+                    headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, str], bytes]:
+        """(status, headers, body) of the writer's response."""
+        return await asyncio.to_thread(self._fetch, method, path, body, headers or {})
+
+    async def stream(self, method: str, path: str, body: Optional[bytes] = None,
+                     headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, str], Iterator[bytes]]:
+        """Like fetch, with the body read lazily (large exports)."""
+        response = await asyncio.to_thread(self._open, method, path, body, headers or {})
+
+        def chunks():
+            try:
+                while True:
+                    chunk = response.read(STREAM_CHUNK)
+                    if not chunk:
+                        break
+                    yield chunk
+            finally:
+                response.close()
+        return response.status, self._headers(response), chunks()
@@ -0,0 +1,361 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ingest import InvalidRecord, Quarantine, ingest_records, normalize_changes, normalize_fields, normalize_record
+from records import ReworkTable
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # optional: changes are then picked up by polling
+    Observer = None
+    FileSystemEventHandler = object
+
+# The dataset written by the realtime backend and read by every service
+DATA_FILE = Path(os.environ.get("REWORK_DATA_FILE", Path(__file__).parent / "data" / "data.json"))
+# Polling period of Dataset.watch() when watchdog is not installed
+POLL_INTERVAL = float(os.environ.get("REWORK_DATA_POLL_INTERVAL", 1.0))
+
+Listener = Callable[["Dataset"], None]
+
+
+# ------------------ Files ------------------
+def revision_path(path: Path) -> Path:
+    return path.with_suffix(".rev")
+
+
+def journal_path(path: Path) -> Path:
+    return path.with_suffix(".journal.jsonl")
+
+
+def lock_path(path: Path) -> Path:
+    return path.with_suffix(".lock")
+
+
+class AmbiguousRecord(LookupError):
+    """A patch by ORDNR matching several reworks of that order."""
+
+    def __init__(self, ordnr: str, ids: List[int]):
+        super().__init__(f"ORDNR {ordnr} has {len(ids)} reworks {ids}: pass the REWORK_ID to patch one")
+        self.ordnr = ordnr
+        self.ids = ids
+
+
+class RowIndex:
+    """Positions of the rows by REWORK_ID, and of each order's rows by ORDNR.
+
+    An order has one row per rework, so writes are keyed on REWORK_ID.
+    Rows without one (files written before ids existed, replacements
+    posted without them) get the next free ids in table order, the same in
+    every process reading the same file. A duplicated id is replaced too.
+    """
+
+    def __init__(self, data: ReworkTable):
+        self.ids: Dict[int, int] = {}
+        self.orders: Dict[str, List[int]] = {}
+        values = list(data.column_values("REWORK_ID"))
+        self.next_id = max((value for value in values if isinstance(value, int)), default=0) + 1
+        for position, (rework_id, ordnr) in enumerate(zip(values, data.column_values("ORDNR"))):
+            if not isinstance(rework_id, int) or rework_id in self.ids:
+                rework_id = self.allocate()
+                data.update(position, {"REWORK_ID": rework_id})
+            self.ids[rework_id] = position
+            if ordnr is not None:
+                self.orders.setdefault(str(ordnr), []).append(position)
+
+    def allocate(self) -> int:
+        rework_id = self.next_id
+        self.next_id += 1
+        return rework_id
+
+    def add(self, position: int, record: Dict[str, Any]) -> None:
+        self.ids[record["REWORK_ID"]] = position
+        self.next_id = max(self.next_id, record["REWORK_ID"] + 1)
+        self.orders.setdefault(str(record["ORDNR"]), []).append(position)
+
+    def move(self, position: int, old_ordnr: Any, new_ordnr: Any) -> None:
+        if str(old_ordnr) != str(new_ordnr):
+            self.orders[str(old_ordnr)].remove(position)
+            if not self.orders[str(old_ordnr)]:
+                del self.orders[str(old_ordnr)]
+            self.orders.setdefault(str(new_ordnr), []).append(position)
+
+    def position(self, record: Dict[str, Any]) -> Optional[int]:
+        return self.ids.get(record.get("REWORK_ID"))
+
+
+def build_index(data: ReworkTable) -> RowIndex:
+    return RowIndex(data)
+
+
+def _target(index: RowIndex, record: Dict[str, Any], insert: bool) -> Optional[int]:
+    """Position of the row ``record`` changes; None for a new rework."""
+    if record.get("REWORK_ID") is not None:
+        position = index.position(record)
+        if position is None and not insert:
+            raise KeyError(record["REWORK_ID"])
+        return position
+    if insert:
+        # No id: a new rework, even of a known order
+        return None
+    positions = index.orders.get(str(record["ORDNR"]).strip())
+    if not positions:
+        raise KeyError(record["ORDNR"])
+    if len(positions) > 1:
+        raise AmbiguousRecord(str(record["ORDNR"]).strip(), sorted(
+            rework_id for rework_id, position in index.ids.items() if position in positions
+        ))
+    return positions[0]
+
+
+def apply_upsert(data: ReworkTable, index: RowIndex,
+                 records: List[Dict[str, Any]], insert: bool,
+                 quarantine: Optional[Quarantine] = None) -> Tuple[List[Dict], List[Dict]]:
+    """Merge each record into the row with its REWORK_ID, or append it.
+
+    Upserts (insert=True) without a REWORK_ID are new reworks: they are
+    appended with the next id, whatever their ORDNR. A patch
+    (insert=False) without one targets the single row of its ORDNR, and
+    raises AmbiguousRecord when the order has several; with one, an ORDNR
+    given must be that row's (KeyError otherwise).
+
+    Returns the changed rows and the normalized records, each carrying the
+    REWORK_ID it was applied to, so that replaying them (journal, history)
+    is idempotent. Everything is validated before the table is touched: a
+    bad patch raises, a bad upsert row is quarantined and skipped.
+    """
+    targets = []
+    rejected = []
+    next_id = index.next_id
+    for record in records:
+        try:
+            if not isinstance(record, dict) or \
+                    record.get("ORDNR") in (None, "") and record.get("REWORK_ID") is None:
+                raise InvalidRecord(record, ["ORDNR or REWORK_ID is required"])
+            key = normalize_fields({"REWORK_ID": record["REWORK_ID"]}) if record.get("REWORK_ID") is not None else {}
+            position = _target(index, {**record, **key}, insert)
+            if position is None:
+                normalized = normalize_record(record)
+                if normalized.get("REWORK_ID") is None:
+                    normalized["REWORK_ID"] = next_id
+                next_id = max(next_id, normalized["REWORK_ID"] + 1)
+            else:
+                if not insert and record.get("ORDNR") not in (None, "") and \
+                        str(data.get(position, "ORDNR")) != str(record["ORDNR"]).strip():
+                    raise KeyError(record["ORDNR"])
+                # Known reworks only receive the fields being changed
+                normalized = {**normalize_changes(record), "REWORK_ID": data.get(position, "REWORK_ID")}
+            targets.append((position, normalized))
+        except InvalidRecord as e:
+            if not insert:
+                raise
+            rejected.append(e)
+    if quarantine is not None:
+        quarantine.add(rejected, "upsert")
+
+    changed = []
+    for position, record in targets:
+        if position is None:
+            # Two new rows of one batch with the same id: the second updates the first
+            position = index.position(record)
+        if position is None:
+            position = data.append(record)
+            index.add(position, record)
+        else:
+            index.move(position, data.get(position, "ORDNR"), record.get("ORDNR", data.get(position, "ORDNR")))
+            data.update(position, record)
+        changed.append(data.row(position))
+    index.next_id = max(index.next_id, next_id)
+    return changed, [record for _, record in targets]
+
+
+def load(path: Path, quarantine: Optional[Quarantine] = None) -> Tuple[ReworkTable, int, int]:
+    """(table, revision, journal entries replayed) of a data file.
+
+    Rows get their REWORK_ID (see RowIndex), then the upsert journal is
+    replayed on top of data.json. Journal records carry the id of their
+    row: replaying an entry already folded into data.json merges the same
+    fields into the same rows again, so a file read halfway through a
+    checkpoint is still correct.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON data: {e}")
+    if not isinstance(records, list):
+        raise ValueError("Data must be a list of records")
+    data = ReworkTable.from_records(ingest_records(records, quarantine, "file"))
+    try:
+        revision = int(revision_path(path).read_text().strip())
+    except (OSError, ValueError):
+        revision = 0
+
+    # Replay upserts that were not checkpointed yet
+    entries = 0
+    index = build_index(data)
+    if journal_path(path).exists():
+        with open(journal_path(path), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn tail of an interrupted append
+                    break
+                apply_upsert(data, index, entry["records"], entry["insert"])
+                revision = max(revision, entry["revision"])
+                entries += 1
+    return data, revision, entries
+
+
+# ------------------ Provider ------------------
+class Dataset:
+    """Read-only, in-process view of the dataset for the services that do
+    not own it (the FTQ APIs).
+
+    The file is parsed once per change. Each access only compares the
+    stat of data.json and of its journal with the version held. watch()
+    also refreshes in the background and calls the subscribed listeners,
+    so they learn about new data without a request coming in.
+    """
+
+    def __init__(self, path: Path = DATA_FILE):
+        self.path = Path(path)
+        self.version: Optional[Tuple] = None
+        self.revision = 0
+        self._table = ReworkTable()
+        self._records: Optional[List[Dict[str, Any]]] = None
+        self._listeners: List[Listener] = []
+        self._lock = threading.Lock()
+        self._watcher = None
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    @property
+    def etag(self) -> str:
+        # Same files, same tag, in every process
+        return f'"{self.revision}-{zlib.crc32(repr(self.version).encode()):x}"'
+
+    @property
+    def modified_at(self) -> float:
+        return max(stat[2] for stat in self.version if stat) / 1e9 if self.version else 0.0
+
+    def _fingerprint(self) -> Optional[Tuple]:
+        stats = []
+        for path in (self.path, journal_path(self.path)):
+            try:
+                st = os.stat(path)
+                stats.append((st.st_ino, st.st_size, st.st_mtime_ns))
+            except FileNotFoundError:
+                stats.append(None)
+        return None if stats[0] is None else tuple(stats)
+
+    def refresh(self) -> bool:
+        """Re-read the file if it changed; True (listeners notified) if so."""
+        with self._lock:
+            fingerprint = self._fingerprint()
+            if fingerprint == self.version:
+                return False
+            if fingerprint is None:
+                table, revision = ReworkTable(), 0
+            else:
+                try:
+                    table, revision, _ = load(self.path)
+                except (OSError, ValueError) as e:
+                    # Keep serving the last good version
+                    logging.warning(f"Could not read {self.path}: {e}")
+                    return False
+            self._table, self.revision, self.version = table, revision, fingerprint
+            self._records = None
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(self)
+            except Exception as e:
+                logging.error(f"Dataset listener failed: {e}")
+        return True
+
+    @property
+    def table(self) -> ReworkTable:
+        self.refresh()
+        return self._table
+
+    def records(self) -> List[Dict[str, Any]]:
+        """Normalized records of the current version (shared: do not modify)."""
+        self.refresh()
+        with self._lock:
+            if self._records is None:
+                self._records = self._table.to_records()
+            return self._records
+
+    def subscribe(self, listener: Listener) -> None:
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Listener) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def watch(self) -> None:
+        """Refresh as soon as the files change (watchdog) or every
+        POLL_INTERVAL seconds (without it)."""
+        if self._watcher is not None:
+            return
+        self.refresh()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if Observer is not None:
+            self._watcher = Observer()
+            self._watcher.schedule(_Watcher(self), path=str(self.path.parent), recursive=False)
+            self._watcher.daemon = True
+            self._watcher.start()
+        else:
+            self._watcher = threading.Thread(target=self._poll, name="dataset-poll", daemon=True)
+            self._watcher.start()
+
+    def _poll(self) -> None:
+        while self._watcher is not None:
+            time.sleep(POLL_INTERVAL)
+            self.refresh()
+
+    def stop(self) -> None:
+        watcher, self._watcher = self._watcher, None
+        if Observer is not None and isinstance(watcher, Observer):
+            watcher.stop()
+            watcher.join()
+
+
+class _Watcher(FileSystemEventHandler):
+    def __init__(self, dataset: Dataset):
+        self.dataset = dataset
+        self.paths = {dataset.path, journal_path(dataset.path)}
+
+    def on_any_event(self, event):
+        paths = {Path(event.src_path), Path(getattr(event, "dest_path", "") or event.src_path)}
+        if paths & self.paths:
+            self.dataset.refresh()
+
+
+if __name__ == "__main__":
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else DATA_FILE
+    dataset = Dataset(path)
+    t0 = time.perf_counter()
+    dataset.records()
+    first = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        dataset.records()
+    cached = (time.perf_counter() - t0) / 1000
+    t0 = time.perf_counter()
+    with open(path, 'r', encoding='utf-8') as f:
+        json.load(f)
+    reparse = time.perf_counter() - t0
+    print({"rows": len(dataset.records()), "revision": dataset.revision,
+           "first_load_ms": round(first * 1000, 1), "cached_access_us": round(cached * 1e6, 1),
+           "json_load_per_request_ms": round(reparse * 1000, 1)})
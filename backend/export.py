@@ -0,0 +1,172 @@
+import csv
+import io
+import json
+import sys
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: the "parquet" format is simply not offered
+    pa = pq = None
+
+from records import FIELDS
+
+Batches = Iterable[List[Tuple]]
+
+# Store rows: FIELDS, then the JSON object of any other keys (or None)
+COLUMNS = (*FIELDS, "extra")
+
+
+def _record(row: Tuple) -> Dict[str, Any]:
+    # Same record as the data API: missing fields are left out
+    record = {name: value for name, value in zip(FIELDS, row) if value is not None}
+    if row[-1] is not None:
+        record.update(json.loads(row[-1]))
+    return record
+
+
+# ------------------ Encoders ------------------
+# Each takes row batches in COLUMNS order and yields bytes chunks; headers
+# and file magic go out before the first batch is read.
+def _csv(batches: Batches) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    yield buffer.getvalue().encode("utf-8")
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _jsonl(batches: Batches) -> Iterator[bytes]:
+    for rows in batches:
+        yield "".join(
+            json.dumps(_record(row), ensure_ascii=False, separators=(",", ":")) + "\n" for row in rows
+        ).encode("utf-8")
+
+
+class _Sink:
+    """Write-only file handing over what the Parquet writer produced so far."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _parquet(batches: Batches) -> Iterator[bytes]:
+    # One row group per batch; the footer comes last
+    types = {"REWORK_ID": pa.int64(), "Rework_time": pa.float64(), "Success": pa.int64()}
+    schema = pa.schema([(name, types.get(name, pa.string())) for name in COLUMNS])
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    yield sink.drain()
+    for rows in batches:
+        columns = list(zip(*rows))
+        writer.write_table(pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema
+        ))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+FORMATS: Dict[str, Callable[[Batches], Iterator[bytes]]] = {"csv": _csv, "jsonl": _jsonl}
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+if pq is not None:
+    FORMATS["parquet"] = _parquet
+
+
+def stream(batches: Batches, fmt: str = "csv") -> Iterator[bytes]:
+    return (chunk for chunk in FORMATS[fmt](batches) if chunk)
+
+
+# ------------------ Benchmark ------------------
+def _rows(n: int) -> Iterator[Tuple]:
+    import random
+    from ingest import ingest_records
+    from records import _synthetic_chunk
+    rng = random.Random(42)
+    for start in range(0, n, 10_000):
+        for position, record in enumerate(ingest_records(_synthetic_chunk(start, min(10_000, n - start), rng)),
+                                          start):
+            yield (position,) + tuple(record.get(name) for name in FIELDS) + (None,)
+
+
+def benchmark(n: int, formats: Sequence[str]) -> List[Dict[str, Any]]:
+    """Time to first byte, throughput and RSS growth of each format over an
+    ``n``-row store, against materializing the whole JSON response."""
+    import gc
+    import tempfile
+    from pathlib import Path
+    from records import _rss_bytes
+    from store import AnalyticsStore
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        store = AnalyticsStore(Path(directory) / "analytics.sqlite")
+        store._write(_rows(n), 1, True)
+        for fmt in list(formats) + ["materialized json"]:
+            gc.collect()
+            before = peak = _rss_bytes()
+            start = time.perf_counter()
+            _, batches = store.export()
+            first_byte = None
+            size = 0
+            if fmt == "materialized json":
+                records = [_record(row) for rows in batches for row in rows]
+                body = json.dumps(records, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                first_byte, size = time.perf_counter() - start, len(body)
+                peak = _rss_bytes()
+                del records, body
+            else:
+                for i, chunk in enumerate(stream(batches, fmt)):
+                    if first_byte is None:
+                        first_byte = time.perf_counter() - start
+                    size += len(chunk)
+                    if i % 10 == 0:
+                        peak = max(peak, _rss_bytes())
+            elapsed = time.perf_counter() - start
+            results.append({
+                "format": fmt,
+                "rows": n,
+                "mb": round(size / 2**20, 1),
+                "first_byte_ms": round(first_byte * 1000, 1),
+                "rows_per_s": round(n / elapsed),
+                "rss_growth_mb": round((peak - before) / 2**20, 1),
+            })
+        store.close()
+    return results
+
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    for result in benchmark(size, list(FORMATS)):
+        print(result)
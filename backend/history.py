@@ -0,0 +1,267 @@
+import bisect
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from records import ReworkTable
+
+# A full snapshot is written at least every this many revisions, which bounds
+# the number of deltas replayed to rebuild any retained revision
+SNAPSHOT_INTERVAL = int(os.environ.get("HISTORY_SNAPSHOT_INTERVAL", 100))
+# Older snapshots, and the deltas that depend on them, are dropped
+MAX_SNAPSHOTS = int(os.environ.get("HISTORY_MAX_SNAPSHOTS", 20))
+GZIP_LEVEL = 6
+
+# (revision, upsert journal entry or None, full records for a replacement)
+Change = Tuple[int, Optional[Dict[str, Any]], Optional[List[Dict[str, Any]]]]
+
+
+class HistoryError(LookupError):
+    pass
+
+
+class RevisionHistory:
+    """Past revisions of the dataset: periodic full snapshots plus one delta
+    per revision.
+
+    ``deltas.jsonl`` is the timeline, one line per revision: the upsert
+    journal entry with its commit time, or a marker for revisions stored as
+    a snapshot (full replacements, external edits, startup). Snapshots are
+    gzipped record lists in ``snapshots/<revision>.json.gz``.
+
+    History is best effort: it is written after the journal and not
+    fsynced, so revisions lost in a crash are simply not retained.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.snapshot_dir = directory / "snapshots"
+        self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        self.deltas_path = directory / "deltas.jsonl"
+        self._lock = threading.Lock()
+        self.snapshots: List[int] = sorted(
+            int(path.name.split(".")[0]) for path in self.snapshot_dir.glob("*.json.gz")
+        )
+        # Timeline index: revision, commit time, kind and byte offset of each line
+        self.revisions: List[int] = []
+        self.times: List[float] = []
+        self.kinds: List[str] = []
+        self.offsets: List[int] = []
+        self._load_index()
+
+    def _load_index(self) -> None:
+        if not self.deltas_path.exists():
+            return
+        offset = 0
+        with open(self.deltas_path, "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                self._index(entry, offset)
+                offset += len(line)
+        # Drop the torn tail of an interrupted append
+        if offset != self.deltas_path.stat().st_size:
+            with open(self.deltas_path, "r+b") as f:
+                f.truncate(offset)
+
+    def _index(self, entry: Dict[str, Any], offset: int) -> None:
+        self.revisions.append(entry["revision"])
+        self.times.append(entry["at"])
+        self.kinds.append(entry["op"])
+        self.offsets.append(offset)
+
+    @property
+    def last_revision(self) -> Optional[int]:
+        return self.revisions[-1] if self.revisions else None
+
+    # ------------------ Writing ------------------
+    def _snapshot_path(self, revision: int) -> Path:
+        return self.snapshot_dir / f"{revision:010d}.json.gz"
+
+    def _write_snapshot(self, records: List[Dict[str, Any]], revision: int) -> None:
+        body = json.dumps(records, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        tmp_path = self._snapshot_path(revision).with_suffix(".tmp")
+        tmp_path.write_bytes(gzip.compress(body, GZIP_LEVEL, mtime=0))
+        os.replace(tmp_path, self._snapshot_path(revision))
+        bisect.insort(self.snapshots, revision)
+
+    def _append(self, entries: List[Dict[str, Any]]) -> None:
+        with open(self.deltas_path, "ab") as f:
+            offset = f.tell()
+            for entry in entries:
+                line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+                f.write(line)
+                self._index(entry, offset)
+                offset += len(line)
+
+    def start(self, data: ReworkTable, revision: int, at: float) -> None:
+        """Make sure the current revision is retained.
+
+        A timeline ahead of ``revision`` belongs to another dataset (the
+        file was replaced while the server was down) and is discarded; one
+        behind it has a gap, bridged with a snapshot.
+        """
+        with self._lock:
+            last = self.last_revision
+            if last == revision and self.snapshots:
+                return
+            if last is not None and last > revision:
+                self._clear()
+            self._write_snapshot(data.to_records(), revision)
+            self._append([{"revision": revision, "at": at, "op": "snapshot"}])
+
+    def _clear(self) -> None:
+        for revision in self.snapshots:
+            self._snapshot_path(revision).unlink(missing_ok=True)
+        self.deltas_path.unlink(missing_ok=True)
+        self.snapshots = []
+        self.revisions, self.times, self.kinds, self.offsets = [], [], [], []
+
+    def record(self, changes: List[Change], data: ReworkTable, at: float) -> None:
+        """Append the revisions of one committed batch; ``data`` is the state
+        after the last one."""
+        with self._lock:
+            entries = []
+            for revision, entry, records in changes:
+                if records is not None:
+                    self._write_snapshot(records, revision)
+                    entries.append({"revision": revision, "at": at, "op": "replace"})
+                else:
+                    entries.append({**entry, "revision": revision, "at": at})
+            self._append(entries)
+            last = changes[-1][0]
+            if not self.snapshots or last - self.snapshots[-1] >= SNAPSHOT_INTERVAL:
+                self._write_snapshot(data.to_records(), last)
+            if len(self.snapshots) > MAX_SNAPSHOTS:
+                self._prune()
+
+    def _prune(self) -> None:
+        for revision in self.snapshots[:-MAX_SNAPSHOTS]:
+            self._snapshot_path(revision).unlink(missing_ok=True)
+        self.snapshots = self.snapshots[-MAX_SNAPSHOTS:]
+        # Rewrite the timeline from the oldest snapshot kept
+        first = bisect.bisect_left(self.revisions, self.snapshots[0])
+        tmp_path = self.deltas_path.with_suffix(".jsonl.tmp")
+        with open(self.deltas_path, "rb") as src, open(tmp_path, "wb") as dst:
+            src.seek(self.offsets[first])
+            while chunk := src.read(1 << 20):
+                dst.write(chunk)
+        os.replace(tmp_path, self.deltas_path)
+        shift = self.offsets[first]
+        self.revisions = self.revisions[first:]
+        self.times = self.times[first:]
+        self.kinds = self.kinds[first:]
+        self.offsets = [offset - shift for offset in self.offsets[first:]]
+
+    # ------------------ Reading ------------------
+    def time_of(self, revision: int) -> float:
+        with self._lock:
+            i = bisect.bisect_left(self.revisions, revision)
+            if i == len(self.revisions) or self.revisions[i] != revision:
+                raise HistoryError(f"Revision {revision} is not retained")
+            return self.times[i]
+
+    def revision_at(self, timestamp: float) -> int:
+        """Latest revision committed at or before ``timestamp``."""
+        with self._lock:
+            i = bisect.bisect_right(self.times, timestamp)
+            if i == 0:
+                raise HistoryError("No retained revision is that old")
+            return self.revisions[i - 1]
+
+    def plan(self, revision: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Records of the nearest snapshot at or before ``revision`` and the
+        upsert entries to replay on top of it, in order."""
+        with self._lock:
+            i = bisect.bisect_right(self.snapshots, revision)
+            if i == 0 or revision > self.revisions[-1]:
+                raise HistoryError(f"Revision {revision} is not retained")
+            base = self.snapshots[i - 1]
+            start = bisect.bisect_right(self.revisions, base)
+            end = bisect.bisect_right(self.revisions, revision)
+            # Revisions lost in a crash leave a gap that cannot be replayed
+            if self.revisions[start:end] != list(range(base + 1, revision + 1)) or \
+                    any(kind != "upsert" for kind in self.kinds[start:end]):
+                raise HistoryError(f"Revision {revision} cannot be rebuilt")
+            with gzip.open(self._snapshot_path(base), "rb") as f:
+                records = json.load(f)
+            deltas = []
+            if start < end:
+                with open(self.deltas_path, "rb") as f:
+                    f.seek(self.offsets[start])
+                    deltas = [json.loads(f.readline()) for _ in range(end - start)]
+        return records, deltas
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot_bytes = sum(self._snapshot_path(r).stat().st_size for r in self.snapshots)
+            return {
+                "oldest_revision": self.snapshots[0] if self.snapshots else None,
+                "latest_revision": self.last_revision,
+                "oldest_at": self.times[0] if self.times else None,
+                "snapshots": len(self.snapshots),
+                "snapshot_interval": SNAPSHOT_INTERVAL,
+                "snapshot_bytes": snapshot_bytes,
+                "delta_bytes": self.deltas_path.stat().st_size if self.deltas_path.exists() else 0,
+            }
+
+
+# ------------------ Benchmark ------------------
+def _replay(records: List[Dict[str, Any]], deltas: List[Dict[str, Any]]) -> ReworkTable:
+    from dataset import apply_upsert, build_index
+    table = ReworkTable.from_records(records)
+    index = build_index(table)
+    for delta in deltas:
+        apply_upsert(table, index, delta["records"], delta["insert"])
+    return table
+
+
+if __name__ == "__main__":
+    import random
+    import tempfile
+    from dataset import build_index
+    from ingest import ingest_records, normalize_changes
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "data/data.json"
+    revisions = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    with open(path, "r", encoding="utf-8") as f:
+        table = ReworkTable.from_records(ingest_records(json.load(f)))
+    data_bytes = os.path.getsize(path)
+    index = build_index(table)
+    rework_ids = list(index.ids)
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        history = RevisionHistory(Path(directory))
+        history.start(table, 0, time.time())
+        t0 = time.perf_counter()
+        for revision in range(1, revisions + 1):
+            # A typical write: a handful of rows changing status
+            records = [normalize_changes({"REWORK_ID": rng.choice(rework_ids),
+                                          "Status": rng.choice(["Completed", "Failed"])})
+                       for _ in range(5)]
+            for record in records:
+                table.update(index.ids[record["REWORK_ID"]], record)
+            history.record([(revision, {"op": "upsert", "records": records, "insert": True}, None)],
+                           table, time.time())
+        record_ms = (time.perf_counter() - t0) * 1000 / revisions
+        summary = history.summary()
+        print({"revisions": revisions, "rows": len(table), "record_ms_per_revision": round(record_ms, 3),
+               **summary, "overhead_vs_data_json": round(
+                   (summary["snapshot_bytes"] + summary["delta_bytes"]) / data_bytes, 2)})
+
+        # Worst case: the revision just before the next snapshot
+        for revision in (history.snapshots[-1], history.snapshots[-1] - 1, history.snapshots[-2] + 1):
+            t0 = time.perf_counter()
+            records, deltas = history.plan(revision)
+            _replay(records, deltas)
+            print({"revision": revision, "deltas_replayed": len(deltas),
+                   "rebuild_ms": round((time.perf_counter() - t0) * 1000, 1)})
+        assert _replay(*history.plan(revisions)).to_records() == table.to_records()
@@ -0,0 +1,108 @@
+import gzip
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip is offered
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Preferred first when the client accepts several
+ENCODERS: Dict[str, Callable[[bytes], bytes]] = {}
+if brotli is not None:
+    ENCODERS["br"] = lambda body: brotli.compress(body, quality=BROTLI_QUALITY)
+ENCODERS["gzip"] = lambda body: gzip.compress(body, GZIP_LEVEL, mtime=0)
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> str:
+    """Best content coding the client accepts ("identity" if none)."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    for encoding in ENCODERS:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return "identity"
+
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+
+def not_modified(etag: str, last_modified: float, if_none_match: Optional[str],
+                 if_modified_since: Optional[str]) -> bool:
+    """RFC 9110 precedence: If-None-Match wins over If-Modified-Since."""
+    if if_none_match:
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in candidates or etag in candidates
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= since
+    return False
+
+
+class RepresentationCache:
+    """Serialized and compressed bodies of one resource, per version.
+
+    ``render`` builds the uncompressed body; it runs at most once per
+    version, and each content coding is compressed at most once per
+    version, on first request. Older versions are dropped.
+    """
+
+    def __init__(self, render: Callable[[], bytes]):
+        self.render = render
+        self.version: Optional[Hashable] = None
+        self.bodies: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def get(self, version: Hashable, encoding: str = "identity") -> bytes:
+        with self._lock:
+            if version != self.version:
+                self.version = version
+                self.bodies = {}
+            body = self.bodies.get(encoding)
+            if body is None:
+                if "identity" not in self.bodies:
+                    self.bodies["identity"] = self.render()
+                if encoding != "identity":
+                    self.bodies[encoding] = ENCODERS[encoding](self.bodies["identity"])
+                body = self.bodies[encoding]
+            return body
+
+
+def conditional(headers: Any, etag: str, last_modified: float, cache: RepresentationCache,
+                version: Hashable) -> Tuple[int, Optional[bytes], Dict[str, str]]:
+    """(status, body, headers) for a GET with the request ``headers``.
+
+    304 with no body when the client already has this version; otherwise
+    200 with the cached body in the best accepted coding.
+    """
+    response_headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(last_modified),
+        "Vary": "Accept-Encoding",
+        # Revalidate on every poll: cheap thanks to the 304 path
+        "Cache-Control": "no-cache",
+    }
+    if not_modified(etag, last_modified, headers.get("If-None-Match"), headers.get("If-Modified-Since")):
+        return 304, None, response_headers
+    encoding = choose_encoding(headers.get("Accept-Encoding"))
+    body = cache.get(version, encoding)
+    if encoding != "identity":
+        response_headers["Content-Encoding"] = encoding
+    return 200, body, response_headers
@@ -0,0 +1,253 @@
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+# Canonical vocabularies (keys are lower-cased inputs)
+SHIFTS = {
+    "matin": "matin", "morning": "matin",
+    "soir": "soir", "evening": "soir", "apres-midi": "soir",
+    "nuit": "nuit", "night": "nuit",
+}
+PRIORITIES = {
+    "urgent": "urgent", "high": "urgent",
+    "medium": "medium",
+    "normal": "normal", "low": "normal",
+}
+STATUSES = {
+    "completed": "Completed", "repaired": "Completed",
+    "failed": "Failed",
+    "in progress": "In Progress",
+}
+AREAS = {"motor": "Motor", "interior": "Interior"}
+TRUE_VALUES = {"1", "true", "yes", "ok", "success"}
+FALSE_VALUES = {"", "0", "false", "no", "ko", "failed"}
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+STRING_FIELDS = (
+    "ORDNR", "SUBPROD", "RWRK_CODE", "DESCR", "RWRK_DETAIL",
+    "Defect_type", "Defect_description",
+)
+
+
+class InvalidRecord(ValueError):
+    def __init__(self, record: Any, errors: List[str]):
+        super().__init__("; ".join(errors))
+        self.record = record
+        self.errors = errors
+
+
+def shift_for_hour(hour: int) -> str:
+    if 6 <= hour < 14:
+        return "matin"
+    if 14 <= hour < 22:
+        return "soir"
+    return "nuit"
+
+
+def priority_for_time(rework_time: float) -> str:
+    if rework_time > 60:
+        return "urgent"
+    if rework_time > 40:
+        return "medium"
+    return "normal"
+
+
+def _parse_date(value: Any) -> str:
+    if isinstance(value, str):
+        text = value.strip().replace("T", " ").rstrip("Z")
+        for fmt in (DATE_FORMAT, "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+            try:
+                return datetime.strptime(text, fmt).strftime(DATE_FORMAT)
+            except ValueError:
+                pass
+        try:
+            # ISO strings with fractional seconds or an offset
+            return datetime.fromisoformat(text).strftime(DATE_FORMAT)
+        except ValueError:
+            pass
+    raise ValueError(f"REWORK_DATE {value!r} is not a date")
+
+
+def _parse_number(value: Any, name: str) -> float:
+    if isinstance(value, bool):
+        raise ValueError(f"{name} {value!r} is not a number")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} {value!r} is not a number")
+    if number < 0:
+        raise ValueError(f"{name} {value!r} is negative")
+    return int(number) if number.is_integer() else number
+
+
+def _parse_id(value: Any) -> int:
+    number = _parse_number(value, "REWORK_ID")
+    if not isinstance(number, int):
+        raise ValueError(f"REWORK_ID {value!r} is not an integer")
+    return number
+
+
+def _parse_flag(value: Any) -> int:
+    if value is None or isinstance(value, bool):
+        return int(bool(value))
+    if isinstance(value, (int, float)) and value in (0, 1):
+        return int(value)
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return 1
+    if text in FALSE_VALUES:
+        return 0
+    raise ValueError(f"Success {value!r} is not a flag")
+
+
+def _parse_vocab(value: Any, vocab: Dict[str, str], name: str) -> str:
+    canonical = vocab.get(str(value).strip().lower())
+    if canonical is None:
+        raise ValueError(f"{name} {value!r} is not one of {sorted(set(vocab.values()))}")
+    return canonical
+
+
+def _parse_line(value: Any) -> str:
+    text = str(value).strip()
+    digits = "".join(ch for ch in text if ch.isdigit())
+    if digits and text.lower().replace(" ", "").rstrip("0123456789") in ("", "l", "line", "ligne"):
+        return f"Line {int(digits)}"
+    raise ValueError(f"Line {value!r} is not a line")
+
+
+_FIELD_PARSERS = {
+    "REWORK_ID": _parse_id,
+    "REWORK_DATE": _parse_date,
+    "Rework_time": lambda v: _parse_number(v, "Rework_time"),
+    "Success": _parse_flag,
+    "shift": lambda v: _parse_vocab(v, SHIFTS, "shift"),
+    "Priority": lambda v: _parse_vocab(v, PRIORITIES, "Priority"),
+    "Status": lambda v: _parse_vocab(v, STATUSES, "Status"),
+    "Area": lambda v: _parse_vocab(v, AREAS, "Area"),
+    "Line": _parse_line,
+}
+
+
+def normalize_fields(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Coerce the given fields to their canonical type and vocabulary.
+
+    Partial updates go through normalize_changes; raises InvalidRecord
+    listing every bad field.
+    """
+    if not isinstance(fields, dict):
+        raise InvalidRecord(fields, ["Record is not a JSON object"])
+    normalized = {}
+    errors = []
+    for key, value in fields.items():
+        try:
+            if key in _FIELD_PARSERS:
+                value = _FIELD_PARSERS[key](value)
+            elif key in STRING_FIELDS and value is not None:
+                value = str(value).strip()
+        except ValueError as e:
+            errors.append(str(e))
+        normalized[key] = value
+    if errors:
+        raise InvalidRecord(fields, errors)
+    return normalized
+
+
+def normalize_changes(changes: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize a partial update of an existing record.
+
+    ``Success`` and ``Status`` describe the same outcome: changing one
+    re-derives the other, as normalize_record does, and a change setting
+    both to contradicting values is rejected.
+    """
+    normalized = normalize_fields(changes)
+    if "Status" in normalized and "Success" not in normalized:
+        normalized["Success"] = int(normalized["Status"] == "Completed")
+    elif "Success" in normalized and "Status" not in normalized:
+        normalized["Status"] = "Completed" if normalized["Success"] else "Failed"
+    elif "Success" in normalized and normalized["Status"] in ("Completed", "Failed") and \
+            normalized["Success"] != int(normalized["Status"] == "Completed"):
+        raise InvalidRecord(changes, [
+            f"Success {normalized['Success']} contradicts Status {normalized['Status']!r}"
+        ])
+    return normalized
+
+
+def normalize_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate a complete rework record and fill the derived fields.
+
+    ``Success`` and ``Status`` are derived from one another, ``shift`` from
+    the hour of REWORK_DATE and ``Priority`` from Rework_time, so that the
+    prediction side always gets the full, typed column set.
+    """
+    normalized = normalize_fields(record)
+    errors = [
+        f"{name} is required"
+        for name in ("ORDNR", "REWORK_DATE", "Rework_time")
+        if normalized.get(name) in (None, "")
+    ]
+    if "Success" not in normalized and "Status" not in normalized:
+        errors.append("Success or Status is required")
+    if errors:
+        raise InvalidRecord(record, errors)
+
+    if "Status" not in normalized:
+        normalized["Status"] = "Completed" if normalized["Success"] else "Failed"
+    if "Success" not in normalized:
+        normalized["Success"] = int(normalized["Status"] == "Completed")
+    if "shift" not in normalized:
+        normalized["shift"] = shift_for_hour(int(normalized["REWORK_DATE"][11:13]))
+    if "Priority" not in normalized:
+        normalized["Priority"] = priority_for_time(normalized["Rework_time"])
+    return normalized
+
+
+class Quarantine:
+    """Append-only JSON Lines file of rejected rows and why."""
+
+    def __init__(self, file_path: Optional[Path]):
+        self.file_path = file_path
+        self.count = 0
+
+    def add(self, rejected: List[InvalidRecord], source: str) -> None:
+        if not rejected:
+            return
+        self.count += len(rejected)
+        logging.warning(f"Quarantined {len(rejected)} invalid record(s) from {source}")
+        if self.file_path is None:
+            return
+        quarantined_at = datetime.now().strftime(DATE_FORMAT)
+        with open(self.file_path, 'a', encoding='utf-8') as f:
+            for error in rejected:
+                f.write(json.dumps({
+                    "quarantined_at": quarantined_at,
+                    "source": source,
+                    "errors": error.errors,
+                    "record": error.record,
+                }) + "\n")
+
+    def read(self, limit: int = 100) -> List[Dict[str, Any]]:
+        if self.file_path is None or not self.file_path.exists():
+            return []
+        with open(self.file_path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()[-limit:]
+        return [json.loads(line) for line in lines if line.strip()]
+
+
+def ingest_records(records: Iterable[Dict[str, Any]],
+                   quarantine: Optional[Quarantine] = None,
+                   source: str = "ingest") -> List[Dict[str, Any]]:
+    """Normalize records, dropping (and quarantining) the invalid ones."""
+    accepted = []
+    rejected = []
+    for record in records:
+        try:
+            accepted.append(normalize_record(record))
+        except InvalidRecord as e:
+            rejected.append(e)
+    if quarantine is not None:
+        quarantine.add(rejected, source)
+    elif rejected:
+        logging.warning(f"Dropped {len(rejected)} invalid record(s) from {source}")
+    return accepted
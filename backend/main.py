@@ -1,117 +1,803 @@
 import os
+import sys
 import json
 import asyncio
 import logging
+import threading
+import time
 import uuid
-from typing import Dict, Any, List
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Callable, Tuple, Iterable, Awaitable
 from pathlib import Path
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from pydantic import BaseModel
 import uvicorn
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from records import ReworkTable
+from anomaly import AlertLimiter, AnomalyDetector
+import wire
+import export
+from bus import Bus, InProcessBus, create_bus
+from cluster import FORWARDED_REQUEST_HEADERS, WriterClient, WriterLock
+from history import HistoryError, RevisionHistory
+from http_cache import RepresentationCache, conditional
+from store import AnalyticsStore, QueryError
+from sketch import QuantileIndex
+from dataset import (DATA_FILE, AmbiguousRecord, apply_upsert, build_index, journal_path, load as load_dataset,
+                     revision_path)
+from ingest import Quarantine, ingest_records, normalize_fields
+
 # Configuration
 BASE_DIR = Path(__file__).parent
-DATA_DIR = BASE_DIR / "data"
-DATA_FILE = DATA_DIR / "data.json"
+DATA_DIR = DATA_FILE.parent
+ANALYTICS_DB = Path(os.environ.get("ANALYTICS_DB", DATA_DIR / "analytics.sqlite"))
+HISTORY_DIR = Path(os.environ.get("HISTORY_DIR", DATA_DIR / "history"))
+# Rebuilt past revisions kept in memory for repeated ?at_revision= reads
+PAST_REVISIONS_CACHED = int(os.environ.get("PAST_REVISIONS_CACHED", 4))
 DATA_DIR.mkdir(exist_ok=True)
+# Upsert journal is folded into data.json after this many entries or this idle delay
+JOURNAL_CHECKPOINT_ENTRIES = int(os.environ.get("JOURNAL_CHECKPOINT_ENTRIES", 500))
+JOURNAL_CHECKPOINT_DELAY = float(os.environ.get("JOURNAL_CHECKPOINT_DELAY", 2.0))
+# Set on every node but the one writing DATA_DIR: the URL of that writer node
+WRITER_URL = os.environ.get("REWORK_WRITER_URL")
+# How long a follower waits for the relay of its own forwarded write before reading it from disk
+FOLLOW_TIMEOUT = float(os.environ.get("REWORK_FOLLOW_TIMEOUT", 1.0))
 
 logging.basicConfig(level=logging.INFO)
 
 # ------------------ JSON Data Manager ------------------
+class RevisionConflict(Exception):
+    def __init__(self, expected: int, current: int):
+        super().__init__(f"Stale revision {expected}, current revision is {current}")
+        self.expected = expected
+        self.current = current
+
 class JSONDataManager:
-    def __init__(self, file_path: Path):
+    """Owns the dataset file.
+
+    Reads are served from memory. Every change goes through a single writer
+    task: queued updates are applied in order, each one bumps the revision,
+    and the whole batch is persisted with one fsync (group commit).
+
+    Every record entering the manager (file load, replacement, upsert) is
+    normalized by ingest.py first; invalid rows go to quarantine.jsonl.
+
+    The dataset lives in a ReworkTable (dictionary-encoded columns); dicts
+    are only rebuilt when a response or broadcast is serialized.
+
+    Full replacements rewrite data.json. Record upserts keyed by REWORK_ID
+    (an order has one row per rework, see dataset.RowIndex) are appended
+    to a journal instead and folded into data.json by a periodic
+    checkpoint, so their cost follows the size of the change.
+
+    An optional AnalyticsStore (store.py) is kept at the same revision:
+    rebuilt on replacement, only the touched rows rewritten on upsert.
+
+    An optional RevisionHistory (history.py) records every committed
+    revision, so past states can be served by revision number or time.
+
+    An optional QuantileIndex (sketch.py) keeps Rework_time sketches per
+    Area/Line/shift/day at the same revision: appended rows are added,
+    anything else rebuilds them.
+
+    Only one manager writes a data file: it holds an exclusive lock on it
+    (cluster.py) and a second one fails to start. Other nodes run a
+    ``follower`` manager that never writes: subscribers of the writer
+    relay each committed batch to them, and follow() applies it in memory
+    (or reloads what is on disk when a revision was missed).
+    """
+
+    FULL = "full"
+    JOURNAL = "journal"
+
+    def __init__(self, file_path: Path, store: Optional[AnalyticsStore] = None,
+                 history: Optional[RevisionHistory] = None, quantiles: Optional[QuantileIndex] = None,
+                 follower: bool = False):
         self.file_path = file_path
-        self._ensure_file_exists()
+        self.store = store
+        self.history = history
+        self.quantiles = quantiles
+        self.follower = follower
+        self.lock = None if follower else WriterLock(file_path)
+        if self.lock is not None:
+            self.lock.acquire()
+        elif not file_path.exists():
+            raise FileNotFoundError(f"{file_path} does not exist yet: start the writer node first")
+        self.revision_path = revision_path(file_path)
+        self.journal_path = journal_path(file_path)
+        # Followers leave quarantine.jsonl to the writer, which loads the same rows
+        self.quarantine = Quarantine(None if follower else file_path.with_name("quarantine.jsonl"))
+        if not follower:
+            self._ensure_file_exists()
+        self._data, self.revision, self._journal_entries = self._load()
+        self._index = build_index(self._data)
+        if self.quarantine.count and not follower:
+            # Drop the rejected rows from data.json once, not on every start
+            self._checkpoint(self._data, self.revision)
+        self._file_stat = self._stat()
+        if self.store is not None and self.store.revision != self.revision:
+            self.store.rebuild(self._data, self.revision)
+        if self.quantiles is not None:
+            self.quantiles.rebuild(self._data, self.revision)
+        # Last-Modified of the current revision
+        self.modified_at = self._file_stat[2] / 1e9
+        if self.history is not None:
+            self.history.start(self._data, self.revision, self.modified_at)
+        # JSON body of the current revision, compressed once per coding
+        self.representations = RepresentationCache(self._render)
+        # Held by renders, and by the writer from a commit's first in-place
+        # change until it is installed or rolled back: a body of "rev-N"
+        # never holds rows that are not durable yet
+        self._state_lock = threading.Lock()
+        # Same for a few past revisions, rebuilt from history
+        self._past: "OrderedDict[int, RepresentationCache]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[List[Tuple[int, Optional[Dict]]]], Awaitable[None]]] = []
+        # Followers: held while catching up, notified at each new revision
+        self._followed: Optional[asyncio.Condition] = None
 
     def _ensure_file_exists(self):
         if not self.file_path.exists():
             with open(self.file_path, 'w', encoding='utf-8') as f:
                 json.dump([], f)
 
-    def read_data(self) -> Any:
+    def _load(self) -> Tuple[ReworkTable, int, int]:
+        return load_dataset(self.file_path, self.quarantine)
+
+    def _stat(self, path: Optional[Path] = None):
+        st = os.stat(path or self.file_path)
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def read_data(self) -> List[Dict[str, Any]]:
+        return self._data.to_records()
+
+    @property
+    def table(self) -> ReworkTable:
+        return self._data
+
+    def _render(self) -> bytes:
+        # Same bytes as FastAPI's JSONResponse
+        return json.dumps(self._data.to_records(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def http_response(self, request: Request) -> Response:
+        """The dataset for a GET: 304 if the client's copy is current,
+        else the cached (pre-compressed) body of this revision.
+
+        Blocks while a commit is pending: call it in a worker thread.
+        """
+        with self._state_lock:
+            revision = self.revision
+            status, body, headers = conditional(
+                request.headers, f'"rev-{revision}"', self.modified_at,
+                self.representations, revision
+            )
+        headers["X-Data-Revision"] = str(revision)
+        return Response(content=body, status_code=status, headers=headers,
+                        media_type="application/json" if body is not None else None)
+
+    def resolve_revision(self, at_revision: Optional[int] = None, as_of: Optional[str] = None) -> int:
+        """Revision for ``?at_revision=`` or ``?as_of=`` (epoch seconds or
+        ISO 8601; naive times are local). Raises HistoryError or ValueError."""
+        if at_revision is not None:
+            return at_revision
         try:
-            with open(self.file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Invalid JSON data: {e}")
-
-    def write_data(self, data: Any) -> None:
-        with open(self.file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2)
-
-    def update_data(self, update_fn: callable) -> Any:
-        current_data = self.read_data()
-        updated_data = update_fn(current_data)
-        self.write_data(updated_data)
-        return updated_data
+            timestamp = float(as_of)
+        except ValueError:
+            timestamp = datetime.fromisoformat(as_of.replace("Z", "+00:00")).timestamp()
+        if timestamp >= self.modified_at:
+            return self.revision
+        if self.history is None:
+            raise HistoryError("Revision history is disabled")
+        return self.history.revision_at(timestamp)
+
+    def state_at(self, revision: int) -> ReworkTable:
+        """The dataset as of ``revision``: nearest snapshot plus upserts replayed."""
+        records, deltas = self.history.plan(revision)
+        data = ReworkTable.from_records(records)
+        index = build_index(data)
+        for entry in deltas:
+            apply_upsert(data, index, entry["records"], entry["insert"])
+        return data
+
+    def revision_response(self, request: Request, revision: int) -> Response:
+        """Like http_response, for any retained revision (HistoryError otherwise)."""
+        if revision == self.revision:
+            return self.http_response(request)
+        if self.history is None:
+            raise HistoryError("Revision history is disabled")
+        last_modified = self.history.time_of(revision)
+        cache = self._past.get(revision)
+        if cache is None:
+            def render():
+                return json.dumps(self.state_at(revision).to_records(), ensure_ascii=False,
+                                  separators=(",", ":")).encode("utf-8")
+            cache = self._past[revision] = RepresentationCache(render)
+            while len(self._past) > PAST_REVISIONS_CACHED:
+                self._past.popitem(last=False)
+        else:
+            self._past.move_to_end(revision)
+        # A 304 never rebuilds anything: past revisions do not change
+        status, body, headers = conditional(request.headers, f'"rev-{revision}"', last_modified,
+                                            cache, revision)
+        headers["X-Data-Revision"] = str(revision)
+        return Response(content=body, status_code=status, headers=headers,
+                        media_type="application/json" if body is not None else None)
+
+    def write_data(self, data: Iterable[Dict[str, Any]]) -> None:
+        # Atomic replace: readers never see a half-written file
+        tmp_path = self.file_path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            # Same layout as json.dump(indent=2), one record at a time
+            f.write("[")
+            first = True
+            for record in data:
+                f.write("\n  " if first else ",\n  ")
+                f.write(json.dumps(record, indent=2).replace("\n", "\n  "))
+                first = False
+            f.write("]" if first else "\n]")
+            f.flush()
+            os.fsync(f.fileno())
+        # Recorded before the rename so the watcher never mistakes it for an external edit
+        self._file_stat = self._stat(tmp_path)
+        os.replace(tmp_path, self.file_path)
+
+    def _checkpoint(self, data: Any, revision: int) -> None:
+        self.write_data(data)
+        self.revision_path.write_text(str(revision))
+        # data.json now holds every journaled change
+        with open(self.journal_path, 'w', encoding='utf-8'):
+            pass
+        self._journal_entries = 0
+
+    def _append_journal(self, entries: List[Dict], data: Any, revision: int) -> None:
+        if entries:
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_entries += len(entries)
+        self.revision_path.write_text(str(revision))
+        if self._journal_entries >= JOURNAL_CHECKPOINT_ENTRIES:
+            self._checkpoint(data, revision)
+
+    def _sync_store(self, data: ReworkTable, revision: int, replaced: bool,
+                    positions: List[int], previous_revision: int) -> None:
+        try:
+            # A store that missed a revision cannot be patched incrementally
+            if replaced or self.store.revision != previous_revision:
+                self.store.rebuild(data, revision)
+            else:
+                self.store.sync(data, revision, positions)
+        except Exception as e:
+            logging.error(f"Error syncing analytics store: {e}")
+
+    def _sync_quantiles(self, data: ReworkTable, revision: int, replaced: bool,
+                        records: List[Dict[str, Any]], previous_revision: int) -> None:
+        try:
+            if replaced or self.quantiles.revision != previous_revision:
+                self.quantiles.rebuild(data, revision)
+            else:
+                self.quantiles.sync(data, revision, records, self._index)
+        except Exception as e:
+            logging.error(f"Error syncing quantile sketches: {e}")
+
+    def _record_history(self, changes: List, data: ReworkTable, at: float) -> None:
+        try:
+            self.history.record(changes, data, at)
+        except Exception as e:
+            logging.error(f"Error recording revision history: {e}")
+
+    def start(self):
+        if self._writer is None and not self.follower:
+            self._queue = asyncio.Queue()
+            self._writer = asyncio.create_task(self._writer_loop())
+
+    async def stop(self):
+        if self._writer is not None:
+            await self._queue.join()
+            self._writer.cancel()
+            self._writer = None
+        if self._journal_entries and not self.follower:
+            self._checkpoint(self._data, self.revision)
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+        if self.lock is not None:
+            self.lock.release()
+
+    def subscribe(self, listener: Callable[[List[Tuple[int, Optional[Dict]]]], Awaitable[None]]) -> None:
+        """Call ``listener`` with the (revision, journal entry) pairs of each
+        committed batch, before its writes are answered. The entry is None
+        for revisions that only the file holds (replacements, external
+        edits)."""
+        self._listeners.append(listener)
+
+    async def _submit(self, apply: Callable, expected_revision: Optional[int],
+                      mode: Optional[str]) -> Tuple[Any, int]:
+        if self.follower:
+            raise RuntimeError("Follower nodes forward their writes to the writer node")
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((apply, expected_revision, mode, future))
+        return await future
+
+    async def update_data(self, update_fn: Callable[[Any], Any],
+                          expected_revision: Optional[int] = None) -> Tuple[Any, int]:
+        """Queue a full replacement and wait until it is durable.
+
+        Returns the updated data and its revision. Raises RevisionConflict
+        when ``expected_revision`` is given and no longer current.
+        """
+        def apply(current):
+            updated = update_fn(current)
+            if isinstance(updated, ReworkTable):
+                table = updated
+            elif isinstance(updated, list):
+                updated = ingest_records(updated, self.quarantine, "replace")
+                table = ReworkTable.from_records(updated)
+            else:
+                raise ValueError("Data must be a list of records")
+            self._index = build_index(table)
+            return table, table.to_records() if updated is table else updated, None
+        return await self._submit(apply, expected_revision, self.FULL)
+
+    async def upsert_records(self, records: List[Dict[str, Any]],
+                             expected_revision: Optional[int] = None) -> Tuple[List[Dict], int]:
+        """Merge records into the rows with their REWORK_ID; records without
+        one are new reworks, appended. Returns only the changed rows."""
+        return await self._submit(self._journaled(records, True), expected_revision, self.JOURNAL)
+
+    async def patch_record(self, ordnr: str, changes: Dict[str, Any],
+                           expected_revision: Optional[int] = None,
+                           rework_id: Optional[int] = None) -> Tuple[List[Dict], int]:
+        """Merge ``changes`` into one rework of an existing ORDNR: ``rework_id``,
+        or the order's only row (AmbiguousRecord if it has several, KeyError
+        if unknown)."""
+        record = {**changes, "ORDNR": ordnr.strip()}
+        if rework_id is not None:
+            record["REWORK_ID"] = rework_id
+        return await self._submit(self._journaled([record], False), expected_revision, self.JOURNAL)
+
+    def _journaled(self, records: List[Dict[str, Any]], insert: bool) -> Callable:
+        def apply(current):
+            changed, normalized = apply_upsert(
+                current, self._index, records, insert, self.quarantine
+            )
+            return current, changed, {"op": "upsert", "records": normalized, "insert": insert}
+        return apply
+
+    async def reload(self) -> bool:
+        """Pick up an external edit of the file; False if it was our own write."""
+        if self._stat() == self._file_stat:
+            return False
+
+        def apply(_):
+            data, _, self._journal_entries = self._load()
+            self._index = build_index(data)
+            return data, data, None
+        await self._submit(apply, None, None)
+        return True
+
+    async def _writer_loop(self):
+        while True:
+            try:
+                # Fold the journal into data.json once writes go quiet
+                timeout = JOURNAL_CHECKPOINT_DELAY if self._journal_entries else None
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                try:
+                    await asyncio.to_thread(self._checkpoint, self._data, self.revision)
+                except Exception as e:
+                    logging.error(f"Error checkpointing data: {e}")
+                continue
+
+            batch = [item]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._commit(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    @asynccontextmanager
+    async def _changing(self):
+        """Hold the state lock while the table changes (see http_response)."""
+        # Polled rather than awaited in a thread: a cancelled writer cannot leave it held
+        while not self._state_lock.acquire(blocking=False):
+            await asyncio.sleep(0.001)
+        try:
+            yield
+        finally:
+            self._state_lock.release()
+
+    async def _commit(self, batch):
+        async with self._changing():
+            applied = await self._apply(batch)
+        if applied is None:
+            return
+        changes, data, accepted, committed = applied
+        if self.history is not None:
+            await asyncio.to_thread(self._record_history, changes, data, self.modified_at)
+        for listener in self._listeners:
+            try:
+                await listener(committed)
+            except Exception as e:
+                logging.error(f"Error relaying committed changes: {e}")
+        for future, result, result_revision in accepted:
+            if not future.done():
+                future.set_result((result, result_revision))
+
+    async def _apply(self, batch):
+        # Apply, persist and install a batch; None if nothing was committed
+        data, revision = self._data, self.revision
+        accepted = []
+        entries = []
+        changes = []
+        committed = []
+        full = False
+        for apply, expected_revision, mode, future in batch:
+            if future.done():
+                continue
+            if expected_revision is not None and expected_revision != revision:
+                future.set_exception(RevisionConflict(expected_revision, revision))
+                continue
+            try:
+                data, result, entry = apply(data)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            revision += 1
+            if mode == self.FULL:
+                full = True
+            elif mode == self.JOURNAL:
+                entries.append({"revision": revision, **entry})
+            committed.append((revision, entry if mode == self.JOURNAL else None))
+            if self.history is not None:
+                if mode == self.JOURNAL:
+                    changes.append((revision, entry, None))
+                else:
+                    # Later upserts of the batch modify the table in place
+                    changes.append((revision, None, result if isinstance(result, list) else result.to_records()))
+            accepted.append((future, result, revision))
+
+        if not accepted:
+            return None
+        try:
+            if full:
+                await asyncio.to_thread(self._checkpoint, data, revision)
+            else:
+                await asyncio.to_thread(self._append_journal, entries, data, revision)
+        except Exception as e:
+            logging.error(f"Error persisting data: {e}")
+            # Go back to what is durable on disk
+            self._data, self.revision, self._journal_entries = self._load()
+            self._index = build_index(self._data)
+            for future, _, _ in accepted:
+                if not future.done():
+                    future.set_exception(e)
+            return None
+
+        replaced = full or data is not self._data
+        await self._install(data, revision, replaced, [record for entry in entries for record in entry["records"]])
+        return changes, data, accepted, committed
+
+    async def _install(self, data: ReworkTable, revision: int, replaced: bool,
+                       records: List[Dict[str, Any]]) -> None:
+        # Make ``data`` current; ``records`` are the upserted ones when not ``replaced``
+        previous_revision = self.revision
+        self._data, self.revision = data, revision
+        self.modified_at = time.time()
+        if self.store is not None:
+            # Synced before answering, so a query right after a write sees it
+            positions = [self._index.position(record) for record in records]
+            await asyncio.to_thread(self._sync_store, data, revision, replaced, positions, previous_revision)
+        if self.quantiles is not None:
+            await asyncio.to_thread(self._sync_quantiles, data, revision, replaced, records, previous_revision)
+
+    # ------------------ Follower ------------------
+    def _condition(self) -> asyncio.Condition:
+        if self._followed is None:
+            self._followed = asyncio.Condition()
+        return self._followed
+
+    async def follow(self, revision: int, entry: Optional[Dict] = None) -> None:
+        """Move a follower to the writer's ``revision``.
+
+        ``entry`` (the journal entry committed at that revision) is applied
+        in memory when it is the next revision; anything else, including
+        a replacement, reloads the durable state from disk.
+        """
+        async with self._condition():
+            if revision <= self.revision:
+                return
+            if entry is not None and revision == self.revision + 1:
+                async with self._changing():
+                    apply_upsert(self._data, self._index, entry["records"], entry["insert"])
+                    await self._install(self._data, revision, False, entry["records"])
+            else:
+                await self._resync()
+            self._followed.notify_all()
+
+    async def resync(self) -> None:
+        """Reload a follower from disk (changes it may have missed)."""
+        async with self._condition():
+            await self._resync()
+            self._followed.notify_all()
+
+    async def _resync(self) -> None:
+        # The writer persists a revision before relaying or answering it
+        data, revision, self._journal_entries = await asyncio.to_thread(self._load)
+        self._index = build_index(data)
+        async with self._changing():
+            await self._install(data, revision, True, [])
+
+    async def catch_up(self, revision: int) -> None:
+        """Wait until a follower serves ``revision`` (a write it forwarded):
+        normally relayed within milliseconds, else read from disk."""
+        condition = self._condition()
+        try:
+            async with condition:
+                await asyncio.wait_for(condition.wait_for(lambda: self.revision >= revision), FOLLOW_TIMEOUT)
+        except asyncio.TimeoutError:
+            await self.follow(revision)
 
 # ------------------ Connection Manager ------------------
+# Fields a client can filter its updates on
+SUBSCRIPTION_FIELDS = ("Area", "Line", "shift", "Status")
+
+def normalize_filter(filters: Optional[Dict[str, Any]]) -> Tuple[Tuple[str, frozenset], ...]:
+    """Canonical, hashable form of a subscription filter (empty: everything).
+
+    Each field takes one value or a list of values, normalized like
+    incoming records ("motor" matches "Motor").
+    """
+    if not filters:
+        return ()
+    if not isinstance(filters, dict):
+        raise ValueError("Subscription filter must be a JSON object")
+    normalized = []
+    for field, wanted in filters.items():
+        if field not in SUBSCRIPTION_FIELDS:
+            raise ValueError(f"Cannot filter on {field!r}, only on {list(SUBSCRIPTION_FIELDS)}")
+        if not isinstance(wanted, (list, tuple)):
+            wanted = [wanted]
+        values = frozenset(normalize_fields({field: value})[field] for value in wanted)
+        if values:
+            normalized.append((field, values))
+    return tuple(sorted(normalized, key=lambda item: item[0]))
+
 class ConnectionManager:
-    def __init__(self):
+    """Open sockets and what each of them subscribed to.
+
+    Clients sharing a filter form one audience: a routed message is
+    filtered once per audience and encoded once per wire format used in
+    it (see wire.py), then sent as is to each client. Matching is memoized
+    per distinct (Area, Line, shift, Status) combination, so routing costs
+    one dict lookup per record.
+
+    broadcast() and publish() also hand the message to the bus (bus.py),
+    so that the clients of the other backend nodes get it too.
+    """
+
+    def __init__(self, bus: Optional[Bus] = None):
+        self.bus = bus or create_bus()
         self.active_connections: Dict[str, WebSocket] = {}
+        # Wire format negotiated by each client at connect time
+        self.client_formats: Dict[str, str] = {}
+        # Subscription index: filter -> clients; clients not listed get everything
+        self.subscriptions: Dict[Tuple, set] = {}
+        self.client_filters: Dict[str, Tuple] = {}
 
-    async def connect(self, websocket: WebSocket, client_id: str):
-        await websocket.accept()
+    async def connect(self, websocket: WebSocket, client_id: str) -> str:
+        fmt, subprotocol = wire.negotiate(websocket.query_params.get("format"),
+                                          websocket.scope.get("subprotocols", []))
+        await websocket.accept(subprotocol=subprotocol)
         self.active_connections[client_id] = websocket
-        logging.info(f"Client connected: {client_id}")
+        self.client_formats[client_id] = fmt
+        logging.info(f"Client connected: {client_id} ({fmt})")
+        return fmt
 
     def disconnect(self, client_id: str):
         if client_id in self.active_connections:
             del self.active_connections[client_id]
+            self.client_formats.pop(client_id, None)
+            self.unsubscribe(client_id)
             logging.info(f"Client disconnected: {client_id}")
 
+    def subscribe(self, client_id: str, filters: Optional[Dict[str, Any]]) -> Tuple:
+        normalized = normalize_filter(filters)
+        self.unsubscribe(client_id)
+        if normalized:
+            self.subscriptions.setdefault(normalized, set()).add(client_id)
+            self.client_filters[client_id] = normalized
+        return normalized
+
+    def unsubscribe(self, client_id: str):
+        normalized = self.client_filters.pop(client_id, None)
+        if normalized is not None:
+            clients = self.subscriptions[normalized]
+            clients.discard(client_id)
+            if not clients:
+                del self.subscriptions[normalized]
+
     async def send_json(self, message: Dict, client_id: str):
+        if client_id in self.active_connections:
+            await self.send_frame(wire.encode(message, self.client_formats[client_id]), client_id)
+
+    async def send_frame(self, frame: wire.Frame, client_id: str):
         try:
             if client_id in self.active_connections:
-                await self.active_connections[client_id].send_json(message)
+                websocket = self.active_connections[client_id]
+                if isinstance(frame, bytes):
+                    await websocket.send_bytes(frame)
+                else:
+                    await websocket.send_text(frame)
         except Exception as e:
             logging.warning(f"Error sending to {client_id}: {e}")
 
+    async def send_to(self, message: Dict, clients: Iterable[str]):
+        # One encoding per format, shared by every client using it
+        frames: Dict[str, wire.Frame] = {}
+        for client_id in list(clients):
+            fmt = self.client_formats.get(client_id)
+            if fmt is None:
+                continue
+            if fmt not in frames:
+                frames[fmt] = wire.encode(message, fmt)
+            await self.send_frame(frames[fmt], client_id)
+
     async def broadcast(self, message: Dict):
-        for client_id, connection in self.active_connections.items():
-            await self.send_json(message, client_id)
+        await self.send_to(message, self.active_connections)
+        await self.bus.publish({"message": message})
+
+    @staticmethod
+    def matches(normalized: Tuple, record: Dict[str, Any]) -> bool:
+        # A field the record does not carry (e.g. Status on an alert) does not exclude it
+        return all(record.get(field) is None or record.get(field) in values for field, values in normalized)
+
+    async def publish(self, message: Dict, field: str, keep_empty: bool = False):
+        """Send ``message`` to every client, with ``message[field]`` (a list of
+        records) cut down to what each client subscribed to.
+
+        Audiences whose subset is empty are skipped unless ``keep_empty`` (a
+        full replacement must still reach them, empty).
+        """
+        await self.route(message, field, keep_empty)
+        await self.bus.publish({"message": message, "field": field, "keep_empty": keep_empty})
+
+    async def receive(self, envelope: Dict):
+        # A message published by another node, for the clients of this one
+        if envelope.get("field") is None:
+            await self.send_to(envelope["message"], self.active_connections)
+        else:
+            await self.route(envelope["message"], envelope["field"], envelope.get("keep_empty", False))
+
+    async def route(self, message: Dict, field: str, keep_empty: bool = False):
+        if not self.subscriptions:
+            await self.send_to(message, self.active_connections)
+            return
+
+        audiences = list(self.subscriptions.items())
+        unfiltered = [client_id for client_id in self.active_connections
+                      if client_id not in self.client_filters]
+        records = message[field]
+        subsets: List[List[Dict[str, Any]]] = [[] for _ in audiences]
+        routes: Dict[Tuple, List[int]] = {}
+        for record in records:
+            combination = tuple(record.get(name) for name in SUBSCRIPTION_FIELDS)
+            route = routes.get(combination)
+            if route is None:
+                route = routes[combination] = [
+                    i for i, (normalized, _) in enumerate(audiences) if self.matches(normalized, record)
+                ]
+            for i in route:
+                subsets[i].append(record)
+
+        if unfiltered:
+            await self.send_to(message, unfiltered)
+        for (normalized, clients), subset in zip(audiences, subsets):
+            if subset or keep_empty:
+                await self.send_to({**message, field: subset}, clients)
+
+# ------------------ Anomaly Alerts ------------------
+class AnomalyStream:
+    """Runs changed records through the anomaly detector (which only
+    absorbs new reworks) and pushes the resulting ``alert`` messages, rate
+    limited, to every client."""
+
+    def __init__(self, manager: ConnectionManager, data_manager: JSONDataManager):
+        self.connection_manager = manager
+        self.detector = AnomalyDetector()
+        self.limiter = AlertLimiter()
+        self.reset(data_manager.table)
+
+    def reset(self, records: Iterable[Dict[str, Any]]) -> None:
+        # The dataset was replaced: baselines start over from its content
+        self.detector.reset(records)
+
+    async def observe(self, records: List[Dict[str, Any]], revision: int) -> None:
+        message = self.limiter.admit(self.detector.observe(records))
+        if message:
+            await self.connection_manager.publish({**message, "revision": revision}, "alerts")
 
 # ------------------ File Watcher ------------------
 class JSONFileWatcher(FileSystemEventHandler):
-    def __init__(self, manager: ConnectionManager, data_manager: JSONDataManager):
+    def __init__(self, manager: ConnectionManager, data_manager: JSONDataManager,
+                 anomalies: AnomalyStream, loop: asyncio.AbstractEventLoop):
         self.connection_manager = manager
         self.data_manager = data_manager
+        self.anomalies = anomalies
+        self.loop = loop
 
     def on_modified(self, event):
         if Path(event.src_path) == self.data_manager.file_path:
-            logging.info("JSON file modified, notifying clients...")
-            asyncio.create_task(self.notify_clients())
+            self.schedule_notify()
+
+    def on_moved(self, event):
+        if Path(event.dest_path) == self.data_manager.file_path:
+            self.schedule_notify()
+
+    def schedule_notify(self):
+        # Watchdog calls us from its own thread
+        asyncio.run_coroutine_threadsafe(self.notify_clients(), self.loop)
 
     async def notify_clients(self):
         try:
-            data = self.data_manager.read_data()
-            await self.connection_manager.broadcast({
+            if not await self.data_manager.reload():
+                return
+            logging.info("JSON file modified, notifying clients...")
+            self.anomalies.reset(self.data_manager.table)
+            await self.connection_manager.publish({
                 "type": "data_update",
-                "data": data,
+                "data": self.data_manager.read_data(),
+                "revision": self.data_manager.revision,
                 "message": "Data has been updated"
-            })
+            }, "data", keep_empty=True)
         except Exception as e:
             logging.error(f"Error notifying clients: {e}")
 
 # ------------------ WebSocket Handler ------------------
 class WebSocketHandler:
-    def __init__(self, manager: ConnectionManager, data_manager: JSONDataManager):
+    def __init__(self, manager: ConnectionManager, data_manager: JSONDataManager,
+                 anomalies: AnomalyStream, writer: Optional[WriterClient] = None):
         self.connection_manager = manager
         self.data_manager = data_manager
+        self.anomalies = anomalies
+        self.writer = writer
+
+    async def forward_write(self, path: str, payload: Dict[str, Any]) -> None:
+        # Follower: the writer node commits and publishes to every node's clients
+        status, headers, body = await self.writer.fetch(
+            "POST", path, json.dumps(payload).encode("utf-8"), {"Content-Type": "application/json"}
+        )
+        if status == 409:
+            raise RevisionConflict(payload.get("revision"), int(headers["x-data-revision"]))
+        if status >= 400:
+            raise ValueError(json.loads(body).get("detail", f"Writer node answered {status}"))
+        await self.data_manager.catch_up(int(headers["x-data-revision"]))
 
     async def handle_websocket(self, websocket: WebSocket, client_id: str):
-        await self.connection_manager.connect(websocket, client_id)
+        fmt = await self.connection_manager.connect(websocket, client_id)
 
         # Envoyer les données initiales
         initial_data = self.data_manager.read_data()
-        await websocket.send_json({
+        await self.connection_manager.send_json({
             "type": "initial_data",
-            "data": initial_data
-        })
+            "data": initial_data,
+            "revision": self.data_manager.revision,
+            "format": fmt
+        }, client_id)
 
         try:
             while True:
@@ -125,25 +811,92 @@ class WebSocketHandler:
             message_data = json.loads(message)
             message_type = message_data.get("type")
 
-            if message_type == "update_request":
-                updated_data = self.data_manager.update_data(
-                    lambda current: message_data.get("data", current)
+            if message_type == "update_request" and self.writer is not None:
+                await self.forward_write("/api/data", {
+                    "data": message_data.get("data", self.data_manager.read_data()),
+                    "revision": message_data.get("revision"),
+                })
+
+            elif message_type == "update_request":
+                updated_data, revision = await self.data_manager.update_data(
+                    lambda current: message_data.get("data", current),
+                    expected_revision=message_data.get("revision")
                 )
-                await self.connection_manager.broadcast({
+                self.anomalies.reset(self.data_manager.table)
+                await self.connection_manager.publish({
                     "type": "data_update",
                     "data": updated_data,
+                    "revision": revision,
                     "message": f"Data updated by client {client_id}"
+                }, "data", keep_empty=True)
+
+            elif message_type in ("subscribe", "unsubscribe"):
+                filters = message_data.get("filter") if message_type == "subscribe" else None
+                normalized = self.connection_manager.subscribe(client_id, filters)
+                # Resynchronize the client on its new topic
+                table = self.data_manager.table
+                positions = table.select(**{field: values for field, values in normalized})
+                await self.connection_manager.send_json({
+                    "type": "subscribed",
+                    "filter": {field: sorted(values) for field, values in normalized},
+                    "data": table.rows(positions),
+                    "revision": self.data_manager.revision
+                }, client_id)
+
+            elif message_type == "patch" and self.writer is not None:
+                await self.forward_write("/api/data/batch", {
+                    "records": message_data.get("records", []),
+                    "revision": message_data.get("revision"),
                 })
 
+            elif message_type == "patch":
+                changed, revision = await self.data_manager.upsert_records(
+                    message_data.get("records", []),
+                    expected_revision=message_data.get("revision")
+                )
+                await self.connection_manager.publish({
+                    "type": "data_patch",
+                    "records": changed,
+                    "revision": revision,
+                    "message": f"Data patched by client {client_id}"
+                }, "records")
+                await self.anomalies.observe(changed, revision)
+
+        except RevisionConflict as e:
+            await self.connection_manager.send_json({
+                "type": "conflict",
+                "message": str(e),
+                "revision": e.current
+            }, client_id)
         except json.JSONDecodeError:
             await self.connection_manager.send_json({
                 "type": "error",
                 "message": "Invalid JSON message"
             }, client_id)
+        except (ValueError, ConnectionError) as e:
+            await self.connection_manager.send_json({
+                "type": "error",
+                "message": str(e)
+            }, client_id)
 
 # ------------------ Pydantic Schema ------------------
 class DataPayload(BaseModel):
     data: List[Dict[str, Any]]
+    revision: Optional[int] = None
+
+class BatchPayload(BaseModel):
+    records: List[Dict[str, Any]]
+    revision: Optional[int] = None
+
+class PatchPayload(BaseModel):
+    changes: Dict[str, Any]
+    revision: Optional[int] = None
+    # Required when the order has several reworks
+    rework_id: Optional[int] = None
+
+class QueryPayload(BaseModel):
+    query: str
+    params: Dict[str, Any] = {}
 
 # ------------------ FastAPI App Setup ------------------
 app = FastAPI(title="Real-time Cable Tracker")
@@ -157,33 +910,217 @@ app.add_middleware(
 )
 
 # Initialisation des services
-data_manager = JSONDataManager(DATA_FILE)
+if WRITER_URL:
+    # Follower : données en mémoire à la révision du writer, aucun fichier écrit.
+    # Historique, quarantaine, alertes, requêtes et export sont servis par le writer.
+    data_manager = JSONDataManager(DATA_FILE, quantiles=QuantileIndex(), follower=True)
+    writer = WriterClient(WRITER_URL)
+else:
+    data_manager = JSONDataManager(DATA_FILE, AnalyticsStore(ANALYTICS_DB), RevisionHistory(HISTORY_DIR),
+                                   QuantileIndex())
+    writer = None
 connection_manager = ConnectionManager()
-websocket_handler = WebSocketHandler(connection_manager, data_manager)
+if writer is not None and isinstance(connection_manager.bus, InProcessBus):
+    raise RuntimeError("REWORK_WRITER_URL needs a BUS_URL shared with the writer node")
+anomaly_stream = AnomalyStream(connection_manager, data_manager)
+websocket_handler = WebSocketHandler(connection_manager, data_manager, anomaly_stream, writer)
+
+async def relay_changes(changes: List[Tuple[int, Optional[Dict]]]):
+    # Writer: followers apply each batch before its writes are answered
+    await connection_manager.bus.publish({"changes": [
+        {"revision": revision, "entry": entry} for revision, entry in changes
+    ]})
+
+async def receive_from_bus(envelope: Dict):
+    if "changes" in envelope:
+        if data_manager.follower:
+            for change in envelope["changes"]:
+                await data_manager.follow(change["revision"], change["entry"])
+        return
+    await connection_manager.receive(envelope)
+
+if writer is None:
+    data_manager.subscribe(relay_changes)
+
+# Routes served by the writer node alone: writes, and reads of its files or state
+WRITER_READS = ("/api/history", "/api/quarantine", "/api/anomalies", "/api/export")
 
-# Dossier data accessible
-app.mount("/data", StaticFiles(directory=DATA_DIR), name="data")
+def served_by_writer(request: Request) -> bool:
+    path = request.url.path
+    if request.method in ("POST", "PUT", "PATCH", "DELETE"):
+        return path.startswith("/api/")
+    if path == "/api/data":
+        # Past revisions are rebuilt from the writer's history
+        return "at_revision" in request.query_params or "as_of" in request.query_params
+    return path in WRITER_READS
+
+@app.middleware("http")
+async def forward_to_writer(request: Request, call_next):
+    if writer is None or not served_by_writer(request):
+        return await call_next(request)
+    path = request.url.path + (f"?{request.url.query}" if request.url.query else "")
+    headers = {name: request.headers[name] for name in FORWARDED_REQUEST_HEADERS if name in request.headers}
+    try:
+        if request.url.path == "/api/export":
+            status, response_headers, chunks = await writer.stream(request.method, path, None, headers)
+            return StreamingResponse(chunks, status_code=status, headers=response_headers)
+        status, response_headers, body = await writer.fetch(
+            request.method, path, await request.body() or None, headers
+        )
+    except ConnectionError as e:
+        return JSONResponse({"detail": str(e)}, status_code=503)
+    if request.method != "GET" and status < 300 and "x-data-revision" in response_headers:
+        # Read your writes: this node serves the new revision before answering
+        await data_manager.catch_up(int(response_headers["x-data-revision"]))
+    return Response(content=body, status_code=status, headers=response_headers)
+
+# data.json est servi depuis la mémoire (révision courante, ETag, gzip/brotli).
+# Seul ce fichier est public : DATA_DIR contient aussi l'état d'exécution
+# (journal, révision, quarantaine, base SQLite, historique).
+@app.get("/data/data.json")
+async def get_data_file(request: Request):
+    return await asyncio.to_thread(data_manager.http_response, request)
 
 # Routes API REST
 @app.get("/api/data")
-async def get_data():
+async def get_data(request: Request, at_revision: Optional[int] = None, as_of: Optional[str] = None):
+    if at_revision is None and as_of is None:
+        return await asyncio.to_thread(data_manager.http_response, request)
     try:
-        return data_manager.read_data()
+        revision = data_manager.resolve_revision(at_revision, as_of)
+        # Rebuilding a past revision replays up to one snapshot interval of deltas
+        return await asyncio.to_thread(data_manager.revision_response, request, revision)
+    except HistoryError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+        raise HTTPException(status_code=400, detail=f"Invalid as_of: {e}")
+
+@app.get("/api/history")
+async def get_history():
+    summary = await asyncio.to_thread(data_manager.history.summary)
+    return {"current_revision": data_manager.revision, **summary}
 
 @app.post("/api/data")
-async def update_data(payload: DataPayload):
+async def update_data(payload: DataPayload, response: Response):
     try:
-        updated_data = data_manager.update_data(lambda _: payload.data)
-        await connection_manager.broadcast({
+        updated_data, revision = await data_manager.update_data(
+            lambda _: payload.data, expected_revision=payload.revision
+        )
+        anomaly_stream.reset(data_manager.table)
+        await connection_manager.publish({
             "type": "data_update",
             "data": updated_data,
+            "revision": revision,
             "message": "Data updated via REST API"
-        })
+        }, "data", keep_empty=True)
+        response.headers["X-Data-Revision"] = str(revision)
         return updated_data
+    except RevisionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"X-Data-Revision": str(e.current)})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def broadcast_patch(changed: List[Dict[str, Any]], revision: int, response: Response):
+    await connection_manager.publish({
+        "type": "data_patch",
+        "records": changed,
+        "revision": revision,
+        "message": "Data patched via REST API"
+    }, "records")
+    await anomaly_stream.observe(changed, revision)
+    response.headers["X-Data-Revision"] = str(revision)
+
+@app.post("/api/data/batch")
+async def upsert_records(payload: BatchPayload, response: Response):
+    try:
+        changed, revision = await data_manager.upsert_records(
+            payload.records, expected_revision=payload.revision
+        )
+    except RevisionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"X-Data-Revision": str(e.current)})
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    await broadcast_patch(changed, revision, response)
+    return changed
+
+@app.patch("/api/data/{ordnr}")
+async def patch_record(ordnr: str, payload: PatchPayload, response: Response):
+    try:
+        changed, revision = await data_manager.patch_record(
+            ordnr, payload.changes, expected_revision=payload.revision, rework_id=payload.rework_id
+        )
+    except AmbiguousRecord as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except KeyError:
+        detail = f"Unknown ORDNR {ordnr}" if payload.rework_id is None else \
+            f"No rework {payload.rework_id} in ORDNR {ordnr}"
+        raise HTTPException(status_code=404, detail=detail)
+    except RevisionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"X-Data-Revision": str(e.current)})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await broadcast_patch(changed, revision, response)
+    return changed
+
+@app.get("/api/quarantine")
+async def get_quarantine(limit: int = 100):
+    return {
+        "total_since_start": data_manager.quarantine.count,
+        "records": await asyncio.to_thread(data_manager.quarantine.read, limit)
+    }
+
+@app.post("/api/query")
+async def run_query(payload: QueryPayload, response: Response):
+    try:
+        result = await asyncio.to_thread(data_manager.store.query, payload.query, payload.params)
+    except QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers["X-Data-Revision"] = str(result["revision"])
+    return result
+
+@app.get("/api/export")
+async def export_data(request: Request, format: str = "csv"):
+    """Whole dataset as a download, with the /api/query filters
+    (?area=Motor&area=Interior&date_from=...); rows are streamed from the
+    analytics store in batches. Keys outside FIELDS are merged back into
+    jsonl records, and form one JSON ``extra`` column in csv/parquet."""
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {sorted(export.FORMATS)}")
+    params = {}
+    for key in request.query_params:
+        if key != "format":
+            values = request.query_params.getlist(key)
+            params[key] = values if len(values) > 1 else values[0]
+    try:
+        revision, batches = await asyncio.to_thread(data_manager.store.export, params)
+    except QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # A sync iterator: Starlette pulls it from its thread pool
+    return StreamingResponse(export.stream(batches, format), media_type=export.MEDIA_TYPES[format], headers={
+        "Content-Disposition": f'attachment; filename="reworks-rev{revision}.{format}"',
+        "X-Data-Revision": str(revision),
+    })
+
+@app.get("/api/stats/rework_time")
+async def get_rework_time_stats(request: Request):
+    """Rework_time quantiles (?q=0.5&q=0.9&q=0.99) per group
+    (?group_by=Line&group_by=day), from mergeable sketches kept up to date
+    on every write; ?sketches=1 adds the serialized sketch of each group."""
+    params = {}
+    for key in request.query_params:
+        values = request.query_params.getlist(key)
+        params[key] = values if len(values) > 1 or key in ("group_by", "q") else values[0]
+    try:
+        return await asyncio.to_thread(data_manager.quantiles.query, params)
+    except QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/anomalies")
+async def get_anomalies(limit: int = 100):
+    return {
+        "recent_alerts": list(anomaly_stream.limiter.recent)[-limit:],
+        "baselines": anomaly_stream.detector.summary()
+    }
 
 # WebSocket avec UUID généré
 @app.websocket("/ws")
@@ -194,17 +1131,30 @@ async def websocket_endpoint(websocket: WebSocket):
 # Watchdog lancé au démarrage
 @app.on_event("startup")
 async def on_startup():
+    data_manager.start()
+    await connection_manager.bus.start(receive_from_bus)
+    if data_manager.follower:
+        # Revisions committed before the bus was up are only on disk; the
+        # writer watches the file for external edits and relays them
+        await data_manager.resync()
+        app.state.observer = None
+        return
     observer = Observer()
-    observer.schedule(JSONFileWatcher(connection_manager, data_manager), path=DATA_DIR, recursive=False)
+    watcher = JSONFileWatcher(connection_manager, data_manager, anomaly_stream, asyncio.get_running_loop())
+    observer.schedule(watcher, path=DATA_DIR, recursive=False)
     observer.start()
     app.state.observer = observer
     logging.info("File observer started.")
 
 @app.on_event("shutdown")
 async def on_shutdown():
-    app.state.observer.stop()
-    app.state.observer.join()
-    logging.info("File observer stopped.")
+    if app.state.observer is not None:
+        app.state.observer.stop()
+        app.state.observer.join()
+        logging.info("File observer stopped.")
+    await data_manager.stop()
+    await connection_manager.bus.stop()
+    data_manager.close()
 
 # ------------------ Démarrage serveur ------------------
 if __name__ == "__main__":
@@ -0,0 +1,325 @@
+import sys
+import json
+import time
+import random
+import multiprocessing
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Columns of a rework record, in the order they appear in data.json;
+# REWORK_ID identifies a row (an order has one row per rework)
+FIELDS = (
+    "REWORK_ID", "REWORK_DATE", "ORDNR", "SUBPROD", "RWRK_CODE", "DESCR", "RWRK_DETAIL",
+    "Line", "Area", "Rework_time", "Success", "Priority", "Defect_type",
+    "Defect_description", "Status", "shift",
+)
+
+# Code 0 of every column: the key is not present in the record
+_ABSENT = object()
+
+
+# ------------------ Dictionary-encoded column ------------------
+class Column:
+    """One field stored as 4-byte codes into a table of distinct values."""
+
+    __slots__ = ("codes", "values", "lookup")
+
+    def __init__(self):
+        self.codes = array("I")
+        self.values: List[Any] = [_ABSENT]
+        # Keyed by (type, value) so that 1, 1.0 and True stay distinct
+        self.lookup: Dict[Tuple[type, Any], int] = {}
+
+    def encode(self, value: Any) -> int:
+        """Code of ``value``, adding it to the dictionary if needed.
+
+        Raises TypeError for unhashable values (lists, dicts).
+        """
+        key = (value.__class__, value)
+        code = self.lookup.get(key)
+        if code is None:
+            code = len(self.values)
+            self.lookup[key] = code
+            self.values.append(value)
+        return code
+
+    def code_of(self, value: Any) -> Optional[int]:
+        try:
+            return self.lookup.get((value.__class__, value))
+        except TypeError:
+            return None
+
+
+# ------------------ Rework table ------------------
+class ReworkTable:
+    """Struct-of-arrays store for rework records.
+
+    Every known field is a dictionary-encoded Column, so a row costs a few
+    bytes per field and repeated strings ("Motor", "Line 1", "Completed",
+    "matin") exist once. Keys outside FIELDS, and unhashable values, are
+    kept per row in ``extras``. Dicts are only rebuilt at the
+    serialization edge (``row`` / ``to_records``).
+    """
+
+    __slots__ = ("columns", "extras")
+
+    def __init__(self, fields: Sequence[str] = FIELDS):
+        self.columns: Dict[str, Column] = {name: Column() for name in fields}
+        self.extras: List[Optional[Dict[str, Any]]] = []
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> "ReworkTable":
+        table = cls()
+        for record in records:
+            table.append(record)
+        return table
+
+    def __len__(self) -> int:
+        return len(self.extras)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for position in range(len(self)):
+            yield self.row(position)
+
+    def append(self, record: Dict[str, Any]) -> int:
+        if not isinstance(record, dict):
+            raise ValueError("Records must be JSON objects")
+        extra = None
+        for name, column in self.columns.items():
+            value = record.get(name, _ABSENT)
+            code = 0
+            if value is not _ABSENT:
+                try:
+                    code = column.encode(value)
+                except TypeError:
+                    extra = extra or {}
+                    extra[name] = value
+            column.codes.append(code)
+        for key, value in record.items():
+            if key not in self.columns:
+                extra = extra or {}
+                extra[key] = value
+        self.extras.append(extra)
+        return len(self.extras) - 1
+
+    def update(self, position: int, changes: Dict[str, Any]) -> None:
+        extra = self.extras[position]
+        for key, value in changes.items():
+            column = self.columns.get(key)
+            if column is not None:
+                try:
+                    column.codes[position] = column.encode(value)
+                    if extra and key in extra:
+                        del extra[key]
+                    continue
+                except TypeError:
+                    column.codes[position] = 0
+            extra = extra if extra is not None else {}
+            extra[key] = value
+        self.extras[position] = extra or None
+
+    def get(self, position: int, name: str, default: Any = None) -> Any:
+        column = self.columns.get(name)
+        if column is not None:
+            value = column.values[column.codes[position]]
+            if value is not _ABSENT:
+                return value
+        extra = self.extras[position]
+        if extra and name in extra:
+            return extra[name]
+        return default
+
+    def row(self, position: int) -> Dict[str, Any]:
+        record = {}
+        for name, column in self.columns.items():
+            value = column.values[column.codes[position]]
+            if value is not _ABSENT:
+                record[name] = value
+        extra = self.extras[position]
+        if extra:
+            record.update(extra)
+        return record
+
+    def rows(self, positions: Iterable[int]) -> List[Dict[str, Any]]:
+        return [self.row(position) for position in positions]
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        return self.rows(range(len(self)))
+
+    def column_values(self, name: str) -> Iterator[Any]:
+        """Decoded values of one column (None where absent)."""
+        column = self.columns[name]
+        values = [None if value is _ABSENT else value for value in column.values]
+        return (values[code] for code in column.codes)
+
+    # ------------------ Filtering / aggregation on codes ------------------
+    def select(self, positions: Optional[Iterable[int]] = None, **filters: Any) -> List[int]:
+        """Row positions matching every filter.
+
+        A filter value is either one value or a list/tuple/set of accepted
+        values. Comparisons run on integer codes, never on decoded rows.
+        """
+        checks = []
+        for name, wanted in filters.items():
+            column = self.columns[name]
+            if not isinstance(wanted, (list, tuple, set, frozenset)):
+                wanted = (wanted,)
+            codes = {code for code in map(column.code_of, wanted) if code is not None}
+            if not codes:
+                return []
+            checks.append((column.codes, codes))
+
+        if positions is None:
+            if not checks:
+                return list(range(len(self)))
+            column_codes, codes = checks.pop(0)
+            if len(codes) == 1:
+                (code,) = codes
+                selected = [i for i, c in enumerate(column_codes) if c == code]
+            else:
+                selected = [i for i, c in enumerate(column_codes) if c in codes]
+        else:
+            selected = list(positions)
+        for column_codes, codes in checks:
+            selected = [i for i in selected if column_codes[i] in codes]
+        return selected
+
+    def _group_codes(self, keys: Sequence[str], positions: Optional[Sequence[int]],
+                     extra: Sequence[str] = ()) -> Iterator[Tuple[int, ...]]:
+        arrays = [self.columns[name].codes for name in (*keys, *extra)]
+        if positions is not None:
+            arrays = [[codes[i] for i in positions] for codes in arrays]
+        return zip(*arrays)
+
+    def _decode_key(self, keys: Sequence[str], codes: Tuple[int, ...]) -> Tuple[Any, ...]:
+        decoded = []
+        for name, code in zip(keys, codes):
+            value = self.columns[name].values[code]
+            decoded.append(None if value is _ABSENT else value)
+        return tuple(decoded)
+
+    def group_count(self, keys: Sequence[str],
+                    positions: Optional[Sequence[int]] = None) -> Dict[Tuple[Any, ...], int]:
+        counts = Counter(self._group_codes(keys, positions))
+        return {self._decode_key(keys, codes): n for codes, n in counts.items()}
+
+    def group_mean(self, field: str, keys: Sequence[str],
+                   positions: Optional[Sequence[int]] = None) -> Dict[Tuple[Any, ...], float]:
+        """Mean of a numeric field per group; non-numeric values are skipped.
+
+        Counting (group codes, value code) pairs first means each distinct
+        value is decoded once per group instead of once per row.
+        """
+        values = self.columns[field].values
+        sums: Dict[Tuple[int, ...], float] = {}
+        counts: Dict[Tuple[int, ...], int] = {}
+        pairs = Counter(self._group_codes(keys, positions, (field,)))
+        for codes, n in pairs.items():
+            value = values[codes[-1]]
+            if value is _ABSENT or not isinstance(value, (int, float)):
+                continue
+            group = codes[:-1]
+            sums[group] = sums.get(group, 0.0) + value * n
+            counts[group] = counts.get(group, 0) + n
+        return {self._decode_key(keys, group): sums[group] / counts[group] for group in sums}
+
+
+# ------------------ Benchmark ------------------
+def _synthetic_chunk(start: int, size: int, rng: random.Random) -> List[Dict[str, Any]]:
+    records = []
+    for i in range(start, start + size):
+        line = rng.choice(("Line 1", "Line 2", "Line 3"))
+        defect = rng.choice(("Terminal", "Connecteur", "Securite", "File", "Autre"))
+        failed = rng.random() < 0.05
+        records.append({
+            "REWORK_DATE": f"2025-05-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00",
+            "ORDNR": str(2409300000 + i // 4),
+            "SUBPROD": rng.choice("ABCDEFG"),
+            "RWRK_CODE": str(rng.randint(1, 5)),
+            "DESCR": "Missing wire",
+            "RWRK_DETAIL": f"{defect} autre {line}",
+            "Line": line,
+            "Area": rng.choice(("Motor", "Interior")),
+            "Rework_time": rng.randint(15, 90),
+            "Success": "" if failed else 1,
+            "Priority": rng.choice(("urgent", "medium", "normal")),
+            "Defect_type": defect,
+            "Defect_description": rng.choice(("autre", "coupe", "divers")),
+            "Status": "Failed" if failed else "Completed",
+            "shift": rng.choice(("matin", "soir", "nuit")),
+        })
+    # Round-trip through JSON so strings are distinct objects, as after json.load
+    return json.loads(json.dumps(records))
+
+
+def _rss_bytes() -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def _measure(kind: str, n: int, results) -> None:
+    rng = random.Random(42)
+    before = _rss_bytes()
+    store: Any = [] if kind == "dicts" else ReworkTable()
+    for start in range(0, n, 10_000):
+        chunk = _synthetic_chunk(start, min(10_000, n - start), rng)
+        if kind == "dicts":
+            store.extend(chunk)
+        else:
+            for record in chunk:
+                store.append(record)
+        del chunk
+    rss = _rss_bytes() - before
+
+    t0 = time.perf_counter()
+    if kind == "dicts":
+        matched = [r for r in store if r["Area"] == "Motor" and r["Line"] == "Line 3"]
+    else:
+        matched = store.select(Area="Motor", Line="Line 3")
+    filter_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    if kind == "dicts":
+        sums: Dict[Tuple[str, str], List[float]] = {}
+        for r in store:
+            acc = sums.setdefault((r["Area"], r["Line"]), [0.0, 0])
+            acc[0] += r["Rework_time"]
+            acc[1] += 1
+        means = {key: total / count for key, (total, count) in sums.items()}
+    else:
+        means = store.group_mean("Rework_time", ("Area", "Line"))
+    aggregate_s = time.perf_counter() - t0
+
+    results.put({
+        "kind": kind,
+        "rss_mb": round(rss / 2**20, 1),
+        "filter_ms": round(filter_s * 1000, 1),
+        "aggregate_ms": round(aggregate_s * 1000, 1),
+        "matched": len(matched),
+        "groups": len(means),
+    })
+
+
+def benchmark(n: int = 1_000_000) -> List[Dict[str, Any]]:
+    """Compare list-of-dicts and ReworkTable on ``n`` synthetic records.
+
+    Each variant is built in a fresh process so RSS deltas don't mix.
+    """
+    results = []
+    for kind in ("dicts", "table"):
+        queue: multiprocessing.Queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_measure, args=(kind, n, queue))
+        process.start()
+        results.append(queue.get())
+        process.join()
+    return results
+
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    for result in benchmark(size):
+        print(result)
@@ -0,0 +1,430 @@
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from dataset import RowIndex, build_index
+from records import ReworkTable
+from store import QUERY_CACHE_SIZE, QueryError
+
+# Accuracy/size trade-off of the sketches: rank error ~ 1/k, memory ~ 3k values
+SKETCH_K = int(os.environ.get("QUANTILE_SKETCH_K", 200))
+# Each level's capacity is this fraction of the capacity of the level above
+_DECAY = 2 / 3
+# Sketches compact with a seeded coin, so the same input gives the same sketch
+_SEED = 0x5EED
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+# Buckets a sketch is kept for; queries merge them into coarser groups
+GROUP_FIELDS = ("Area", "Line", "shift", "day")
+# Filter parameter -> (bucket field, operator), named like the /api/query filters
+FILTERS = {
+    "area": ("Area", "IN"),
+    "line": ("Line", "IN"),
+    "shift": ("shift", "IN"),
+    "date_from": ("day", ">="),
+    "date_to": ("day", "<="),
+}
+# Changing one of these on an existing row moves or changes a sketched value
+SKETCHED_FIELDS = frozenset(("Area", "Line", "shift", "REWORK_DATE", "Rework_time"))
+
+
+def rank_error(k: int = SKETCH_K) -> float:
+    """Normalized rank error of one quantile of a compacted sketch, at 99%
+    confidence (the empirical KLL fit published with Apache DataSketches):
+    the value returned for q has a rank within q ± rank_error of the exact
+    one. About 1.3% at k = 200."""
+    return 2.296 / k ** 0.9723
+
+
+def quantile_name(q: float) -> str:
+    return f"p{q * 100:g}"
+
+
+# ------------------ KLL sketch ------------------
+class KLLSketch:
+    """Mergeable quantile sketch of a stream of numbers (Karnin, Lang and
+    Liberty, 2016).
+
+    Values go to level 0. When the sketch holds more than its capacity, a
+    full level is sorted and every other value is promoted one level up,
+    with twice the weight. Capacities shrink geometrically going down, so
+    the sketch never holds more than about 3k values however long the
+    stream. Until the first compaction it holds every value and its
+    quantiles are exact.
+
+    Two sketches merge level by level, so sketches of time buckets or of
+    other nodes combine into the sketch of their union, with the same error
+    bound.
+    """
+
+    __slots__ = ("k", "levels", "count", "min", "max", "_size", "_max_size", "_rng", "_sorted")
+
+    def __init__(self, k: int = SKETCH_K):
+        if k < 8:
+            raise ValueError("k must be at least 8")
+        self.k = k
+        self.levels: List[List[float]] = [[]]
+        self.count = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self._size = 0
+        self._max_size = self._capacity(0)
+        self._rng = random.Random(_SEED)
+        self._sorted: Optional[Tuple[List[float], List[int]]] = None
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * _DECAY ** depth)))
+
+    @property
+    def exact(self) -> bool:
+        return len(self.levels) == 1
+
+    def add(self, value: float) -> None:
+        self.extend((value,))
+
+    def extend(self, values: Iterable[float]) -> None:
+        level = self.levels[0]
+        for value in values:
+            value = float(value)
+            if self.count == 0 or value < self.min:
+                self.min = value
+            if self.count == 0 or value > self.max:
+                self.max = value
+            level.append(value)
+            self.count += 1
+            self._size += 1
+            if self._size >= self._max_size:
+                self._compress()
+                level = self.levels[0]
+        self._sorted = None
+
+    def _compress(self) -> None:
+        while self._size >= self._max_size:
+            for height, items in enumerate(self.levels):
+                if len(items) >= self._capacity(height):
+                    if height + 1 == len(self.levels):
+                        # Adding a level raises every capacity below it
+                        self.levels.append([])
+                        self._max_size = sum(self._capacity(h) for h in range(len(self.levels)))
+                    self.levels[height + 1].extend(self._halve(items))
+                    break
+            self._size = sum(map(len, self.levels))
+
+    def _halve(self, items: List[float]) -> List[float]:
+        # An odd value out stays at its level
+        items.sort()
+        end = len(items) - len(items) % 2
+        promoted = items[self._rng.getrandbits(1):end:2]
+        del items[:end]
+        return promoted
+
+    def merge(self, other: "KLLSketch") -> "KLLSketch":
+        """Absorb ``other`` (left unchanged); returns self."""
+        if other.k != self.k:
+            raise ValueError(f"Cannot merge sketches of k={self.k} and k={other.k}")
+        if not other.count:
+            return self
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for items, extra in zip(self.levels, other.levels):
+            items.extend(extra)
+        self.min = other.min if self.count == 0 else min(self.min, other.min)
+        self.max = other.max if self.count == 0 else max(self.max, other.max)
+        self.count += other.count
+        self._size = sum(map(len, self.levels))
+        self._max_size = sum(self._capacity(h) for h in range(len(self.levels)))
+        self._compress()
+        self._sorted = None
+        return self
+
+    def copy(self) -> "KLLSketch":
+        return KLLSketch(self.k).merge(self)
+
+    def _cumulative(self) -> Tuple[List[float], List[int]]:
+        if self._sorted is None:
+            weighted = sorted((value, 1 << height)
+                              for height, items in enumerate(self.levels) for value in items)
+            values, cumulative, total = [], [], 0
+            for value, weight in weighted:
+                total += weight
+                values.append(value)
+                cumulative.append(total)
+            self._sorted = (values, cumulative)
+        return self._sorted
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Smallest retained value whose (weighted) rank reaches q * count."""
+        if not 0 <= q <= 1:
+            raise ValueError("quantile must be between 0 and 1")
+        if not self.count:
+            return None
+        if q == 0:
+            return self.min
+        if q == 1:
+            return self.max
+        values, cumulative = self._cumulative()
+        target = q * cumulative[-1]
+        low, high = 0, len(cumulative) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if cumulative[middle] < target:
+                low = middle + 1
+            else:
+                high = middle
+        return values[low]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"k": self.k, "count": self.count, "min": self.min, "max": self.max,
+                "levels": [list(items) for items in self.levels]}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "KLLSketch":
+        sketch = cls(int(data["k"]))
+        sketch.levels = [[float(value) for value in items] for items in data["levels"]] or [[]]
+        sketch.count = int(data["count"])
+        sketch.min, sketch.max = data.get("min"), data.get("max")
+        sketch._size = sum(map(len, sketch.levels))
+        sketch._max_size = sum(sketch._capacity(h) for h in range(len(sketch.levels)))
+        if sum(len(items) << height for height, items in enumerate(sketch.levels)) != sketch.count:
+            raise ValueError("Sketch levels do not add up to its count")
+        return sketch
+
+
+# ------------------ Rework time index ------------------
+Bucket = Tuple[Optional[str], ...]
+
+
+class QuantileIndex:
+    """Rework_time sketches per Area/Line/shift/day, kept at the revision of
+    the dataset like the AnalyticsStore.
+
+    Appended rows are added to their bucket as they arrive. A sketch cannot
+    forget a value, so an upsert changing a sketched field of an existing
+    row rebuilds every bucket from the table.
+    """
+
+    def __init__(self, k: int = SKETCH_K):
+        self.k = k
+        self.buckets: Dict[Bucket, KLLSketch] = {}
+        # Table positions below this one are in the sketches
+        self.rows = 0
+        self.revision = -1
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+        # Query results of the current revision
+        self._cache: Dict[str, Dict[str, Any]] = {}
+
+    def _absorb(self, data: ReworkTable, positions: Optional[Sequence[int]]) -> None:
+        columns = [data.columns[name] for name in ("Area", "Line", "shift", "REWORK_DATE", "Rework_time")]
+        arrays = [column.codes for column in columns]
+        if positions is not None:
+            arrays = [[codes[i] for i in positions] for codes in arrays]
+        decoded = [[value if isinstance(value, str) else None for value in column.values] for column in columns[:3]]
+        days = [value[:10] if isinstance(value, str) else None for value in columns[3].values]
+        times = [value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+                 for value in columns[4].values]
+        # Group first, so each sketch is extended once per batch
+        grouped: Dict[Tuple[int, ...], List[float]] = {}
+        for area, line, shift, date, rework_time in zip(*arrays):
+            value = times[rework_time]
+            if value is not None:
+                grouped.setdefault((area, line, shift, date), []).append(value)
+        by_bucket: Dict[Bucket, List[float]] = {}
+        for (area, line, shift, date), values in grouped.items():
+            bucket = (decoded[0][area], decoded[1][line], decoded[2][shift], days[date])
+            by_bucket.setdefault(bucket, []).extend(values)
+        for bucket, values in by_bucket.items():
+            sketch = self.buckets.get(bucket)
+            if sketch is None:
+                sketch = self.buckets[bucket] = KLLSketch(self.k)
+            sketch.extend(values)
+
+    def rebuild(self, data: ReworkTable, revision: int) -> None:
+        with self._lock:
+            self.buckets = {}
+            self._absorb(data, None)
+            self.rows, self.revision = len(data), revision
+            self.rebuilds += 1
+            self._cache = {}
+
+    def sync(self, data: ReworkTable, revision: int, records: Iterable[Dict[str, Any]],
+             index: RowIndex) -> None:
+        """Bring the sketches to ``revision`` after the upsert of ``records``
+        (normalized journal records; ``index`` finds their rows by REWORK_ID)."""
+        appended = set()
+        for record in records:
+            position = index.position(record)
+            if position is None:
+                continue
+            if position >= self.rows:
+                appended.add(position)
+            elif SKETCHED_FIELDS.intersection(record):
+                return self.rebuild(data, revision)
+        with self._lock:
+            self._absorb(data, sorted(appended))
+            self.rows, self.revision = len(data), revision
+            self._cache = {}
+
+    def query(self, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Rework_time quantiles per group, merged from the matching buckets.
+
+        ``params``: ``group_by`` (subset of GROUP_FIELDS), ``q`` (quantiles
+        between 0 and 1), ``sketches`` (include each group's serialized
+        sketch, to merge with other nodes) and the FILTERS parameters.
+        """
+        key = json.dumps(params, sort_keys=True, default=str)
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+        params = dict(params or {})
+        group_by = params.pop("group_by", ["Area", "Line"])
+        if isinstance(group_by, str):
+            group_by = [group_by]
+        if not group_by or any(key not in GROUP_FIELDS for key in group_by):
+            raise QueryError(f"group_by must be a non-empty subset of {list(GROUP_FIELDS)}")
+        quantiles = params.pop("q", DEFAULT_QUANTILES)
+        if not isinstance(quantiles, (list, tuple)):
+            quantiles = [quantiles]
+        try:
+            quantiles = [float(q) for q in quantiles]
+        except (TypeError, ValueError):
+            raise QueryError("q must be numbers between 0 and 1")
+        if not quantiles or any(not 0 <= q <= 1 for q in quantiles):
+            raise QueryError("q must be numbers between 0 and 1")
+        include_sketches = str(params.pop("sketches", "")).lower() in ("1", "true", "yes")
+
+        checks = []
+        for key, value in params.items():
+            if key not in FILTERS:
+                raise QueryError(f"Unknown parameter {key!r}, expected one of {sorted(FILTERS)}")
+            field, operator = FILTERS[key]
+            position = GROUP_FIELDS.index(field)
+            if operator == "IN":
+                wanted = {str(v) for v in (value if isinstance(value, list) else [value])}
+                checks.append(lambda bucket, p=position, w=wanted: bucket[p] in w)
+            elif operator == ">=":
+                checks.append(lambda bucket, p=position, v=str(value): bucket[p] is not None and bucket[p] >= v)
+            else:
+                checks.append(lambda bucket, p=position, v=str(value): bucket[p] is not None and bucket[p] <= v)
+
+        keys = [GROUP_FIELDS.index(field) for field in group_by]
+        groups: Dict[Bucket, KLLSketch] = {}
+        with self._lock:
+            revision = self.revision
+            for bucket, sketch in self.buckets.items():
+                if all(check(bucket) for check in checks):
+                    group = tuple(bucket[i] for i in keys)
+                    if group in groups:
+                        groups[group].merge(sketch)
+                    else:
+                        groups[group] = sketch.copy()
+
+        rows = []
+        for group in sorted(groups, key=lambda g: tuple("" if v is None else v for v in g)):
+            sketch = groups[group]
+            row = dict(zip(group_by, group))
+            row.update({"count": sketch.count, "min": sketch.min, "max": sketch.max, "exact": sketch.exact})
+            row.update({quantile_name(q): sketch.quantile(q) for q in quantiles})
+            if include_sketches:
+                row["sketch"] = sketch.to_dict()
+            rows.append(row)
+        result = {
+            "field": "Rework_time",
+            "revision": revision,
+            "quantiles": quantiles,
+            # Rows marked exact hold every value and have no error
+            "rank_error": round(rank_error(self.k), 4),
+            "rows": rows,
+        }
+        with self._lock:
+            if self.revision == revision and len(self._cache) < QUERY_CACHE_SIZE:
+                self._cache[key] = result
+        return result
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "buckets": len(self.buckets),
+                "retained_values": sum(sum(map(len, s.levels)) for s in self.buckets.values()),
+                "rows": self.rows,
+                "rebuilds": self.rebuilds,
+            }
+
+
+# ------------------ Benchmark ------------------
+def _rank_errors(sketch: KLLSketch, exact: List[float], quantiles: Sequence[float]) -> float:
+    import bisect
+    worst = 0.0
+    for q in quantiles:
+        value = sketch.quantile(q)
+        # Any rank the returned value covers counts as a hit
+        low, high = bisect.bisect_left(exact, value) / len(exact), bisect.bisect_right(exact, value) / len(exact)
+        worst = max(worst, 0.0 if low <= q <= high else min(abs(q - low), abs(q - high)))
+    return worst
+
+
+if __name__ == "__main__":
+    from ingest import ingest_records
+    from records import _synthetic_chunk
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    quantiles = (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99)
+
+    # A single long stream: size and accuracy, against the exact quantiles
+    rng = random.Random(1)
+    stream = [rng.lognormvariate(3.8, 0.5) for _ in range(1_000_000)]
+    sketch = KLLSketch()
+    t0 = time.perf_counter()
+    sketch.extend(stream)
+    add_s = time.perf_counter() - t0
+    halves = [KLLSketch(), KLLSketch()]
+    halves[0].extend(stream[::2])
+    halves[1].extend(stream[1::2])
+    merged = KLLSketch.from_dict(halves[0].to_dict()).merge(KLLSketch.from_dict(halves[1].to_dict()))
+    stream.sort()
+    print({"values": len(stream), "retained": sum(map(len, sketch.levels)),
+           "add_ns_per_value": round(add_s / len(stream) * 1e9), "rank_error_bound": round(rank_error(), 4),
+           "worst_rank_error": round(_rank_errors(sketch, stream, quantiles), 4),
+           "worst_rank_error_merged": round(_rank_errors(merged, stream, quantiles), 4)})
+
+    # The dashboard index over synthetic reworks
+    rng = random.Random(42)
+    table = ReworkTable.from_records(ingest_records(
+        [record for start in range(0, n, 10_000) for record in _synthetic_chunk(start, min(10_000, n - start), rng)]
+    ))
+    index = QuantileIndex()
+    t0 = time.perf_counter()
+    index.rebuild(table, 1)
+    rebuild_ms = (time.perf_counter() - t0) * 1000
+    rows = build_index(table)
+    appended = [{**table.row(i), "ORDNR": f"x{i}", "REWORK_ID": rows.allocate()} for i in range(1000)]
+    for record in appended:
+        rows.add(table.append(record), record)
+    t0 = time.perf_counter()
+    index.sync(table, 2, appended, rows)
+    sync_ms = (time.perf_counter() - t0) * 1000
+    print({"rows": len(table), **index.summary(), "rebuild_ms": round(rebuild_ms, 1),
+           "sync_1000_appended_ms": round(sync_ms, 2)})
+    for group_by in (["Area", "Line", "shift", "day"], ["Area", "Line"], ["day"]):
+        t0 = time.perf_counter()
+        result = index.query({"group_by": group_by})
+        print({"group_by": group_by, "groups": len(result["rows"]),
+               "query_ms": round((time.perf_counter() - t0) * 1000, 2)})
+    # The exact alternative: every value of the column, sorted per request
+    t0 = time.perf_counter()
+    exact = {}
+    for area, line, rework_time in zip(table.column_values("Area"), table.column_values("Line"),
+                                       table.column_values("Rework_time")):
+        exact.setdefault((area, line), []).append(rework_time)
+    for values in exact.values():
+        values.sort()
+    print({"exact_sort_per_query_ms": round((time.perf_counter() - t0) * 1000, 1),
+           "worst_rank_error_by_line": round(max(
+               _rank_errors(KLLSketch.from_dict(row["sketch"]), exact[(row["Area"], row["Line"])], quantiles)
+               for row in index.query({"group_by": ["Area", "Line"], "sketches": "1"})["rows"]), 4)})
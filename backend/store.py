@@ -0,0 +1,292 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from records import FIELDS, ReworkTable
+
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", 256))
+EXPORT_BATCH_ROWS = int(os.environ.get("EXPORT_BATCH_ROWS", 10000))
+MAX_LIMIT = 1000
+
+_TYPES = {"REWORK_ID": "INTEGER", "Rework_time": "REAL", "Success": "INTEGER"}
+INDEXED = ("REWORK_DATE", "Area", "Line", "Defect_type")
+
+# Group-by keys a query may use, and their SQL expression
+DIMENSIONS = {
+    "Area": "Area",
+    "Line": "Line",
+    "shift": "shift",
+    "Defect_type": "Defect_type",
+    "Priority": "Priority",
+    "Status": "Status",
+    "SUBPROD": "SUBPROD",
+    "day": "substr(REWORK_DATE, 1, 10)",
+    "hour": "CAST(substr(REWORK_DATE, 12, 2) AS INTEGER)",
+}
+# Aggregates returned for every group
+METRICS = {
+    "reworks": "COUNT(*)",
+    "failures": "SUM(Success = 0)",
+    "ftq": "ROUND(100.0 * AVG(Success), 1)",
+    "avg_rework_time": "ROUND(AVG(Rework_time), 1)",
+    "max_rework_time": "MAX(Rework_time)",
+}
+# Filter parameter -> (column, operator)
+FILTERS = {
+    "area": ("Area", "IN"),
+    "line": ("Line", "IN"),
+    "shift": ("shift", "IN"),
+    "defect_type": ("Defect_type", "IN"),
+    "status": ("Status", "IN"),
+    "priority": ("Priority", "IN"),
+    "date_from": ("REWORK_DATE", ">="),
+    "date_to": ("REWORK_DATE", "<="),
+}
+# Named queries: default grouping and ordering, overridable within the whitelists
+QUERIES = {
+    "aggregate": {"group_by": ["Area", "Line"], "order_by": "reworks", "descending": True},
+    "ftq_by_line": {"group_by": ["Area", "Line"], "order_by": "ftq", "descending": False},
+    "daily_ftq": {"group_by": ["day"], "order_by": "day", "descending": False},
+    "defects_by_type": {"group_by": ["Defect_type"], "order_by": "reworks", "descending": True},
+    "shift_performance": {"group_by": ["shift"], "order_by": "ftq", "descending": False},
+    "hourly_profile": {"group_by": ["hour"], "order_by": "hour", "descending": False},
+}
+
+
+class QueryError(ValueError):
+    pass
+
+
+# ------------------ SQL building ------------------
+def _next_day(value: Any) -> Optional[str]:
+    """The day after a bare YYYY-MM-DD ``value``; None for anything else."""
+    try:
+        return (date.fromisoformat(str(value)) + timedelta(days=1)).isoformat()
+    except ValueError:
+        return None
+
+
+def build_filters(params: Dict[str, Any]) -> Tuple[List[str], List[Any]]:
+    """WHERE clauses and bound arguments for FILTERS parameters.
+
+    A bare day as ``date_to`` includes that whole day.
+    """
+    where, args = [], []
+    for key, value in params.items():
+        if key not in FILTERS:
+            raise QueryError(f"Unknown parameter {key!r}, expected one of {sorted(FILTERS)}")
+        column, operator = FILTERS[key]
+        if operator == "IN":
+            values = value if isinstance(value, list) else [value]
+            if not values:
+                raise QueryError(f"{key} needs at least one value")
+            where.append(f"{column} IN ({', '.join('?' * len(values))})")
+            args.extend(str(v) for v in values)
+        elif key == "date_to" and _next_day(value) is not None:
+            where.append(f"{column} < ?")
+            args.append(_next_day(value))
+        else:
+            where.append(f"{column} {operator} ?")
+            args.append(str(value))
+    return where, args
+
+
+def build_query(name: str, params: Optional[Dict[str, Any]] = None) -> Tuple[str, List[Any]]:
+    """SQL and bound arguments for a named query.
+
+    Only whitelisted dimensions, metrics and filters reach the SQL text;
+    every user-supplied value is a bound parameter.
+    """
+    if name not in QUERIES:
+        raise QueryError(f"Unknown query {name!r}, expected one of {sorted(QUERIES)}")
+    params = dict(params or {})
+    preset = QUERIES[name]
+
+    group_by = params.pop("group_by", preset["group_by"])
+    if isinstance(group_by, str):
+        group_by = [group_by]
+    unknown = [key for key in group_by if key not in DIMENSIONS]
+    if unknown or not group_by:
+        raise QueryError(f"group_by must be a non-empty subset of {sorted(DIMENSIONS)}")
+
+    order_by = params.pop("order_by", preset["order_by"])
+    if order_by not in METRICS and order_by not in group_by:
+        raise QueryError(f"order_by must be a metric {sorted(METRICS)} or a group_by key")
+    descending = bool(params.pop("descending", preset["descending"]))
+    try:
+        limit = min(int(params.pop("limit", MAX_LIMIT)), MAX_LIMIT)
+    except (TypeError, ValueError):
+        raise QueryError("limit must be an integer")
+
+    where, args = build_filters(params)
+    select = [f'{DIMENSIONS[key]} AS "{key}"' for key in group_by]
+    select += [f'{sql} AS "{metric}"' for metric, sql in METRICS.items()]
+    sql = f"SELECT {', '.join(select)} FROM reworks"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" GROUP BY {', '.join(str(i + 1) for i in range(len(group_by)))}"
+    sql += f' ORDER BY "{order_by}" {"DESC" if descending else "ASC"} LIMIT ?'
+    args.append(max(limit, 0))
+    return sql, args
+
+
+# ------------------ Store ------------------
+class AnalyticsStore:
+    """SQLite copy of the dataset for aggregate queries.
+
+    Rows are keyed by their position in the ReworkTable, so journaled
+    upserts only rewrite the rows they touched; full replacements rebuild
+    the table. Keys outside FIELDS are kept as one JSON object in the
+    ``extra`` column: exported, but not queryable. The revision it reflects is stored alongside, so a restart
+    with an unchanged dataset reuses the file as is.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        columns = ", ".join(f'"{name}" {_TYPES.get(name, "TEXT")}' for name in FIELDS)
+        with self._conn:
+            existing = [row[1] for row in self._conn.execute("PRAGMA table_info(reworks)")]
+            if existing and existing != ["pos", *FIELDS, "extra"]:
+                # Written with other columns: a cache, rebuilt from the dataset
+                self._conn.execute("DROP TABLE reworks")
+                self._conn.execute("DROP TABLE IF EXISTS meta")
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS reworks (pos INTEGER PRIMARY KEY, {columns}, extra TEXT)")
+            for name in INDEXED:
+                self._conn.execute(f'CREATE INDEX IF NOT EXISTS idx_reworks_{name.lower()} ON reworks ("{name}")')
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()
+        self.revision = int(row[0]) if row else -1
+        self._cache: "OrderedDict[Tuple[int, str], List[Dict[str, Any]]]" = OrderedDict()
+
+    @staticmethod
+    def _extra(data: ReworkTable, position: int) -> Optional[str]:
+        extra = data.extras[position]
+        others = {key: value for key, value in extra.items() if key not in data.columns} if extra else None
+        return json.dumps(others, ensure_ascii=False, separators=(",", ":")) if others else None
+
+    @classmethod
+    def _rows(cls, data: ReworkTable, positions: Iterable[int]):
+        for position in positions:
+            yield (position,) + tuple(data.get(position, name) for name in FIELDS) + (cls._extra(data, position),)
+
+    def _write(self, sql_rows, revision: int, rebuild: bool) -> None:
+        placeholders = ", ".join("?" * (len(FIELDS) + 2))
+        with self._lock, self._conn:
+            if rebuild:
+                self._conn.execute("DELETE FROM reworks")
+            self._conn.executemany(f"INSERT OR REPLACE INTO reworks VALUES ({placeholders})", sql_rows)
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('revision', ?)", (str(revision),))
+            self.revision = revision
+
+    def rebuild(self, data: ReworkTable, revision: int) -> None:
+        self._write(self._rows(data, range(len(data))), revision, True)
+
+    def sync(self, data: ReworkTable, revision: int, positions: Iterable[int]) -> None:
+        """Rewrite the rows at ``positions`` (changed or appended since the last sync)."""
+        self._write(self._rows(data, sorted(set(positions))), revision, False)
+
+    def query(self, name: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Run a whitelisted query; results are cached per data revision."""
+        sql, args = build_query(name, params)
+        with self._lock:
+            revision = self.revision
+            key = (revision, json.dumps([name, params], sort_keys=True, default=str))
+            rows = self._cache.get(key)
+            cached = rows is not None
+            if cached:
+                self._cache.move_to_end(key)
+            else:
+                cursor = self._conn.execute(sql, args)
+                columns = [description[0] for description in cursor.description]
+                rows = [dict(zip(columns, row)) for row in cursor]
+                # Results of older revisions can never be hit again
+                for stale in [k for k in self._cache if k[0] != revision]:
+                    del self._cache[stale]
+                self._cache[key] = rows
+                while len(self._cache) > QUERY_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return {"query": name, "revision": revision, "cached": cached, "rows": rows}
+
+    def export(self, params: Optional[Dict[str, Any]] = None,
+               batch_size: int = EXPORT_BATCH_ROWS) -> Tuple[int, Iterator[List[Tuple]]]:
+        """Revision and row batches (FIELDS order then ``extra``, table
+        order) of the rows matching FILTERS ``params``.
+
+        The rows are read lazily on a read-only connection of their own,
+        inside one transaction: a WAL snapshot, so the export stays
+        consistent with the revision returned while writes go on.
+        """
+        where, args = build_filters(dict(params or {}))
+        columns = ", ".join(f'"{name}"' for name in FIELDS)
+        sql = f"SELECT {columns}, extra FROM reworks"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY pos"
+        conn = sqlite3.connect(self.path.resolve().as_uri() + "?mode=ro", uri=True, check_same_thread=False)
+        try:
+            conn.execute("BEGIN")
+            # The first read pins the snapshot
+            row = conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()
+            cursor = conn.execute(sql, args)
+        except Exception:
+            conn.close()
+            raise
+
+        def batches():
+            try:
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                conn.close()
+        return int(row[0]) if row else -1, batches()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# ------------------ Benchmark ------------------
+if __name__ == "__main__":
+    import tempfile
+    from ingest import ingest_records
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "data/data.json"
+    with open(path, "r", encoding="utf-8") as f:
+        table = ReworkTable.from_records(ingest_records(json.load(f)))
+    with tempfile.TemporaryDirectory() as directory:
+        store = AnalyticsStore(Path(directory) / "analytics.sqlite")
+        t0 = time.perf_counter()
+        store.rebuild(table, 1)
+        print({"rows": len(table), "rebuild_ms": round((time.perf_counter() - t0) * 1000, 1)})
+        t0 = time.perf_counter()
+        store.sync(table, 2, range(10))
+        print({"sync_10_rows_ms": round((time.perf_counter() - t0) * 1000, 2)})
+
+        t0 = time.perf_counter()
+        python_means = table.group_mean("Rework_time", ("Area", "Line"))
+        python_ms = (time.perf_counter() - t0) * 1000
+        for name in QUERIES:
+            t0 = time.perf_counter()
+            result = store.query(name)
+            cold_ms = (time.perf_counter() - t0) * 1000
+            t0 = time.perf_counter()
+            store.query(name)
+            cached_ms = (time.perf_counter() - t0) * 1000
+            print({"query": name, "groups": len(result["rows"]), "sqlite_ms": round(cold_ms, 2),
+                   "cached_ms": round(cached_ms, 3)})
+        print({"ReworkTable.group_mean(Area, Line)_ms": round(python_ms, 2)})
+        store.close()
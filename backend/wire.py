@@ -0,0 +1,159 @@
+import json
+import sys
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+try:
+    import msgpack
+except ImportError:  # optional: the "msgpack" format is simply not offered
+    msgpack = None
+
+from records import FIELDS
+
+# Message keys holding lists of records (re-encoded column by column)
+RECORD_LISTS = ("data", "records", "alerts")
+DEFAULT_FORMAT = "json"
+# Subprotocol names offered in Sec-WebSocket-Protocol, e.g. "rework.msgpack"
+SUBPROTOCOL_PREFIX = "rework."
+
+Frame = Union[str, bytes]
+
+
+# ------------------ Encodings ------------------
+def to_columns(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Keyed tuples: the field names once, then one value list per record.
+
+    Columns follow the data.json field order, extra keys come after them in
+    order of appearance; a field missing from a record is sent as null.
+    """
+    columns = [name for name in FIELDS if any(name in record for record in records)]
+    known = set(columns)
+    for record in records:
+        for name in record:
+            if name not in known:
+                known.add(name)
+                columns.append(name)
+    return {"columns": columns, "rows": [[record.get(name) for name in columns] for record in records]}
+
+
+def from_columns(table: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Inverse of to_columns (null fields are dropped), for clients and tests."""
+    columns = table["columns"]
+    return [
+        {name: value for name, value in zip(columns, row) if value is not None}
+        for row in table["rows"]
+    ]
+
+
+def columnar(message: Dict[str, Any]) -> Dict[str, Any]:
+    encoded = {
+        key: to_columns(value) if key in RECORD_LISTS and isinstance(value, list) else value
+        for key, value in message.items()
+    }
+    encoded["encoding"] = "columnar"
+    return encoded
+
+
+def _json(message: Dict[str, Any]) -> str:
+    # Same encoding as WebSocket.send_json
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+def _deflate(message: Dict[str, Any]) -> bytes:
+    return zlib.compress(_json(columnar(message)).encode("utf-8"), 6)
+
+
+def _msgpack(message: Dict[str, Any]) -> bytes:
+    return msgpack.packb(columnar(message), use_bin_type=True)
+
+
+# name -> encoder; str frames go out as text, bytes as binary
+FORMATS = {
+    "json": _json,
+    "columnar": lambda message: _json(columnar(message)),
+    "deflate": _deflate,
+}
+if msgpack is not None:
+    FORMATS["msgpack"] = _msgpack
+
+
+def encode(message: Dict[str, Any], fmt: str = DEFAULT_FORMAT) -> Frame:
+    return FORMATS[fmt](message)
+
+
+def decode(frame: Frame, fmt: str = DEFAULT_FORMAT) -> Dict[str, Any]:
+    """Back to a plain message (record lists as dicts); mirrors encode()."""
+    if fmt == "json":
+        return json.loads(frame)
+    if fmt == "msgpack":
+        message = msgpack.unpackb(frame, raw=False)
+    elif fmt == "deflate":
+        message = json.loads(zlib.decompress(frame).decode("utf-8"))
+    else:
+        message = json.loads(frame)
+    message.pop("encoding", None)
+    return {
+        key: from_columns(value) if key in RECORD_LISTS and isinstance(value, dict) else value
+        for key, value in message.items()
+    }
+
+
+def negotiate(query_format: Optional[str], subprotocols: Iterable[str]):
+    """(format, subprotocol to accept) for a connecting client.
+
+    The ``?format=`` query parameter wins; otherwise the first offered
+    "rework.<format>" subprotocol the server supports. Anything else falls
+    back to plain JSON so existing clients are unaffected.
+    """
+    if query_format in FORMATS:
+        return query_format, None
+    for subprotocol in subprotocols:
+        if subprotocol.startswith(SUBPROTOCOL_PREFIX) and subprotocol[len(SUBPROTOCOL_PREFIX):] in FORMATS:
+            return subprotocol[len(SUBPROTOCOL_PREFIX):], subprotocol
+    return DEFAULT_FORMAT, None
+
+
+# ------------------ Benchmark ------------------
+def benchmark(records: List[Dict[str, Any]], repeat: int = 20) -> List[Dict[str, Any]]:
+    """Bytes on the wire and encode time of a full data_update per format.
+
+    "json+permessage-deflate" estimates what the transport extension would
+    send for plain JSON: the same zlib cost, paid once per connection
+    instead of once per message.
+    """
+    message = {"type": "data_update", "data": records, "revision": 1, "message": "Data has been updated"}
+    results = []
+    for fmt in list(FORMATS) + ["json+permessage-deflate"]:
+        if fmt == "json+permessage-deflate":
+            def encoder(m):
+                return zlib.compress(_json(m).encode("utf-8"), 6)
+        else:
+            encoder = FORMATS[fmt]
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            frame = encoder(message)
+            timings.append(time.perf_counter() - start)
+        size = len(frame.encode("utf-8") if isinstance(frame, str) else frame)
+        if fmt in FORMATS:
+            assert decode(frame, fmt)["data"] == [
+                {name: value for name, value in record.items() if value is not None} for record in records
+            ]
+        results.append({
+            "format": fmt,
+            "frame": "text" if isinstance(frame, str) else "binary",
+            "bytes": size,
+            "encode_ms": round(sorted(timings)[len(timings) // 2] * 1000, 2),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "data/data.json"
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    baseline = None
+    for result in benchmark(data):
+        baseline = baseline or result["bytes"]
+        print({**result, "ratio": round(result["bytes"] / baseline, 3)})
@@ -11,6 +11,7 @@ export class WebSocketService {
   private reconnectAttempts = 0;
   private maxReconnectAttempts = 5;
   private reconnectDelay = 3000; // 3 secondes
+  private lastData: ReworkData[] = [];
 
   constructor(private url: string = 'ws://localhost:8000/ws') {}
 
@@ -31,7 +32,12 @@ export class WebSocketService {
       this.socket.onmessage = (event) => {
         try {
           const response = JSON.parse(event.data);
-          if (response && response.data) {
+          if (response && response.type === 'data_patch' && response.records) {
+            // Fusionner les enregistrements modifiés (par ORDNR) dans le dernier jeu de données
+            this.lastData = this.applyPatch(this.lastData, response.records);
+            this.callbacks.forEach(callback => callback(this.lastData));
+          } else if (response && response.data) {
+            this.lastData = response.data;
             // Notifier tous les abonnés avec les nouvelles données
             this.callbacks.forEach(callback => callback(response.data));
           }
@@ -59,6 +65,21 @@ export class WebSocketService {
     }
   }
 
+  private applyPatch(current: ReworkData[], records: ReworkData[]): ReworkData[] {
+    const byOrder = new Map(records.map(record => [record.ORDNR, record]));
+    const seen = new Set<string>();
+    const merged = current.map(row => {
+      const patch = byOrder.get(row.ORDNR);
+      if (!patch) return row;
+      seen.add(row.ORDNR);
+      return { ...row, ...patch };
+    });
+    records.forEach(record => {
+      if (!seen.has(record.ORDNR)) merged.push(record);
+    });
+    return merged;
+  }
+
   private scheduleReconnect(): void {
     if (this.reconnectTimer) {
       clearTimeout(this.reconnectTimer);
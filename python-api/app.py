@@ -1,66 +1,72 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import pandas as pd
-import numpy as np
+import importlib.util
 import json
 from datetime import datetime, timedelta
 import random
 import os
+import sys
 import logging
+import threading
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-try:
-    from sklearn.ensemble import RandomForestClassifier
-    from sklearn.model_selection import train_test_split
-    from sklearn.preprocessing import LabelEncoder
-    SKLEARN_AVAILABLE = True
-except ImportError:
-    SKLEARN_AVAILABLE = False
+# Same ingest rules as the realtime backend
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from ingest import ingest_records
+from http_cache import RepresentationCache, conditional
+from dataset import Dataset
+
+# Model backends and tuned settings shared with scripts/ftq_predictor.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+# pandas, numpy and sklearn are imported on the first prediction, not at
+# startup, so /health answers immediately
+SKLEARN_AVAILABLE = importlib.util.find_spec('sklearn') is not None
+# Preload them (and run one prediction) in the background at startup
+WARMUP = os.environ.get('FTQ_WARMUP', '1') != '0'
+_warmed_up = threading.Event()
+_warmup_thread = None
+
+# Last fitted classifier, reused until the incoming data drifts away from
+# what it was trained on (see scripts/ftq_drift.py)
+_classifier = None
+# Per-row feature contributions, keyed by (classifier version, group, digest
+# of the group's encoded rows)
+_explanations = {}
+EXPLAIN_CACHE_SIZE = int(os.environ.get('FTQ_EXPLAIN_CACHE_SIZE', 512))
+# predicted_ftq is the what-if simulation (scripts/ftq_whatif.py) of this
+# scenario: the slowest quarter of reworks brought down to the 75th
+# percentile of Rework_time, and the load spread evenly over the shifts
+IMPROVEMENT_SCENARIO = [
+    {"action": "cap", "field": "Rework_time", "quantile": 0.75},
+    {"action": "rebalance", "field": "shift"},
+]
+PREDICTION_SAMPLES = int(os.environ.get('FTQ_PREDICTION_SAMPLES', 500))
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-def train_and_predict(data):
-    df = pd.DataFrame(data)
-    required_columns = ['SUBPROD', 'RWRK_CODE', 'Line', 'Area', 'Priority', 'Defect_type',
-                        'Defect_description', 'shift', 'Rework_time', 'Success']
-    
-    missing_columns = [col for col in required_columns if col not in df.columns]
-    if missing_columns:
-        for col in missing_columns:
-            if col == 'Success':
-                if 'Rework_time' in df.columns:
-                    df[col] = (df['Rework_time'] < df['Rework_time'].median()).astype(int)
-                else:
-                    df[col] = np.random.binomial(1, 0.75, len(df))
-            elif col == 'Priority':
-                if 'Rework_time' in df.columns:
-                    df[col] = pd.cut(df['Rework_time'], bins=3, labels=['low', 'medium', 'high'])
-                else:
-                    df[col] = np.random.choice(['low', 'medium', 'high'], len(df))
-            elif col == 'shift':
-                if 'REWORK_DATE' in df.columns:
-                    try:
-                        df['hour'] = pd.to_datetime(df['REWORK_DATE']).dt.hour
-                        df[col] = df['hour'].apply(lambda x: 'morning' if 6 <= x < 14 else 'evening' if 14 <= x < 22 else 'night')
-                    except:
-                        df[col] = np.random.choice(['morning', 'evening', 'night'], len(df))
-                else:
-                    df[col] = np.random.choice(['morning', 'evening', 'night'], len(df))
-            elif col in ['SUBPROD', 'RWRK_CODE']:
-                df[col] = np.random.choice(['E', 'F', 'G'], len(df))
-            else:
-                df[col] = 'unknown'
+def build_features(data, categories=None):
+    # Records come from ingest_records: Success, Priority, shift,
+    # Rework_time and REWORK_DATE are always present and typed.
+    # Codes are positions in the sorted distinct values (as LabelEncoder);
+    # pass the ``categories`` of a fitted model to reuse its encoding,
+    # unseen values then get -1.
+    import pandas as pd
 
+    df = pd.DataFrame(data)
     categorical_cols = ['SUBPROD', 'RWRK_CODE', 'Line', 'Area', 'Priority',
                         'Defect_type', 'Defect_description', 'shift']
-    
+    encoded = {}
     for col in categorical_cols:
-        if col in df.columns:
-            le = LabelEncoder()
-            df[col + '_encoded'] = le.fit_transform(df[col].astype(str))
+        if col not in df.columns:
+            df[col] = 'unknown'
+        values = df[col].astype(str)
+        encoded[col] = categories[col] if categories else sorted(values.unique())
+        codes = {value: code for code, value in enumerate(encoded[col])}
+        df[col + '_encoded'] = values.map(codes).fillna(-1).astype(int)
 
     if 'REWORK_DATE' in df.columns:
         try:
@@ -80,91 +86,232 @@ def train_and_predict(data):
         feature_cols.append('day_of_week')
     if 'is_weekend' in df.columns:
         feature_cols.append('is_weekend')
-    
+    return df, feature_cols, encoded
+
+def classifier_is_stale(state, data):
+    # Refit only when this data drifted from the training snapshot, brings
+    # categories the encoding has never seen, or changed size noticeably
+    from ftq_drift import DriftMonitor, VOLUME_THRESHOLD
+
+    monitor = DriftMonitor(state['reference'], window_rows=0)
+    monitor.observe(data)
+    decision = monitor.decision(volume_threshold=float('inf'))
+    growth = abs(len(data) - state['reference']['rows']) / max(state['reference']['rows'], 1)
+    return decision['retrain'] or bool(monitor.unseen_categories()) or growth >= VOLUME_THRESHOLD
+
+def current_classifier(data):
+    # The cached classifier and ``data`` encoded for it; refit first when
+    # the cache is stale (only if there are enough rows to fit on)
+    global _classifier
+    from sklearn.model_selection import train_test_split
+    from ftq_backends import create_backend
+    from ftq_drift import DriftMonitor
+
+    state = _classifier
+    retrain = state is None or classifier_is_stale(state, data)
+    df, feature_cols, categories = build_features(data, None if retrain else state['categories'])
+    if not retrain and feature_cols != state['feature_cols']:
+        retrain = True
+        df, feature_cols, categories = build_features(data)
     X = df[feature_cols].fillna(0)
+
+    if retrain and len(X) >= 10:
+        X_train, X_test, y_train, y_test = train_test_split(X, df['Success'], test_size=0.2, random_state=42)
+        backend = create_backend('classifier')
+        backend.fit(X_train, y_train)
+        state = _classifier = {
+            "backend": backend,
+            "categories": categories,
+            "feature_cols": feature_cols,
+            "accuracy": backend.score(X_test, y_test),
+            "feature_importance": backend.feature_importance(feature_cols),
+            "reference": DriftMonitor.snapshot(data),
+            # Keys the explanation cache: a refit invalidates it
+            "version": (state["version"] + 1) if state else 1,
+        }
+    return state, df, X, retrain
+
+def whatif_engine(data):
+    # Simulation engine over ``data``, scored by the cached classifier when
+    # it fits this data, else by smoothed empirical success rates (few
+    # rows, or no sklearn). Returns (engine, model label, classifier state
+    # or None, features, whether the classifier was just refitted)
+    import pandas as pd
+    from ftq_whatif import RateModel, WhatIfEngine
+
+    state, retrain = None, False
+    if SKLEARN_AVAILABLE:
+        state, df, X, retrain = current_classifier(data)
+        if retrain and len(X) < 10:
+            # Too few rows to refit: the cached classifier is for other data
+            state, retrain = None, False
+    if state is None:
+        df, feature_cols, categories = build_features(data)
+        X = df[feature_cols].fillna(0)
+        model = RateModel(X.values, df['Success'].values, feature_cols)
+        return (WhatIfEngine(X.values, feature_cols, categories, model.success_probability),
+                model.label, None, df, False)
+
+    backend, feature_cols = state['backend'], state['feature_cols']
+    def score(matrix):
+        return backend.success_probability(pd.DataFrame(matrix, columns=feature_cols))
+    return WhatIfEngine(X.values, feature_cols, state['categories'], score), backend.label, state, df, retrain
+
+def train_and_predict(data):
+    engine, model_label, state, df, retrain = whatif_engine(data)
     y = df['Success']
     current_ftq = round((y.sum() / len(y)) * 100, 1)
-    
-    if len(X) < 10:
-        if current_ftq >= 95:
-            predicted_ftq = round(min(current_ftq + random.uniform(0, 2), 99), 1)
-        elif current_ftq >= 90:
-            predicted_ftq = round(min(current_ftq + random.uniform(2, 5), 97), 1)
-        else:
-            predicted_ftq = round(min(current_ftq + random.uniform(3, 8), 95), 1)
-            
+
+    # Same seed on every call: the same data always gets the same prediction
+    simulation = engine.simulate(IMPROVEMENT_SCENARIO, samples=PREDICTION_SAMPLES, seed=0)
+    predicted_ftq = round(simulation['scenario']['mean'], 1)
+    predicted_range = [simulation['scenario']['p5'], simulation['scenario']['p95']]
+
+    if state is None:
         return {
             "current_ftq": current_ftq,
             "predicted_ftq": predicted_ftq,
-            "model_used": "Statistical",
+            "predicted_range": predicted_range,
+            "model_used": model_label,
             "confidence": 0.70
         }
 
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    model = RandomForestClassifier(n_estimators=100, max_depth=10, random_state=42)
-    model.fit(X_train, y_train)
-
-    feature_importance = dict(zip(feature_cols, model.feature_importances_))
-    success_probabilities = model.predict_proba(X)[:, 1]
-    base_predicted_success_rate = np.mean(success_probabilities)
-    
-    improvement_factors = []
-    
-    if 'Rework_time' in df.columns:
-        high_time_mask = df['Rework_time'] > df['Rework_time'].quantile(0.75)
-        if high_time_mask.sum() > 0:
-            potential_improvement = high_time_mask.sum() / len(df) * 0.1
-            improvement_factors.append(potential_improvement)
-    
-    if 'shift_encoded' in df.columns:
-        shift_performance = df.groupby('shift')['Success'].mean()
-        if len(shift_performance) > 1:
-            shift_variance = shift_performance.var()
-            if shift_variance > 0.01:
-                improvement_factors.append(shift_variance * 0.5)
-    
-    if 'Line_encoded' in df.columns:
-        line_performance = df.groupby('Line')['Success'].mean()
-        if len(line_performance) > 1:
-            line_variance = line_performance.var()
-            if line_variance > 0.01:
-                improvement_factors.append(line_variance * 0.3)
-    
-    total_improvement = sum(improvement_factors)
-    predicted_success_rate = min(base_predicted_success_rate + total_improvement, 0.98)
-    predicted_ftq = round(predicted_success_rate * 100, 1)
-    
-    accuracy = model.score(X_test, y_test)
-    confidence = round(accuracy, 2)
-
+    backend = state['backend']
     return {
         "current_ftq": current_ftq,
         "predicted_ftq": predicted_ftq,
-        "model_used": "Random Forest Classifier",
-        "confidence": confidence,
-        "feature_importance": feature_importance,
-        "improvement_potential": round(total_improvement * 100, 1),
-        "total_samples": len(X)
+        "predicted_range": predicted_range,
+        "model_used": backend.label,
+        "confidence": round(state['accuracy'], 2),
+        "feature_importance": state['feature_importance'],
+        "improvement_potential": round(simulation['delta']['mean'], 1),
+        "total_samples": len(df),
+        "features_used": len(state['feature_cols']),
+        "model_description": backend.describe(),
+        "retrained": retrain
+    }
+
+def explain_predictions(data, group_by=("Area", "Line"), include_rows=False):
+    # Tree-path contributions to P(Success) for each record, summed up per
+    # group (e.g. "Motor Line 3"). Groups whose rows were already explained
+    # by this classifier version come from the cache; the others are
+    # computed together in one batch.
+    import hashlib
+    import numpy as np
+    import pandas as pd
+
+    data = ingest_records(data or [], source="explain request")
+    if not data:
+        raise ValueError("No data provided")
+    state, df, X, _ = current_classifier(data)
+    if len(X) < 10:
+        raise ValueError("At least 10 records are needed to fit the classifier")
+    backend = state['backend']
+    version = state['version']
+    feature_cols = list(X.columns)
+    values = X.to_numpy(dtype=float)
+
+    columns = [col for col in group_by if col in df.columns]
+    labels = df[columns].astype(str).agg(' '.join, axis=1) if columns else pd.Series('all', index=df.index)
+    keys, pending = {}, []
+    for label, index in labels.groupby(labels).indices.items():
+        digest = hashlib.blake2b(values[index].tobytes(), digest_size=16).hexdigest()
+        keys[label] = (version, label, digest), index
+        if keys[label][0] not in _explanations:
+            pending.append(label)
+
+    cached_groups = len(keys) - len(pending)
+    if pending:
+        rows = np.concatenate([keys[label][1] for label in pending])
+        result = backend.contributions(values[rows])
+        if result is None:
+            raise ValueError(f"The {backend.name} backend does not provide per-feature contributions")
+        bias, contributions = result
+        # Entries of older classifier versions can never be hit again
+        for key in [key for key in _explanations if key[0] != version]:
+            del _explanations[key]
+        start = 0
+        for label in pending:
+            key, index = keys[label]
+            _explanations[key] = (bias, contributions[start:start + len(index)])
+            start += len(index)
+        while len(_explanations) > EXPLAIN_CACHE_SIZE:
+            del _explanations[next(iter(_explanations))]
+
+    groups, row_explanations = [], []
+    for label, (key, index) in keys.items():
+        bias, contributions = _explanations.get(key) or backend.contributions(values[index])
+        predicted = bias + contributions.sum(axis=1)
+        mean = contributions.mean(axis=0)
+        order = np.argsort(-np.abs(mean))
+        groups.append({
+            "group": label,
+            "rows": len(index),
+            "current_ftq": round(float(df['Success'].iloc[index].mean()) * 100, 1),
+            "predicted_ftq": round(float(predicted.mean()) * 100, 1),
+            # FTQ points, largest effect first
+            "contributions": [
+                {"feature": feature_cols[i], "contribution": round(float(mean[i]) * 100, 2)} for i in order
+            ],
+        })
+        if include_rows:
+            for position, row in zip(index, contributions):
+                row_explanations.append({
+                    "row": int(position),
+                    "group": label,
+                    "predicted_success": round(float(bias + row.sum()), 4),
+                    "contributions": {feature_cols[i]: round(float(row[i]), 4) for i in range(len(feature_cols))},
+                })
+
+    groups.sort(key=lambda group: group['predicted_ftq'])
+    explanation = {
+        "model_version": version,
+        "model_used": backend.label,
+        "base_ftq": round(float(bias) * 100, 1),
+        "group_by": columns,
+        "groups": groups,
+        "cached_groups": cached_groups,
+        "computed_groups": len(pending),
     }
+    if include_rows:
+        explanation["rows"] = sorted(row_explanations, key=lambda row: row['row'])
+    return explanation
+
+def simulate_whatif(data, interventions, samples=None, rows_per_sample=None, seed=0):
+    # Monte Carlo FTQ distributions with and without ``interventions``
+    from ftq_whatif import ROWS_PER_SAMPLE, SAMPLES
+
+    data = ingest_records(data or [], source="what-if request")
+    if not data:
+        raise ValueError("No data provided")
+    engine, model_label, state, _, _ = whatif_engine(data)
+    simulation = engine.simulate(interventions, samples=int(samples or SAMPLES),
+                                 rows_per_sample=int(rows_per_sample or ROWS_PER_SAMPLE), seed=int(seed))
+    simulation["model_used"] = model_label
+    simulation["model_version"] = state["version"] if state else None
+    return simulation
+
+# The realtime backend's dataset (REWORK_DATA_FILE), parsed once per change
+dataset = Dataset()
+# Compact JSON (and its gzip/brotli variants) of the current dataset version
+_data_file_body = RepresentationCache(
+    lambda: json.dumps(dataset.records(), separators=(',', ':')).encode('utf-8')
+)
+
+def data_file_response(headers):
+    # (status, body, headers) of a GET of the dataset for the request
+    # ``headers``, shared by this app and asgi_app; None without the file
+    # (the synthetic fallback data changes on every call: nothing to cache)
+    if not dataset.exists():
+        return None
+    dataset.refresh()
+    # Repeat polls of an unchanged dataset get a 304 and no body
+    return conditional(headers, dataset.etag, dataset.modified_at, _data_file_body, dataset.version)
 
 def load_data_from_file():
-    possible_paths = [
-        "frontend/public/backend/data/data.json",
-        "../frontend/public/backend/data/data.json",
-        "public/backend/data/data.json",
-        "data.json"
-    ]
-    
-    for path in possible_paths:
-        if os.path.exists(path):
-            try:
-                with open(path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                return data
-            except Exception as e:
-                continue
-    
-    return generate_fallback_data()
+    if not dataset.exists():
+        return generate_fallback_data()
+    return dataset.records()
 
 def generate_fallback_data(length=75):
     data = []
@@ -265,7 +412,10 @@ def analyze_lines(df):
     }
 
 def analyze_data_and_predict(data):
+    import pandas as pd
+
     try:
+        data = ingest_records(data or [], source="prediction request")
         if not data:
             raise ValueError("No data provided")
         
@@ -281,6 +431,7 @@ def analyze_data_and_predict(data):
             prediction = {
                 "current_ftq": rf_results['current_ftq'],
                 "predicted_ftq": rf_results['predicted_ftq'],
+                "predicted_range": rf_results['predicted_range'],
                 "confidence": rf_results['confidence'],
                 "total_defects": total_defects,
                 "avg_rework_time": avg_rework_time,
@@ -288,9 +439,10 @@ def analyze_data_and_predict(data):
                 "line_analysis": line_analysis,
                 "model_info": {
                     "algorithm": rf_results['model_used'],
-                    "n_estimators": 100,
-                    "max_depth": 10,
-                    "features_used": len(rf_results.get('feature_importance', {})),
+                    "n_estimators": rf_results.get('model_description', {}).get('n_estimators', 0),
+                    "max_depth": rf_results.get('model_description', {}).get('max_depth', 0),
+                    "features_used": rf_results.get('features_used', 0),
+                    "retrained": rf_results.get('retrained', False),
                     "improvement_potential": rf_results.get('improvement_potential', 0)
                 }
             }
@@ -302,12 +454,7 @@ def analyze_data_and_predict(data):
                 good_rework = len(df[df['Rework_time'] < df['Rework_time'].median()])
                 current_ftq = round((good_rework / total_defects) * 100, 1)
             
-            if current_ftq >= 95:
-                predicted_ftq = round(min(current_ftq + random.uniform(0, 2), 99), 1)
-            elif current_ftq >= 90:
-                predicted_ftq = round(min(current_ftq + random.uniform(2, 5), 97), 1)
-            else:
-                predicted_ftq = round(min(current_ftq + random.uniform(3, 8), 95), 1)
+            predicted_ftq = train_and_predict(data)['predicted_ftq']
             
             prediction = {
                 "current_ftq": current_ftq,
@@ -378,14 +525,88 @@ def predict_ftq():
         error_response.headers.add('Access-Control-Allow-Origin', '*')
         return error_response, 500
 
+@app.route('/api/ftq/explain', methods=['POST', 'OPTIONS'])
+def explain_ftq():
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+
+    try:
+        request_data = request.json or {}
+        data = request_data.get('defects') or load_data_from_file()
+        group_by = request_data.get('group_by', ['Area', 'Line'])
+        if isinstance(group_by, str):
+            group_by = [group_by]
+
+        explanation = explain_predictions(data, group_by, bool(request_data.get('include_rows', False)))
+
+        response = jsonify({
+            "status": "success",
+            "explanation": explanation
+        })
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+
+    except (TypeError, ValueError) as e:
+        # Bad request data, e.g. too few records to fit the classifier
+        error_response = jsonify({"status": "error", "error": str(e)})
+        error_response.headers.add('Access-Control-Allow-Origin', '*')
+        return error_response, 400
+    except Exception as e:
+        error_response = jsonify({
+            "status": "error",
+            "error": str(e)
+        })
+        error_response.headers.add('Access-Control-Allow-Origin', '*')
+        return error_response, 500
+
+@app.route('/api/ftq/whatif', methods=['POST', 'OPTIONS'])
+def whatif_ftq():
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+
+    try:
+        request_data = request.json or {}
+        simulation = simulate_whatif(
+            request_data.get('defects') or load_data_from_file(),
+            request_data.get('interventions', []),
+            request_data.get('samples'),
+            request_data.get('rows_per_sample'),
+            request_data.get('seed', 0),
+        )
+        response = jsonify({
+            "status": "success",
+            "simulation": simulation
+        })
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+
+    except (TypeError, ValueError) as e:
+        error_response = jsonify({"status": "error", "error": str(e)})
+        error_response.headers.add('Access-Control-Allow-Origin', '*')
+        return error_response, 400
+    except Exception as e:
+        error_response = jsonify({
+            "status": "error",
+            "error": str(e)
+        })
+        error_response.headers.add('Access-Control-Allow-Origin', '*')
+        return error_response, 500
+
 @app.route('/backend/data/data.json', methods=['GET', 'OPTIONS'])
 def get_test_data():
     if request.method == 'OPTIONS':
         return jsonify({}), 200
         
     try:
-        data = load_data_from_file()
-        response = jsonify(data)
+        cached = data_file_response(request.headers)
+        if cached is None:
+            response = jsonify(load_data_from_file())
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            return response
+
+        status, body, headers = cached
+        response = app.response_class(body or b'', status=status, mimetype='application/json')
+        response.headers.update(headers)
         response.headers.add('Access-Control-Allow-Origin', '*')
         return response
     except Exception as e:
@@ -404,6 +625,39 @@ def health_check():
     response.headers.add('Access-Control-Allow-Origin', '*')
     return response
 
+def warm_up():
+    try:
+        analyze_data_and_predict(load_data_from_file())
+        logger.info("Warm-up prediction done, ML stack loaded")
+    except Exception as e:
+        logger.warning(f"Warm-up failed: {e}")
+    finally:
+        _warmed_up.set()
+
+def start_warm_up():
+    global _warmup_thread
+    if WARMUP and _warmup_thread is None:
+        _warmup_thread = threading.Thread(target=warm_up, name="ftq-warmup", daemon=True)
+        _warmup_thread.start()
+
+def readiness():
+    # Liveness (/health) only says the process answers; readiness says a
+    # prediction will not pay the cold import and first-fit cost
+    ready = _warmed_up.is_set() or _warmup_thread is None
+    return ready, {
+        "status": "ready" if ready else "warming_up",
+        "warmed_up": _warmed_up.is_set(),
+        "sklearn_status": "Available" if SKLEARN_AVAILABLE else "Not Available",
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.route('/ready', methods=['GET'])
+def ready_check():
+    ready, body = readiness()
+    response = jsonify(body)
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response, 200 if ready else 503
+
 @app.route('/')
 def home():
     sklearn_status = "Available" if SKLEARN_AVAILABLE else "Not Available"
@@ -480,4 +734,6 @@ if __name__ == '__main__':
         logger.info("Random Forest Classifier ready")
     else:
         logger.warning("Install scikit-learn for Random Forest: pip install scikit-learn")
+    dataset.watch()
+    start_warm_up()
     app.run(debug=True, port=5000, host='0.0.0.0')
@@ -0,0 +1,233 @@
+import os
+import json
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import HTMLResponse, JSONResponse, Response
+import uvicorn
+
+from app import (
+    SKLEARN_AVAILABLE,
+    WARMUP,
+    analyze_data_and_predict,
+    data_file_response,
+    dataset,
+    explain_predictions,
+    load_data_from_file,
+    home,
+    simulate_whatif,
+    warm_up,
+)
+from single_flight import SingleFlight, fingerprint
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Concurrency settings (overridable through the environment)
+PROCESS_WORKERS = int(os.environ.get("FTQ_PROCESS_WORKERS", os.cpu_count() or 1))
+MAX_CONCURRENCY = int(os.environ.get("FTQ_MAX_CONCURRENCY", PROCESS_WORKERS * 2))
+QUEUE_TIMEOUT = float(os.environ.get("FTQ_QUEUE_TIMEOUT", 30))
+CACHE_TTL = float(os.environ.get("FTQ_CACHE_TTL", 5))
+CACHE_SIZE = int(os.environ.get("FTQ_CACHE_SIZE", 128))
+
+app = FastAPI(title="FTQ Analytics API")
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+_executor = None
+_slots = None
+_warmup = None
+predictions = SingleFlight(ttl=CACHE_TTL, max_entries=CACHE_SIZE)
+
+
+class OverloadedError(Exception):
+    pass
+
+
+def predict_from_body(body):
+    # Runs inside a pool process: parsing and the pandas/sklearn work both
+    # happen off the event loop.
+    request_data = json.loads(body) if body else None
+    if not request_data or 'defects' not in request_data:
+        data = load_data_from_file()
+    else:
+        data = request_data['defects']
+    return analyze_data_and_predict(data)
+
+
+def explain_from_body(body):
+    # Same as predict_from_body, for the per-group explanation
+    request_data = json.loads(body) if body else {}
+    data = request_data.get('defects') or load_data_from_file()
+    group_by = request_data.get('group_by', ['Area', 'Line'])
+    if isinstance(group_by, str):
+        group_by = [group_by]
+    return explain_predictions(data, group_by, bool(request_data.get('include_rows', False)))
+
+
+def whatif_from_body(body):
+    # Same as predict_from_body, for the what-if simulation
+    request_data = json.loads(body) if body else {}
+    return simulate_whatif(
+        request_data.get('defects') or load_data_from_file(),
+        request_data.get('interventions', []),
+        request_data.get('samples'),
+        request_data.get('rows_per_sample'),
+        request_data.get('seed', 0),
+    )
+
+
+async def run_in_pool(function, body):
+    # Bounded by the same slots as predictions: explanations and what-if
+    # simulations use the same models and compete for the same workers
+    try:
+        await asyncio.wait_for(_slots.acquire(), timeout=QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise OverloadedError("Prediction queue is full, retry later")
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, function, body)
+    finally:
+        _slots.release()
+
+
+async def run_prediction(body):
+    return await run_in_pool(predict_from_body, body)
+
+
+async def warm_up_workers():
+    # One warm-up per worker: each process has its own imports to load
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(
+        loop.run_in_executor(_executor, warm_up) for _ in range(PROCESS_WORKERS)
+    ))
+
+
+@app.on_event("startup")
+async def on_startup():
+    global _executor, _slots, _warmup
+    _executor = ProcessPoolExecutor(max_workers=PROCESS_WORKERS)
+    _slots = asyncio.Semaphore(MAX_CONCURRENCY)
+    dataset.watch()
+    if WARMUP:
+        _warmup = asyncio.ensure_future(warm_up_workers())
+    logger.info(
+        f"FTQ ASGI API ready: {PROCESS_WORKERS} worker processes, "
+        f"{MAX_CONCURRENCY} concurrent predictions"
+    )
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
+
+
+@app.post("/api/ftq/predict")
+async def predict_ftq(request: Request):
+    try:
+        body = await request.body()
+        prediction = await predictions.run(fingerprint(body), run_prediction, body)
+        return {
+            "status": "success",
+            "prediction": prediction
+        }
+    except OverloadedError as e:
+        return JSONResponse({"status": "error", "error": str(e)}, status_code=503)
+    except Exception as e:
+        return JSONResponse({"status": "error", "error": str(e)}, status_code=500)
+
+
+@app.post("/api/ftq/explain")
+async def explain_ftq(request: Request):
+    try:
+        body = await request.body()
+        explanation = await run_in_pool(explain_from_body, body)
+        return {
+            "status": "success",
+            "explanation": explanation
+        }
+    except OverloadedError as e:
+        return JSONResponse({"status": "error", "error": str(e)}, status_code=503)
+    except (TypeError, ValueError) as e:
+        return JSONResponse({"status": "error", "error": str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse({"status": "error", "error": str(e)}, status_code=500)
+
+
+@app.post("/api/ftq/whatif")
+async def whatif_ftq(request: Request):
+    try:
+        body = await request.body()
+        simulation = await run_in_pool(whatif_from_body, body)
+        return {
+            "status": "success",
+            "simulation": simulation
+        }
+    except OverloadedError as e:
+        return JSONResponse({"status": "error", "error": str(e)}, status_code=503)
+    except (TypeError, ValueError) as e:
+        return JSONResponse({"status": "error", "error": str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse({"status": "error", "error": str(e)}, status_code=500)
+
+
+@app.get("/backend/data/data.json")
+async def get_test_data(request: Request):
+    try:
+        # Parsing and compression run once per version, off the event loop
+        cached = await asyncio.to_thread(data_file_response, request.headers)
+        if cached is None:
+            return await asyncio.to_thread(load_data_from_file)
+        status, body, headers = cached
+        return Response(body or b"", status_code=status, headers=headers, media_type="application/json")
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+@app.get("/health")
+async def health_check():
+    return {
+        "status": "healthy",
+        "sklearn_status": "Available" if SKLEARN_AVAILABLE else "Not Available",
+        "timestamp": datetime.now().isoformat(),
+        "concurrency": {
+            "process_workers": PROCESS_WORKERS,
+            "max_concurrency": MAX_CONCURRENCY
+        },
+        "prediction_dedup": predictions.stats()
+    }
+
+
+@app.get("/ready")
+async def ready_check():
+    ready = _warmup is None or _warmup.done()
+    body = {
+        "status": "ready" if ready else "warming_up",
+        "warmed_up": _warmup is not None and _warmup.done(),
+        "sklearn_status": "Available" if SKLEARN_AVAILABLE else "Not Available",
+        "timestamp": datetime.now().isoformat()
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+
+@app.get("/", response_class=HTMLResponse)
+async def index():
+    return home()
+
+
+if __name__ == '__main__':
+    if SKLEARN_AVAILABLE:
+        logger.info("Random Forest Classifier ready")
+    else:
+        logger.warning("Install scikit-learn for Random Forest: pip install scikit-learn")
+    uvicorn.run(app, host='0.0.0.0', port=5000)
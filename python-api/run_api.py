@@ -13,6 +13,8 @@ def install_dependencies():
     dependencies = [
         "flask",
         "flask-cors", 
+        "fastapi",
+        "uvicorn",
         "pandas",
         "numpy"
     ]
@@ -54,8 +56,8 @@ def start_api():
         return False
     
     try:
-        # Démarrer l'API
-        subprocess.run([sys.executable, "app.py"], check=True)
+        # Démarrer l'API (serveur ASGI, calculs dans un pool de processus)
+        subprocess.run([sys.executable, "asgi_app.py"], check=True)
         return True
     except subprocess.CalledProcessError as e:
         print(f"❌ Erreur lors du démarrage de l'API: {e}")
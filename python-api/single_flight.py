@@ -0,0 +1,80 @@
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+
+
+def fingerprint(payload):
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+class SingleFlight:
+    """Share one computation between identical concurrent calls.
+
+    Callers with the same key wait on the same in-flight task; once it
+    finishes, the result stays in a small LRU cache for ``ttl`` seconds.
+    Failures are never cached.
+    """
+
+    def __init__(self, ttl=5.0, max_entries=128):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._inflight = {}
+        self._cache = OrderedDict()
+        self.requests = 0
+        self.computations = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+
+    def _cached(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry
+
+    def _store(self, key, task):
+        if task.cancelled() or task.exception() is not None or self.ttl <= 0:
+            return
+        self._cache[key] = (time.monotonic() + self.ttl, task.result())
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def _finish(self, key, task):
+        self._inflight.pop(key, None)
+        self._store(key, task)
+
+    async def run(self, key, coro_fn, *args):
+        self.requests += 1
+        entry = self._cached(key)
+        if entry is not None:
+            self.cache_hits += 1
+            return entry[1]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.computations += 1
+            task = asyncio.ensure_future(coro_fn(*args))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            self.coalesced += 1
+        # shield: one impatient client must not cancel the shared computation
+        return await asyncio.shield(task)
+
+    def stats(self):
+        deduplicated = self.coalesced + self.cache_hits
+        return {
+            "requests": self.requests,
+            "computations": self.computations,
+            "coalesced": self.coalesced,
+            "cache_hits": self.cache_hits,
+            "in_flight": len(self._inflight),
+            "cached_entries": len(self._cache),
+            "dedup_rate": round(deduplicated / self.requests, 3) if self.requests else 0.0,
+            "ttl_seconds": self.ttl
+        }
@@ -1,124 +1,413 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import copy
 import json
+import time
+import uvicorn
 import sys
 import os
 
 # Ajouter le répertoire parent au path pour importer ftq_predictor
+# (importé au premier entraînement : pandas/sklearn ne ralentissent pas le démarrage)
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from ftq_predictor import FTQPredictor
+# Jeu de données partagé avec le backend temps réel (backend/dataset.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from dataset import DATA_FILE, Dataset
+# Coalescence des requêtes identiques, partagée avec python-api/asgi_app.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python-api'))
+from single_flight import SingleFlight, fingerprint
 
-app = Flask(__name__)
-CORS(app)  # Permettre les requêtes cross-origin
+# Limites de concurrence (configurables par variables d'environnement)
+THREAD_WORKERS = int(os.environ.get('FTQ_THREAD_WORKERS', os.cpu_count() or 1))
+MAX_CONCURRENCY = int(os.environ.get('FTQ_MAX_CONCURRENCY', THREAD_WORKERS * 2))
+QUEUE_TIMEOUT = float(os.environ.get('FTQ_QUEUE_TIMEOUT', 30))
+# Entraîner en arrière-plan dès le démarrage (sinon à la première prédiction)
+WARMUP = os.environ.get('FTQ_WARMUP', '1') != '0'
+# Intervalle de contrôle d'une nouvelle version publiée (ftq_serving.py)
+RELOAD_INTERVAL = float(os.environ.get('FTQ_RELOAD_INTERVAL', 5))
+# Reworks historiques (entraînement et prévisions) : le fichier du backend
+# temps réel, sauf FTQ_DATA_PATH
+DATA_PATH = os.environ.get('FTQ_DATA_PATH') or DATA_FILE
+# Horizon maximal de /api/ftq/forecast (en périodes)
+MAX_HORIZON = int(os.environ.get('FTQ_FORECAST_MAX_HORIZON', 60))
 
-# Instance globale du prédicteur
+app = FastAPI(title="API FTQ")
+# Permettre les requêtes cross-origin
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# Instance globale du prédicteur, chargée depuis l'artefact partagé (ftq_serving.py)
 predictor = None
+model_version = None
+# Dérive des reworks reçus depuis l'entraînement de cette version (ftq_drift.py)
+monitor = None
+last_retrain = None
 
-def initialize_predictor():
+# Pool de threads borné pour le travail pandas/sklearn
+executor = ThreadPoolExecutor(max_workers=THREAD_WORKERS, thread_name_prefix='ftq')
+slots = None
+# Prédictions en cours, indexées par empreinte de la requête (sans cache : ttl=0)
+predictions = SingleFlight(ttl=0)
+# Entraînement en cours ou terminé (partagé par le préchauffage et les requêtes)
+training = None
+# Modèles de prévision ajustés, indexés par (version du jeu de données, freq, method) :
+# valables jusqu'à l'arrivée de nouvelles données
+forecasters = {}
+# Vue en mémoire du jeu de données, relue seulement quand il change
+dataset = Dataset(DATA_PATH)
+
+def on_new_data(changed):
+    forecasters.clear()
+    print(f"📂 Nouvelles données chargées (révision {changed.revision}, {len(changed.table)} reworks)")
+
+dataset.subscribe(on_new_data)
+
+def train_predictor(extra_records=None):
     """
-    Initialiser le prédicteur FTQ au démarrage
+    Entraîner un prédicteur FTQ (un seul worker le fait, puis le publie)
     """
-    global predictor
-    print("🚀 Initialisation du prédicteur FTQ...")
-    
+    import pandas as pd
+    from ftq_predictor import FTQPredictor
+    print("🚀 Entraînement du prédicteur FTQ...")
+
     predictor = FTQPredictor()
-    
+
     # Charger et entraîner le modèle
     try:
-        # Essayer de charger les vraies données
-        df = predictor.load_data('public/backend/data/data.json')
+        # Essayer les vraies données
+        if not dataset.exists():
+            raise FileNotFoundError(dataset.path)
+        df = pd.DataFrame(dataset.records())
+        print(f"📊 Données chargées: {len(df)} défauts")
     except:
         # Utiliser des données synthétiques
         print("📊 Utilisation de données synthétiques pour l'entraînement")
         df = predictor.generate_synthetic_data(1000)
-    
+    if extra_records:
+        df = pd.concat([df, pd.DataFrame(extra_records)], ignore_index=True)
+
     # Entraîner le modèle
-    training_results = predictor.train_model(df)
-    print("✅ Prédicteur FTQ initialisé et entraîné")
-    
-    return training_results
+    predictor.train_model(df)
+    print("✅ Prédicteur FTQ entraîné")
+
+    return predictor
+
+def initialize_predictor():
+    """
+    Charger la version publiée du modèle (mémoire mappée, partagée entre
+    workers) ; le premier worker sans version l'entraîne et la publie
+    """
+    from ftq_serving import load_or_train
+    set_predictor(*load_or_train(train_predictor))
+    print(f"✅ Prédicteur FTQ prêt (version {model_version})")
+
+def set_predictor(new_predictor, version):
+    global predictor, model_version, monitor
+    from ftq_drift import DriftMonitor
+    reference = new_predictor.drift_reference
+    monitor = DriftMonitor(copy.deepcopy(reference)) if reference else None
+    predictor, model_version = new_predictor, version
+
+def reload_if_published():
+    """
+    Basculer sur une nouvelle version publiée ; les prédictions en cours
+    finissent sur l'ancienne
+    """
+    from ftq_serving import current_version, load
+    version = current_version()
+    if version is None or version == model_version:
+        return False
+    set_predictor(load(version), version)
+    print(f"🔄 Nouvelle version du modèle chargée: {version}")
+    return True
+
+async def watch_model_versions():
+    while True:
+        await asyncio.sleep(RELOAD_INTERVAL)
+        if predictor is None:
+            continue
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(executor, reload_if_published)
+        except Exception as e:
+            print(f"⚠️ Rechargement du modèle impossible: {e}")
+        try:
+            await loop.run_in_executor(executor, retrain_if_drifted)
+        except Exception as e:
+            print(f"⚠️ Réentraînement impossible: {e}")
+
+def retrain_if_drifted():
+    """
+    Réentraîner seulement quand la dérive ou le volume de données reçues
+    dépasse les seuils : la part des arbres renouvelés suit la part des
+    données nouvelles, et la nouvelle version est publiée pour tous les workers
+    """
+    global last_retrain
+    if monitor is None:
+        return None
+    decision = monitor.decision()
+    if not decision['retrain']:
+        return None
+
+    import pandas as pd
+    from ftq_serving import current_version, load, publish, training_lock
+    with training_lock():
+        if current_version() != model_version:
+            # Un autre worker vient de publier : rechargement au prochain contrôle
+            return None
+        print(f"📈 Dérive détectée ({', '.join(decision['reasons'])})")
+        records = list(monitor.window)
+        start = time.perf_counter()
+        candidate, trees = None, None
+        if not decision['full']:
+            candidate = load(model_version, mmap_mode=None)
+            try:
+                trees = candidate.refresh(pd.DataFrame(records), decision['change'])
+                monitor.rebase()
+                candidate.drift_reference = monitor.reference
+            except (ValueError, KeyError) as e:
+                print(f"⚠️ Réentraînement partiel impossible ({e}), réentraînement complet")
+                candidate = None
+        if candidate is None:
+            candidate = train_predictor(records)
+        version = publish(candidate)
+
+    set_predictor(load(version), version)
+    last_retrain = {
+        'version': version,
+        'reasons': decision['reasons'],
+        'mode': 'full' if trees is None else 'partial',
+        'trees_refreshed': trees,
+        'rows': len(records),
+        'seconds': round(time.perf_counter() - start, 2),
+    }
+    return last_retrain
+
+async def run_in_executor(fn, *args):
+    """
+    Exécuter un calcul CPU dans le pool, sans dépasser MAX_CONCURRENCY
+    """
+    try:
+        await asyncio.wait_for(slots.acquire(), timeout=QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        return None, JSONResponse({
+            'error': 'File de prédiction saturée, réessayer plus tard',
+            'status': 'error'
+        }, status_code=503)
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, fn, *args), None
+    finally:
+        slots.release()
+
+async def ensure_predictor():
+    """
+    Entraîner le prédicteur une seule fois, hors de la boucle d'événements
+    """
+    global training
+    if training is None or (training.done() and training.exception() is not None):
+        loop = asyncio.get_running_loop()
+        training = asyncio.ensure_future(loop.run_in_executor(executor, initialize_predictor))
+    await asyncio.shield(training)
+
+async def coalesced_prediction(body, current_defects):
+    """
+    Les requêtes identiques simultanées partagent un seul calcul
+    """
+    # La version fait partie de la clé : pas de partage entre deux modèles
+    key = (model_version, fingerprint(body))
+    return await predictions.run(key, run_in_executor, predictor.predict_ftq, current_defects)
+
+@app.on_event("startup")
+async def on_startup():
+    global slots
+    slots = asyncio.Semaphore(MAX_CONCURRENCY)
+    if WARMUP:
+        # Le serveur accepte les connexions pendant l'entraînement ; /api/ready dit quand il est fini
+        asyncio.ensure_future(ensure_predictor())
+    if RELOAD_INTERVAL > 0:
+        asyncio.ensure_future(watch_model_versions())
+    dataset.watch()
 
-@app.route('/api/ftq/predict', methods=['POST'])
-def predict_ftq():
+@app.on_event("shutdown")
+async def on_shutdown():
+    dataset.stop()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+@app.post('/api/ftq/predict')
+async def predict_ftq(request: Request):
     """
     Endpoint pour prédire le FTQ
     """
     try:
         # Récupérer les données de défauts actuels
-        data = request.get_json()
+        body = await request.body()
+        data = json.loads(body)
         current_defects = data.get('defects', [])
-        
-        if not predictor or not predictor.is_trained:
-            return jsonify({
-                'error': 'Prédicteur non initialisé',
-                'status': 'error'
-            }), 500
-        
+
+        # Première requête sans préchauffage : entraîner maintenant
+        await ensure_predictor()
+
+        # Les reworks reçus jamais vus alimentent le suivi de dérive, même si
+        # la prédiction échoue (catégorie inconnue du modèle, par exemple) ;
+        # le client renvoie tout le jeu de données, le moniteur ignore le reste
+        if monitor is not None and current_defects:
+            await asyncio.get_running_loop().run_in_executor(executor, monitor.observe, current_defects)
+
         # Faire la prédiction
-        prediction = predictor.predict_ftq(current_defects)
-        
+        prediction, overloaded = await coalesced_prediction(body, current_defects)
+        if overloaded:
+            return overloaded
+
         if prediction:
-            return jsonify({
+            return {
                 'status': 'success',
                 'prediction': prediction,
                 'message': 'Prédiction FTQ réussie'
-            })
+            }
         else:
-            return jsonify({
+            return JSONResponse({
                 'error': 'Erreur lors de la prédiction',
                 'status': 'error'
-            }), 500
-            
+            }, status_code=500)
+
     except Exception as e:
-        return jsonify({
+        return JSONResponse({
             'error': str(e),
             'status': 'error'
-        }), 500
+        }, status_code=500)
 
-@app.route('/api/ftq/model-info', methods=['GET'])
-def get_model_info():
+@app.get('/api/ftq/model-info')
+async def get_model_info():
     """
     Obtenir les informations sur le modèle
     """
     if not predictor or not predictor.is_trained:
-        return jsonify({
+        return JSONResponse({
             'error': 'Prédicteur non initialisé',
             'status': 'error'
-        }), 500
-    
-    return jsonify({
+        }, status_code=500)
+
+    description = predictor.backend.describe()
+    return {
         'status': 'success',
         'model_info': {
-            'algorithm': 'Random Forest (scikit-learn)',
-            'n_estimators': predictor.model.n_estimators,
-            'max_depth': predictor.model.max_depth,
-            'min_samples_split': predictor.model.min_samples_split,
+            'algorithm': f"{description['algorithm']} (scikit-learn)",
+            'backend': description['backend'],
+            'n_estimators': description['n_estimators'],
+            'max_depth': description['max_depth'],
+            'min_samples_split': predictor.params.get('min_samples_split'),
             'features_count': len(predictor.feature_columns),
-            'is_trained': predictor.is_trained
+            'is_trained': predictor.is_trained,
+            'model_version': model_version
         }
-    })
+    }
+
+@app.get('/api/ftq/drift')
+async def get_drift():
+    """
+    Dérive des reworks reçus par rapport à l'entraînement, et dernier réentraînement
+    """
+    if monitor is None:
+        return JSONResponse({
+            'error': 'Pas de référence de dérive pour ce modèle',
+            'status': 'error'
+        }, status_code=404)
+    return {
+        'status': 'success',
+        'model_version': model_version,
+        'drift': monitor.report(),
+        'decision': monitor.decision(),
+        'last_retrain': last_retrain
+    }
 
-@app.route('/api/health', methods=['GET'])
-def health_check():
+def fit_forecaster(key):
+    """
+    Agréger le jeu de données et ajuster le modèle de prévision (toutes les lignes d'un coup)
+    """
+    from ftq_forecast import Forecaster
+    records = dataset.records()
+    forecaster = Forecaster(records, freq=key[1], method=key[2])
+    # Les modèles ajustés sur une ancienne version des données sont périmés
+    for old in [k for k in forecasters if k[0] != key[0]]:
+        forecasters.pop(old, None)
+    forecasters[key] = forecaster
+    return forecaster
+
+@app.get('/api/ftq/forecast')
+async def get_forecast(horizon: int = 7, freq: str = 'day', method: str = 'seasonal',
+                       production: float = None):
+    """
+    Défauts prévus par Area et Line, et FTQ de l'usine (pour une production
+    journalière `production`), sur les `horizon` prochains jours ou équipes
+    """
+    from ftq_forecast import MODELS, SEASONS, PRODUCTION_TARGET
+    if not 1 <= horizon <= MAX_HORIZON or freq not in SEASONS or method not in MODELS \
+            or (production is not None and production <= 0):
+        return JSONResponse({
+            'error': f"Paramètres invalides : horizon entre 1 et {MAX_HORIZON}, "
+                     f"freq parmi {sorted(SEASONS)}, method parmi {sorted(MODELS)}, production > 0",
+            'status': 'error'
+        }, status_code=400)
+
+    try:
+        dataset.refresh()
+        key = (dataset.version, freq, method)
+        forecaster = forecasters.get(key)
+        if forecaster is None:
+            forecaster, overloaded = await run_in_executor(fit_forecaster, key)
+            if overloaded:
+                return overloaded
+        daily_production = production if production is not None else PRODUCTION_TARGET / 30
+        return {
+            'status': 'success',
+            'forecast': forecaster.forecast(horizon, daily_production)
+        }
+    except Exception as e:
+        return JSONResponse({
+            'error': str(e),
+            'status': 'error'
+        }, status_code=500)
+
+@app.get('/api/health')
+async def health_check():
     """
     Vérification de l'état de l'API
     """
-    return jsonify({
+    return {
         'status': 'healthy',
         'predictor_ready': predictor is not None and predictor.is_trained,
         'message': 'API FTQ opérationnelle'
-    })
+    }
+
+@app.get('/api/ready')
+async def ready_check():
+    """
+    Prêt à prédire : modèle entraîné (distinct de /api/health, qui répond dès le démarrage)
+    """
+    ready = predictor is not None and predictor.is_trained
+    return JSONResponse({
+        'status': 'ready' if ready else 'warming_up',
+        'predictor_ready': ready
+    }, status_code=200 if ready else 503)
 
 if __name__ == '__main__':
-    # Initialiser le prédicteur au démarrage
-    training_results = initialize_predictor()
-    
     print("\n🌐 Démarrage de l'API FTQ...")
     print("📡 Endpoints disponibles:")
     print("   - POST /api/ftq/predict - Prédiction FTQ")
     print("   - GET /api/ftq/model-info - Infos modèle")
+    print("   - GET /api/ftq/drift - Dérive des données")
+    print("   - GET /api/ftq/forecast?horizon=7&freq=day - Défauts par ligne, FTQ usine")
     print("   - GET /api/health - État de l'API")
+    print("   - GET /api/ready - Modèle prêt")
     print("\n🚀 API prête sur http://localhost:5000")
-    
-    # Démarrer le serveur Flask
-    app.run(debug=True, host='0.0.0.0', port=5000)
+
+    # Démarrer le serveur ASGI (le prédicteur est initialisé au démarrage)
+    uvicorn.run(app, host='0.0.0.0', port=5000)
@@ -0,0 +1,336 @@
+"""
+Backends de modèles pour la prédiction FTQ
+
+Chaque backend enveloppe un estimateur scikit-learn derrière la même
+interface (fit / predict / success_probability / spread / describe), pour
+les deux tâches :
+  - 'regressor'  : FTQ journalier (FTQPredictor, scripts/ftq_api.py)
+  - 'classifier' : Success d'un rework (train_and_predict, python-api/app.py)
+
+Le backend est choisi par FTQ_MODEL_BACKEND, sinon par l'artefact
+models/ftq_model.json, sinon 'random_forest'.
+
+Benchmark (mêmes plis temporels que ftq_tuning.py) :
+    python ftq_backends.py --data ../frontend/public/backend/data/data.json --task classifier
+"""
+
+import argparse
+import json
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+
+MODEL_CONFIG_PATH = os.environ.get(
+    'FTQ_MODEL_CONFIG',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'ftq_model.json')
+)
+
+
+class ModelBackend:
+    """
+    Interface commune ; sklearn n'est importé qu'à la création du modèle
+    """
+    name = None
+    label = None
+    defaults = {'regressor': {}, 'classifier': {}}
+
+    def __init__(self, task, params=None):
+        if task not in ('regressor', 'classifier'):
+            raise ValueError(f"Tâche inconnue: {task}")
+        self.task = task
+        self.params = {**self.defaults[task], **(params or {})}
+        self.model = self.create()
+
+    def create(self):
+        raise NotImplementedError
+
+    def fit(self, X, y):
+        self.model.fit(X, y)
+        return self
+
+    def predict(self, X):
+        return self.model.predict(X)
+
+    def predict_proba(self, X):
+        return self.model.predict_proba(X)
+
+    def success_probability(self, X):
+        """
+        P(Success = 1) par ligne, même si l'entraînement n'a vu qu'une classe
+        """
+        proba = self.predict_proba(X)
+        classes = list(self.model.classes_)
+        if 1 in classes:
+            return proba[:, classes.index(1)]
+        return np.zeros(len(proba))
+
+    def score(self, X, y):
+        return float(self.model.score(X, y))
+
+    def spread(self, X):
+        """
+        Dispersion par ligne des prédictions (None si le modèle n'en fournit pas)
+        """
+        return None
+
+    def predict_with_spread(self, X):
+        return self.predict(X), self.spread(X)
+
+    def contributions(self, X):
+        """
+        (biais, contributions par ligne et variable) de la prédiction, en
+        P(Success = 1) pour la classification ; None si le modèle n'en fournit pas
+        """
+        return None
+
+    def feature_importance(self, feature_names):
+        return {}
+
+    def save(self, directory):
+        """
+        Écrire le modèle entraîné dans un artefact de service (ftq_serving.py)
+        """
+        with open(os.path.join(directory, 'model.pkl'), 'wb') as f:
+            pickle.dump(self.model, f)
+
+    @classmethod
+    def load(cls, directory, task, params, mmap_mode='r'):
+        backend = cls(task, params)
+        with open(os.path.join(directory, 'model.pkl'), 'rb') as f:
+            backend.model = pickle.load(f)
+        return backend
+
+    def describe(self):
+        return {
+            'backend': self.name,
+            'algorithm': self.label,
+            'n_estimators': self.params.get('n_estimators', 0),
+            'max_depth': self.params.get('max_depth', 0),
+            'params': self.params,
+        }
+
+
+class RandomForestBackend(ModelBackend):
+    name = 'random_forest'
+    label = 'Random Forest'
+    defaults = {
+        'regressor': {
+            'n_estimators': 100,      # 100 arbres dans la forêt
+            'max_depth': 10,          # Profondeur maximale des arbres
+            'min_samples_split': 5,   # Minimum d'échantillons pour diviser un nœud
+            'min_samples_leaf': 2,    # Minimum d'échantillons dans une feuille
+        },
+        'classifier': {'n_estimators': 100, 'max_depth': 10},
+    }
+
+    def create(self):
+        from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+        self.flat = None
+        estimator = RandomForestRegressor if self.task == 'regressor' else RandomForestClassifier
+        return estimator(**self.params, random_state=42, n_jobs=-1)
+
+    def fit(self, X, y):
+        from ftq_flat_forest import FlatForest
+        self.model.fit(X, y)
+        # Scoring sur la forêt aplatie : mêmes résultats, sans le coût par appel de sklearn
+        self.flat = FlatForest.from_estimator(self.model)
+        return self
+
+    def predict(self, X):
+        return self.flat.predict(X)
+
+    def predict_proba(self, X):
+        return self.flat.predict_proba(X)
+
+    def spread(self, X):
+        return self.flat.predict(X, return_std=True)[1]
+
+    def predict_with_spread(self, X):
+        return self.flat.predict(X, return_std=True)
+
+    def contributions(self, X):
+        bias, contributions = self.flat.contributions(X)
+        if self.task == 'regressor':
+            return float(bias), contributions
+        classes = list(self.flat.classes_)
+        if 1 not in classes:
+            return 0.0, np.zeros(contributions.shape[:2])
+        return float(bias[classes.index(1)]), contributions[..., classes.index(1)]
+
+    def save(self, directory):
+        # Seule la forêt aplatie est servie : pas de pickle des arbres sklearn
+        self.flat.save(os.path.join(directory, 'forest'))
+
+    @classmethod
+    def load(cls, directory, task, params, mmap_mode='r'):
+        from ftq_flat_forest import FlatForest
+        backend = cls(task, params)
+        backend.flat = FlatForest.load(os.path.join(directory, 'forest'), mmap_mode)
+        return backend
+
+    def feature_importance(self, feature_names):
+        return dict(zip(feature_names, self.model.feature_importances_))
+
+
+class HistGradientBoostingBackend(ModelBackend):
+    name = 'hist_gradient_boosting'
+    label = 'Histogram Gradient Boosting'
+    defaults = {
+        'regressor': {'max_iter': 200, 'learning_rate': 0.1, 'max_depth': None, 'min_samples_leaf': 20},
+        'classifier': {'max_iter': 200, 'learning_rate': 0.1, 'max_depth': None, 'min_samples_leaf': 20},
+    }
+
+    def create(self):
+        from sklearn.ensemble import HistGradientBoostingClassifier, HistGradientBoostingRegressor
+        estimator = HistGradientBoostingRegressor if self.task == 'regressor' else HistGradientBoostingClassifier
+        return estimator(**self.params, random_state=42)
+
+    def describe(self):
+        info = super().describe()
+        info['n_estimators'] = self.params['max_iter']
+        return info
+
+
+class LogisticBackend(ModelBackend):
+    """
+    Référence linéaire : régression logistique calibrée (sigmoïde) pour la
+    classification, Ridge pour la régression du FTQ
+    """
+    name = 'logistic'
+    label = 'Calibrated Logistic Regression'
+    defaults = {
+        'regressor': {'alpha': 1.0},
+        'classifier': {'C': 1.0, 'calibration_folds': 3},
+    }
+
+    def create(self):
+        from sklearn.linear_model import LogisticRegression, Ridge
+        from sklearn.pipeline import make_pipeline
+        from sklearn.preprocessing import StandardScaler
+        if self.task == 'regressor':
+            self.label = 'Ridge Regression'
+            return make_pipeline(StandardScaler(), Ridge(alpha=self.params['alpha']))
+        return make_pipeline(StandardScaler(), LogisticRegression(C=self.params['C'], max_iter=1000))
+
+    def fit(self, X, y):
+        if self.task == 'classifier':
+            from sklearn.calibration import CalibratedClassifierCV
+            # Chaque pli de calibration doit contenir les deux classes
+            counts = np.bincount(np.asarray(y, dtype=int), minlength=2)
+            folds = min(self.params['calibration_folds'], int(counts.min()))
+            if folds >= 2:
+                self.model = CalibratedClassifierCV(self.create(), method='sigmoid', cv=folds)
+        self.model.fit(X, y)
+        return self
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (RandomForestBackend, HistGradientBoostingBackend, LogisticBackend)
+}
+
+
+def load_model_config(task, backend=None):
+    """
+    (nom du backend, paramètres réglés) pour une tâche. Les paramètres de
+    l'artefact ne s'appliquent qu'au backend pour lequel ils ont été réglés.
+    """
+    try:
+        with open(MODEL_CONFIG_PATH, 'r', encoding='utf-8') as f:
+            section = json.load(f)[task]
+    except (OSError, ValueError, KeyError):
+        section = {}
+    tuned_backend = section.get('backend', RandomForestBackend.name)
+    name = backend or os.environ.get('FTQ_MODEL_BACKEND') or tuned_backend
+    if name not in BACKENDS:
+        raise ValueError(f"Backend inconnu: {name} (disponibles: {', '.join(BACKENDS)})")
+    return name, section.get('params', {}) if name == tuned_backend else {}
+
+
+def create_backend(task, backend=None, params=None):
+    name, tuned_params = load_model_config(task, backend)
+    return BACKENDS[name](task, tuned_params if params is None else params)
+
+
+def load_backend(directory, name, task, params, mmap_mode='r'):
+    return BACKENDS[name].load(directory, task, params, mmap_mode)
+
+
+# ------------------ Benchmark ------------------
+def _median_ms(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1000)
+
+
+def benchmark(X, y, folds, task, backends=None, single_row_repeat=50):
+    """
+    Temps d'entraînement, latence unitaire et par lot, taille et qualité de
+    chaque backend, sur exactement les mêmes plis
+    """
+    from sklearn.metrics import accuracy_score, log_loss, mean_squared_error
+
+    report = []
+    for name in backends or BACKENDS:
+        fit_s, single_ms, batch_ms, sizes, scores, accuracies = [], [], [], [], [], []
+        for train, val in folds:
+            backend = BACKENDS[name](task)
+            start = time.perf_counter()
+            backend.fit(X[train], y[train])
+            fit_s.append(time.perf_counter() - start)
+
+            row = X[val][:1]
+            single_ms.append(_median_ms(lambda: backend.predict(row), single_row_repeat))
+            batch_ms.append(_median_ms(lambda: backend.predict(X[val]), 5) / len(val) * 1000)
+            sizes.append(len(pickle.dumps(backend.model)) / 1024)
+
+            if task == 'regressor':
+                scores.append(float(np.sqrt(mean_squared_error(y[val], backend.predict(X[val])))))
+            else:
+                proba = backend.success_probability(X[val])
+                scores.append(float(log_loss(y[val], np.column_stack([1 - proba, proba]), labels=[0, 1])))
+                accuracies.append(float(accuracy_score(y[val], (proba >= 0.5).astype(int))))
+
+        result = {
+            'backend': name,
+            'fit_s': round(float(np.mean(fit_s)), 3),
+            'single_row_ms': round(float(np.mean(single_ms)), 3),
+            'batch_us_per_row': round(float(np.mean(batch_ms)), 2),
+            'size_kb': round(float(np.mean(sizes)), 1),
+            ('rmse' if task == 'regressor' else 'log_loss'): round(float(np.mean(scores)), 4),
+        }
+        if accuracies:
+            result['accuracy'] = round(float(np.mean(accuracies)), 4)
+        report.append(result)
+    return report
+
+
+def main():
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from ftq_predictor import FTQPredictor
+    from ftq_tuning import classifier_matrix, regressor_matrix, time_folds
+
+    parser = argparse.ArgumentParser(description="Benchmark des backends FTQ")
+    parser.add_argument('--data', default=None, help="data.json (défaut : REWORK_DATA_FILE)")
+    parser.add_argument('--task', choices=['regressor', 'classifier'], default='classifier')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--backends', nargs='*', choices=sorted(BACKENDS))
+    args = parser.parse_args()
+
+    df = FTQPredictor().load_data(args.data)
+    dates, X, y = (regressor_matrix if args.task == 'regressor' else classifier_matrix)(df)
+    report = benchmark(X, y, time_folds(dates, args.folds), args.task, args.backends)
+
+    print(f"\n⏱️  Backends FTQ ({args.task}, {args.folds} plis temporels, {len(X)} lignes)")
+    for result in report:
+        print("   " + json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
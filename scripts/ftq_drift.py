@@ -0,0 +1,327 @@
+"""
+Surveillance de dérive des données FTQ et déclenchement du réentraînement
+
+Au moment de l'entraînement, on garde un instantané de référence :
+histogramme de chaque variable numérique (bornes = quantiles de
+l'entraînement), fréquences de chaque catégorie, taux de Success et
+nombre de reworks par clé (ORDNR, REWORK_DATE). Les reworks reçus ensuite
+mettent à jour les mêmes compteurs (O(1) par ligne), une seule fois
+chacun : pour une clé, seules les occurrences au-delà de celles déjà vues
+(dans la référence ou depuis) sont nouvelles. Renvoyer le même jeu de
+données ne compte donc pas comme des données nouvelles ; une même clé peut
+légitimement revenir plusieurs fois (plusieurs défauts d'un ordre).
+PSI et KS sont calculés sur ces compteurs, sans relire les données.
+
+Un réentraînement n'est proposé que si la dérive ou le volume de données
+nouvelles dépasse un seuil. La part du modèle à réentraîner (`change`) est
+celle des données nouvelles, bornée par min_change.
+"""
+
+import base64
+import hashlib
+import math
+import os
+import threading
+from collections import deque
+
+import numpy as np
+
+# Seuils (configurables par variables d'environnement)
+PSI_THRESHOLD = float(os.environ.get('FTQ_DRIFT_PSI', 0.2))
+KS_THRESHOLD = float(os.environ.get('FTQ_DRIFT_KS', 0.15))
+SUCCESS_THRESHOLD = float(os.environ.get('FTQ_DRIFT_SUCCESS', 0.05))
+VOLUME_THRESHOLD = float(os.environ.get('FTQ_DRIFT_VOLUME', 0.25))
+MIN_ROWS = int(os.environ.get('FTQ_DRIFT_MIN_ROWS', 200))
+WINDOW_ROWS = int(os.environ.get('FTQ_DRIFT_WINDOW', 50000))
+
+NUMERIC_FEATURES = ('Rework_time', 'hour')
+CATEGORICAL_FEATURES = ('Area', 'Line', 'Defect_type', 'shift')
+N_BINS = 10
+# Lissage des proportions nulles dans le PSI
+EPSILON = 1e-4
+
+
+def rework_features(record):
+    """
+    Valeurs surveillées d'un rework (None si absentes ou illisibles)
+    """
+    values = {}
+    try:
+        values['Rework_time'] = float(record.get('Rework_time'))
+    except (TypeError, ValueError):
+        values['Rework_time'] = None
+    date = str(record.get('REWORK_DATE') or '')
+    values['hour'] = int(date[11:13]) if len(date) >= 13 and date[11:13].isdigit() else None
+    for name in CATEGORICAL_FEATURES:
+        value = record.get(name, record.get(name.lower()))
+        values[name] = None if value in (None, '') else str(value)
+    return values
+
+
+def row_key(record):
+    """
+    Clé stable (entre processus) d'un rework : ORDNR et REWORK_DATE
+    """
+    text = f"{record.get('ORDNR')}|{record.get('REWORK_DATE')}"
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _encode(values, dtype):
+    return base64.b64encode(np.asarray(values, dtype=dtype).tobytes()).decode('ascii')
+
+
+def _decode(text, dtype):
+    return np.frombuffer(base64.b64decode(text or ''), dtype=dtype)
+
+
+def key_counts(keys, counts=None):
+    """
+    (clés triées uniques, nombre max d'occurrences de chacune)
+    """
+    keys = np.asarray(keys, dtype=np.uint64)
+    counts = np.ones(len(keys), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+    unique, inverse = np.unique(keys, return_inverse=True)
+    merged = np.zeros(len(unique), dtype=np.int64)
+    np.maximum.at(merged, inverse.ravel(), counts)
+    return unique, merged
+
+
+def success_flag(record):
+    value = record.get('Success')
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return 1 if value.strip().lower() in ('1', 'true', 'yes', 'ok', 'success') else 0
+    return 1 if value else 0
+
+
+def psi(expected, actual):
+    """
+    Population Stability Index entre deux vecteurs de comptes
+    """
+    expected = np.asarray(expected, dtype=float)
+    actual = np.asarray(actual, dtype=float)
+    if expected.sum() == 0 or actual.sum() == 0:
+        return 0.0
+    p = np.clip(expected / expected.sum(), EPSILON, None)
+    q = np.clip(actual / actual.sum(), EPSILON, None)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+
+def ks(expected, actual):
+    """
+    Statistique de Kolmogorov-Smirnov sur des histogrammes aux mêmes bornes
+    """
+    expected = np.asarray(expected, dtype=float)
+    actual = np.asarray(actual, dtype=float)
+    if expected.sum() == 0 or actual.sum() == 0:
+        return 0.0
+    return float(np.max(np.abs(np.cumsum(expected) / expected.sum() - np.cumsum(actual) / actual.sum())))
+
+
+class DriftMonitor:
+    """
+    Compteurs de référence (entraînement) et compteurs courants (reçus depuis)
+    """
+
+    def __init__(self, reference, window_rows=WINDOW_ROWS):
+        self.reference = reference
+        # Clés triées des reworks de la référence et leurs occurrences
+        # (absentes des anciens instantanés)
+        self.reference_keys = _decode(reference.get('row_keys'), np.uint64)
+        self.reference_counts = _decode(reference.get('row_counts'), np.uint32).astype(np.int64)
+        self.window = deque(maxlen=window_rows)
+        # observe() est appelé depuis plusieurs threads de l'API
+        self._lock = threading.Lock()
+        self._reset_current()
+
+    @staticmethod
+    def snapshot(records):
+        """
+        Instantané de référence, sérialisable en JSON (stocké avec le modèle)
+        """
+        features = [rework_features(record) for record in records]
+        row_keys, row_counts = np.unique(np.array([row_key(r) for r in records], dtype=np.uint64), return_counts=True)
+        flags = [flag for flag in map(success_flag, records) if flag is not None]
+        numeric = {}
+        for name in NUMERIC_FEATURES:
+            values = np.array([f[name] for f in features if f[name] is not None], dtype=float)
+            edges = np.unique(np.quantile(values, np.linspace(0, 1, N_BINS + 1)[1:-1])) if len(values) else []
+            counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+            numeric[name] = {'edges': [float(e) for e in edges], 'counts': counts.tolist()}
+        categorical = {}
+        for name in CATEGORICAL_FEATURES:
+            counts = {}
+            for f in features:
+                if f[name] is not None:
+                    counts[f[name]] = counts.get(f[name], 0) + 1
+            categorical[name] = counts
+        return {
+            'rows': len(records),
+            'row_keys': _encode(row_keys, np.uint64),
+            'row_counts': _encode(row_counts, np.uint32),
+            'success': [sum(flags), len(flags)],
+            'numeric': numeric,
+            'categorical': categorical,
+        }
+
+    @classmethod
+    def from_records(cls, records, **kwargs):
+        return cls(cls.snapshot(records), **kwargs)
+
+    def _reset_current(self):
+        self.rows = 0
+        self.success = [0, 0]
+        self.numeric = {
+            name: np.zeros(len(spec['edges']) + 1, dtype=np.int64)
+            for name, spec in self.reference['numeric'].items()
+        }
+        self.categorical = {name: {} for name in self.reference['categorical']}
+        # Occurrences vues par clé depuis la référence
+        self.seen = {}
+        self.window.clear()
+        self._report = None
+
+    def observe(self, records):
+        """
+        Ajouter aux compteurs courants les reworks reçus jamais vus
+        """
+        with self._lock:
+            self._observe(records)
+
+    def _unseen(self, records):
+        """
+        Reworks de ``records`` au-delà des occurrences déjà vues de leur clé
+        """
+        keys = np.array([row_key(record) for record in records], dtype=np.uint64)
+        known = np.zeros(len(keys), dtype=np.int64)
+        if len(self.reference_keys):
+            position = np.minimum(np.searchsorted(self.reference_keys, keys), len(self.reference_keys) - 1)
+            known = np.where(self.reference_keys[position] == keys, self.reference_counts[position], 0)
+        new = []
+        occurrences = {}
+        for key, record, in_reference in zip(keys.tolist(), records, known.tolist()):
+            occurrences[key] = occurrences.get(key, 0) + 1
+            if occurrences[key] > self.seen.get(key, in_reference):
+                self.seen[key] = occurrences[key]
+                new.append(record)
+        return new
+
+    def _observe(self, records):
+        records = self._unseen(list(records))
+        for record in records:
+            values = rework_features(record)
+            for name, counts in self.numeric.items():
+                if values[name] is not None:
+                    edges = self.reference['numeric'][name]['edges']
+                    counts[np.searchsorted(edges, values[name], side='right')] += 1
+            for name, counts in self.categorical.items():
+                if values[name] is not None:
+                    counts[values[name]] = counts.get(values[name], 0) + 1
+            flag = success_flag(record)
+            if flag is not None:
+                self.success[0] += flag
+                self.success[1] += 1
+            self.window.append(record)
+        self.rows += len(records)
+        self._report = None
+
+    def unseen_categories(self):
+        """
+        Catégories jamais vues à l'entraînement (les encodeurs ne les connaissent pas)
+        """
+        return {
+            name: sorted(set(counts) - set(self.reference['categorical'][name]))
+            for name, counts in self.categorical.items()
+            if set(counts) - set(self.reference['categorical'][name])
+        }
+
+    def report(self):
+        with self._lock:
+            if self._report is None:
+                self._report = self._build_report()
+            return self._report
+
+    def _build_report(self):
+        features = {}
+        for name, counts in self.numeric.items():
+            reference = self.reference['numeric'][name]['counts']
+            features[name] = {'psi': round(psi(reference, counts), 4), 'ks': round(ks(reference, counts), 4)}
+        for name, counts in self.categorical.items():
+            reference = self.reference['categorical'][name]
+            categories = sorted(set(reference) | set(counts))
+            features[name] = {'psi': round(psi([reference.get(c, 0) for c in categories],
+                                                [counts.get(c, 0) for c in categories]), 4)}
+
+        ref_success, ref_total = self.reference['success']
+        success_delta = None
+        if ref_total and self.success[1]:
+            success_delta = round(self.success[0] / self.success[1] - ref_success / ref_total, 4)
+
+        return {
+            'rows_observed': self.rows,
+            'reference_rows': self.reference['rows'],
+            'volume_ratio': round(self.rows / max(self.reference['rows'], 1), 4),
+            'success_rate_delta': success_delta,
+            'max_psi': max((f['psi'] for f in features.values()), default=0.0),
+            'max_ks': max((f.get('ks', 0.0) for f in features.values()), default=0.0),
+            'unseen_categories': self.unseen_categories(),
+            'features': features,
+        }
+
+    def decision(self, psi_threshold=PSI_THRESHOLD, ks_threshold=KS_THRESHOLD,
+                 success_threshold=SUCCESS_THRESHOLD, volume_threshold=VOLUME_THRESHOLD,
+                 min_rows=MIN_ROWS, min_change=0.1):
+        """
+        {'retrain', 'reasons', 'change', 'full'} : change = part du modèle à
+        renouveler ; full si des catégories inconnues imposent de tout refaire
+        """
+        report = self.report()
+        reasons = []
+        if report['volume_ratio'] >= volume_threshold:
+            reasons.append(f"volume {report['volume_ratio']:.2f} >= {volume_threshold}")
+        if self.rows >= min_rows:
+            if report['max_psi'] >= psi_threshold:
+                reasons.append(f"psi {report['max_psi']:.3f} >= {psi_threshold}")
+            if report['max_ks'] >= ks_threshold:
+                reasons.append(f"ks {report['max_ks']:.3f} >= {ks_threshold}")
+            if report['success_rate_delta'] is not None and abs(report['success_rate_delta']) >= success_threshold:
+                reasons.append(f"success rate {report['success_rate_delta']:+.3f}")
+        full = bool(reasons) and bool(report['unseen_categories'])
+        change = self.rows / (self.reference['rows'] + self.rows) if self.rows else 0.0
+        return {
+            'retrain': bool(reasons),
+            'reasons': reasons,
+            'change': 1.0 if full else round(min(1.0, max(change, min_change)), 4),
+            'full': full,
+        }
+
+    def rebase(self):
+        """
+        Après réentraînement : les données reçues rejoignent la référence
+        (les bornes numériques restent celles de l'entraînement initial)
+        """
+        with self._lock:
+            self._rebase()
+
+    def _rebase(self):
+        reference = self.reference
+        for name, counts in self.numeric.items():
+            reference['numeric'][name]['counts'] = (np.asarray(reference['numeric'][name]['counts']) + counts).tolist()
+        for name, counts in self.categorical.items():
+            merged = reference['categorical'][name]
+            for category, n in counts.items():
+                merged[category] = merged.get(category, 0) + n
+        reference['success'] = [reference['success'][0] + self.success[0], reference['success'][1] + self.success[1]]
+        reference['rows'] += self.rows
+        self.reference_keys, self.reference_counts = key_counts(
+            np.concatenate([self.reference_keys, np.fromiter(self.seen, dtype=np.uint64, count=len(self.seen))]),
+            np.concatenate([self.reference_counts, np.fromiter(self.seen.values(), dtype=np.int64, count=len(self.seen))]),
+        )
+        reference['row_keys'] = _encode(self.reference_keys, np.uint64)
+        reference['row_counts'] = _encode(self.reference_counts, np.uint32)
+        self._reset_current()
+
+
+def trees_to_refresh(n_estimators, change):
+    return max(1, min(n_estimators, math.ceil(n_estimators * change)))
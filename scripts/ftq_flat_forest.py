@@ -0,0 +1,311 @@
+"""
+Forêt aplatie pour le scoring FTQ à faible latence
+
+Les arbres d'un RandomForest entraîné sont exportés dans des tableaux NumPy
+contigus (feature, seuil, enfants, valeur), tous les arbres bout à bout.
+Le parcours avance alors tous les arbres et toutes les lignes d'un niveau à
+la fois : une seule boucle Python de profondeur max_depth au lieu d'un
+appel sklearn par arbre.
+
+Les résultats sont identiques à sklearn : X est converti en float32 comme
+dans sklearn.tree, et les prédictions des arbres sont sommées dans l'ordre
+des estimateurs avant la division.
+
+Benchmark :
+    python ftq_flat_forest.py --rows 3578 --trees 100
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+
+class FlatForest:
+    """
+    Tous les nœuds de tous les arbres dans des tableaux partagés. Une feuille
+    pointe vers elle-même avec un seuil infini, le parcours y reste donc.
+    """
+
+    # Tableaux écrits par save() ; chargés en mémoire mappée par load(mmap_mode='r')
+    ARRAYS = ('feature', 'threshold', 'left', 'right', 'missing_left', 'value', 'roots', 'children')
+
+    def __init__(self, feature, threshold, left, right, missing_left, value, roots, depth, classes=None,
+                 children=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.classes_ = classes
+        # children[2 * nœud + aller_à_gauche] : un seul gather par niveau
+        self.children = np.stack([right, left], axis=1).ravel() if children is None else children
+
+    @classmethod
+    def from_estimator(cls, forest):
+        """
+        Exporter un RandomForestRegressor / RandomForestClassifier entraîné
+        """
+        if getattr(forest, 'n_outputs_', 1) != 1:
+            raise ValueError("Seules les forêts à une sortie sont prises en charge")
+        classes = getattr(forest, 'classes_', None)
+
+        features, thresholds, lefts, rights, missing, values, roots = [], [], [], [], [], [], []
+        offset = 0
+        depth = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            nodes = np.arange(offset, offset + n_nodes)
+            leaf = tree.children_left == -1
+
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(np.where(leaf, np.inf, tree.threshold))
+            lefts.append(np.where(leaf, nodes, tree.children_left + offset))
+            rights.append(np.where(leaf, nodes, tree.children_right + offset))
+            missing_go_to_left = getattr(tree, 'missing_go_to_left', None)
+            missing.append(np.zeros(n_nodes, bool) if missing_go_to_left is None
+                           else np.asarray(missing_go_to_left, bool))
+
+            if classes is None:
+                values.append(tree.value[:, 0, 0])
+            else:
+                # Même normalisation que DecisionTreeClassifier.predict_proba
+                proba = tree.value[:, 0, :len(classes)].copy()
+                normalizer = proba.sum(axis=1)[:, np.newaxis]
+                normalizer[normalizer == 0.0] = 1.0
+                proba /= normalizer
+                values.append(proba)
+
+            roots.append(offset)
+            offset += n_nodes
+            depth = max(depth, tree.max_depth)
+
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features), dtype=np.intp),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+            left=np.ascontiguousarray(np.concatenate(lefts), dtype=np.intp),
+            right=np.ascontiguousarray(np.concatenate(rights), dtype=np.intp),
+            missing_left=np.ascontiguousarray(np.concatenate(missing)),
+            value=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            depth=depth,
+            classes=None if classes is None else np.asarray(classes),
+        )
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    def replace_trees(self, fresh, count):
+        """
+        Nouvelle forêt : les `count` plus anciens arbres remplacés par ceux de
+        `fresh` (réentraînement partiel, coût proportionnel à count)
+        """
+        if (self.classes_ is None) != (fresh.classes_ is None):
+            raise ValueError("Forêts de types différents")
+        start = self.roots[count] if count < self.n_estimators else len(self.feature)
+        shift = len(self.feature) - start
+
+        def splice(old, new):
+            return np.concatenate([old[start:], new])
+
+        def splice_nodes(old, new):
+            # Indices de nœuds : décaler les anciens vers 0, les nouveaux après eux
+            return np.concatenate([old[start:] - start, new + shift]).astype(np.intp)
+
+        return FlatForest(
+            feature=splice(self.feature, fresh.feature),
+            threshold=splice(self.threshold, fresh.threshold),
+            left=splice_nodes(self.left, fresh.left),
+            right=splice_nodes(self.right, fresh.right),
+            missing_left=splice(self.missing_left, fresh.missing_left),
+            value=splice(self.value, fresh.value),
+            roots=np.concatenate([self.roots[count:] - start, fresh.roots + shift]).astype(np.intp),
+            # Borne sûre : une feuille boucle sur elle-même
+            depth=max(self.depth, fresh.depth),
+            classes=self.classes_,
+        )
+
+    def apply(self, X):
+        """
+        Feuille atteinte par chaque ligne dans chaque arbre, shape (arbres, lignes)
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        n_rows, n_features = X.shape
+        flat_X = X.ravel()
+        row_offsets = (np.arange(n_rows) * n_features)[np.newaxis, :]
+        has_missing = bool(np.isnan(flat_X).any())
+        nodes = np.repeat(self.roots[:, np.newaxis], n_rows, axis=1)
+        for _ in range(self.depth):
+            x = flat_X[row_offsets + self.feature[nodes]]
+            go_left = x <= self.threshold[nodes]
+            if has_missing:
+                go_left |= np.isnan(x) & self.missing_left[nodes]
+            nodes = self.children[2 * nodes + go_left]
+        return nodes
+
+    def tree_predictions(self, X):
+        """
+        Valeur de chaque arbre (arbres, lignes) ; (arbres, lignes, classes) en classification
+        """
+        return self.value[self.apply(X)]
+
+    def _mean(self, per_tree):
+        # Somme arbre par arbre, dans l'ordre de sklearn, pour un résultat identique
+        total = np.zeros(per_tree.shape[1:], dtype=np.float64)
+        for prediction in per_tree:
+            total += prediction
+        total /= len(per_tree)
+        return total
+
+    def predict(self, X, return_std=False):
+        """
+        Moyenne de la forêt, et écart-type entre arbres si return_std
+        """
+        per_tree = self.tree_predictions(X)
+        if self.classes_ is not None:
+            proba = self._mean(per_tree)
+            prediction = self.classes_[np.argmax(proba, axis=1)]
+        else:
+            prediction = self._mean(per_tree)
+        if return_std:
+            return prediction, np.std(per_tree, axis=0)
+        return prediction
+
+    def predict_proba(self, X):
+        if self.classes_ is None:
+            raise ValueError("predict_proba n'existe que pour une forêt de classification")
+        return self._mean(self.tree_predictions(X))
+
+    def contributions(self, X):
+        """
+        Décomposition par chemin (Saabas) : prédiction = biais + somme des
+        contributions. Chaque split ajoute à sa variable l'écart de valeur
+        entre le nœud et l'enfant suivi. Renvoie (biais, contributions) de
+        shape valeur et (lignes, variables) + valeur.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        n_rows, n_features = X.shape
+        flat_X = X.ravel()
+        row_offsets = (np.arange(n_rows) * n_features)[np.newaxis, :]
+        has_missing = bool(np.isnan(flat_X).any())
+        value = self.value.reshape(len(self.value), -1)
+        totals = np.zeros((n_rows * n_features, value.shape[1]))
+        nodes = np.repeat(self.roots[:, np.newaxis], n_rows, axis=1)
+        for _ in range(self.depth):
+            feature = self.feature[nodes]
+            x = flat_X[row_offsets + feature]
+            go_left = x <= self.threshold[nodes]
+            if has_missing:
+                go_left |= np.isnan(x) & self.missing_left[nodes]
+            following = self.children[2 * nodes + go_left]
+            # Une feuille boucle sur elle-même : écart nul
+            delta = value[following] - value[nodes]
+            slots = (row_offsets + feature).ravel()
+            for column in range(value.shape[1]):
+                totals[:, column] += np.bincount(slots, weights=delta[..., column].ravel(),
+                                                 minlength=len(totals))
+            nodes = following
+        shape = self.value.shape[1:]
+        bias = value[self.roots].mean(axis=0).reshape(shape)
+        return bias, (totals / self.n_estimators).reshape((n_rows, n_features) + shape)
+
+    def save(self, directory):
+        """
+        Un fichier .npy par tableau, pour que load() puisse les mapper sans copie
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in self.ARRAYS:
+            array = getattr(self, name)
+            np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(array))
+        meta = {'depth': int(self.depth)}
+        if self.classes_ is not None:
+            meta['classes'] = self.classes_.tolist()
+        with open(os.path.join(directory, 'forest.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode=None):
+        """
+        mmap_mode='r' : les processus qui chargent le même dossier partagent
+        les mêmes pages (cache du système), en lecture seule
+        """
+        with open(os.path.join(directory, 'forest.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+            for name in cls.ARRAYS
+        }
+        classes = meta.get('classes')
+        return cls(**arrays, depth=meta['depth'], classes=None if classes is None else np.asarray(classes))
+
+
+# ------------------ Benchmark ------------------
+def _median_ms(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return round(float(np.median(timings) * 1000), 3)
+
+
+def benchmark(n_rows=3578, n_trees=100, repeat=50):
+    """
+    Latence sklearn vs forêt aplatie pour une ligne (prédiction + dispersion
+    des arbres, comme FTQPredictor.predict_ftq) et pour un lot, avec
+    vérification de l'égalité exacte des résultats
+    """
+    from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+
+    rng = np.random.default_rng(42)
+    X = rng.normal(size=(n_rows, 9))
+    y = X[:, 0] * 3 + X[:, 7] ** 2 + rng.normal(size=n_rows)
+    model = RandomForestRegressor(
+        n_estimators=n_trees, max_depth=10, min_samples_split=5, min_samples_leaf=2, random_state=42, n_jobs=1
+    ).fit(X, y)
+    flat = FlatForest.from_estimator(model)
+    row = X[:1]
+
+    def sklearn_single():
+        model.predict(row)
+        np.std([tree.predict(row) for tree in model.estimators_], axis=0)
+
+    mean, std = flat.predict(X, return_std=True)
+    classifier = RandomForestClassifier(n_estimators=n_trees, max_depth=10, random_state=42, n_jobs=1)
+    classifier.fit(X, (y > np.median(y)).astype(int))
+    flat_classifier = FlatForest.from_estimator(classifier)
+    bias, contributions = flat.contributions(X)
+
+    return {
+        'rows': n_rows,
+        'trees': n_trees,
+        'nodes': len(flat.feature),
+        'exact_predict': bool(np.array_equal(mean, model.predict(X))),
+        'exact_std': bool(np.array_equal(std, np.std([t.predict(X) for t in model.estimators_], axis=0))),
+        'exact_proba': bool(np.array_equal(flat_classifier.predict_proba(X), classifier.predict_proba(X))),
+        'additive_contributions': bool(np.allclose(bias + contributions.sum(axis=1), mean)),
+        'single_row_sklearn_ms': _median_ms(sklearn_single, repeat),
+        'single_row_flat_ms': _median_ms(lambda: flat.predict(row, return_std=True), repeat),
+        'batch_sklearn_ms': _median_ms(lambda: model.predict(X), 5),
+        'batch_flat_ms': _median_ms(lambda: flat.predict(X), 5),
+        'batch_contributions_ms': _median_ms(lambda: flat.contributions(X), 5),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de la forêt aplatie")
+    parser.add_argument('--rows', type=int, default=3578)
+    parser.add_argument('--trees', type=int, default=100)
+    args = parser.parse_args()
+    print(json.dumps(benchmark(args.rows, args.trees), indent=2))
@@ -0,0 +1,333 @@
+"""
+Prévision du FTQ par Area et Line, par jour ou par équipe
+
+Les reworks sont agrégés en une matrice séries × périodes (nombre de
+défauts de chaque couple Area/Line par jour ou par équipe). Deux modèles,
+ajustés sur toutes les séries à la fois :
+  - 'seasonal' : lissage exponentiel saisonnier additif (saison = 7 jours
+    ou 3 équipes), paramètres choisis par série sur une petite grille ;
+  - 'forest'   : une forêt globale sur des features de retard (lags),
+    position dans la saison et série, prévision récursive.
+
+Le FTQ d'une période se déduit des défauts prévus comme dans
+FTQPredictor.calculate_ftq_target : (production - défauts) / production,
+borné entre 85 et 98 %. La production n'est connue que pour l'usine : le
+FTQ est donc prévu pour l'usine seulement, chaque ligne recevant ses
+défauts prévus et sa part des défauts de l'usine.
+
+Usage :
+    python ftq_forecast.py --data ../frontend/public/backend/data/data.json --horizon 7 --freq shift
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+SEASONS = {'day': 7, 'shift': 3}
+SHIFTS = ('matin', 'soir', 'nuit')
+# Production mensuelle de référence de calculate_ftq_target
+PRODUCTION_TARGET = 1000
+FTQ_RANGE = (85, 98)
+# Grille des paramètres de lissage (niveau, saison)
+ALPHAS = (0.1, 0.3, 0.6)
+GAMMAS = (0.05, 0.2, 0.4)
+# Quantile normal de l'intervalle à 80 %
+Z_80 = 1.2816
+
+
+def _periods(dates, freq):
+    """
+    Période de chaque rework : la date, ou (date, équipe) ; l'équipe de nuit
+    après minuit appartient à la journée précédente
+    """
+    import pandas as pd
+
+    if freq == 'day':
+        return dates.dt.normalize(), None
+    hours = dates.dt.hour
+    shift = np.where((hours >= 6) & (hours < 14), 0, np.where((hours >= 14) & (hours < 22), 1, 2))
+    day = dates.dt.normalize() - pd.to_timedelta((hours < 6).astype(int), unit='D')
+    return day, shift
+
+
+def aggregate(records, freq='day'):
+    """
+    (séries [(Area, Line)], libellés des périodes, matrice des défauts séries × périodes)
+    Les périodes sans rework valent 0.
+    """
+    import pandas as pd
+
+    if freq not in SEASONS:
+        raise ValueError(f"freq doit valoir {' ou '.join(SEASONS)}")
+    df = pd.DataFrame(records)
+    if df.empty or 'REWORK_DATE' not in df.columns:
+        raise ValueError("Aucun rework daté à agréger")
+    df = df.assign(REWORK_DATE=pd.to_datetime(df['REWORK_DATE'], errors='coerce')).dropna(subset=['REWORK_DATE'])
+    df['Area'] = df.get('Area', pd.Series('unknown', index=df.index)).fillna('unknown').astype(str)
+    df['Line'] = df.get('Line', pd.Series('unknown', index=df.index)).fillna('unknown').astype(str)
+
+    day, shift = _periods(df['REWORK_DATE'], freq)
+    first_day = day.min()
+    day_index = ((day - first_day).dt.days).to_numpy()
+    n_days = int(day_index.max()) + 1
+    if freq == 'day':
+        period = day_index
+        labels = [(first_day + pd.Timedelta(days=d)).strftime('%Y-%m-%d') for d in range(n_days)]
+    else:
+        period = day_index * 3 + shift
+        labels = [f"{(first_day + pd.Timedelta(days=d)).strftime('%Y-%m-%d')} {s}"
+                  for d in range(n_days) for s in SHIFTS]
+
+    series, series_index = np.unique(df[['Area', 'Line']].to_numpy(dtype=str), axis=0, return_inverse=True)
+    counts = np.zeros((len(series), len(labels)))
+    np.add.at(counts, (series_index.ravel(), period), 1)
+    return [tuple(s) for s in series], labels, counts
+
+
+def future_labels(last_label, freq, horizon):
+    import pandas as pd
+
+    if freq == 'day':
+        last = pd.Timestamp(last_label)
+        return [(last + pd.Timedelta(days=h)).strftime('%Y-%m-%d') for h in range(1, horizon + 1)]
+    date, shift = last_label.split(' ')
+    position = SHIFTS.index(shift)
+    labels = []
+    for h in range(1, horizon + 1):
+        day, index = divmod(position + h, 3)
+        labels.append(f"{(pd.Timestamp(date) + pd.Timedelta(days=day)).strftime('%Y-%m-%d')} {SHIFTS[index]}")
+    return labels
+
+
+class SeasonalModel:
+    """
+    Lissage exponentiel saisonnier additif, toutes les séries en parallèle
+    (une boucle sur le temps, des opérations vectorielles sur les séries)
+    """
+
+    def __init__(self, season):
+        self.season = season
+
+    def _run(self, Y, alpha, gamma):
+        m = self.season
+        level = Y[:, :m].mean(axis=1)
+        seasonal = Y[:, :m] - level[:, None]
+        errors = np.zeros_like(Y)
+        for t in range(Y.shape[1]):
+            s = seasonal[:, t % m]
+            errors[:, t] = Y[:, t] - (level + s)
+            new_level = alpha * (Y[:, t] - s) + (1 - alpha) * level
+            seasonal[:, t % m] = gamma * (Y[:, t] - new_level) + (1 - gamma) * s
+            level = new_level
+        return level, seasonal, errors
+
+    def fit(self, Y):
+        m = self.season
+        best = None
+        for alpha in ALPHAS:
+            for gamma in GAMMAS:
+                level, seasonal, errors = self._run(Y, alpha, gamma)
+                # Erreurs à un pas après la première saison
+                sse = (errors[:, m:] ** 2).sum(axis=1)
+                if best is None:
+                    best = [sse, level, seasonal, errors, np.full(len(Y), alpha), np.full(len(Y), gamma)]
+                    continue
+                better = sse < best[0]
+                best[0] = np.where(better, sse, best[0])
+                best[1] = np.where(better, level, best[1])
+                best[2] = np.where(better[:, None], seasonal, best[2])
+                best[3] = np.where(better[:, None], errors, best[3])
+                best[4] = np.where(better, alpha, best[4])
+                best[5] = np.where(better, gamma, best[5])
+        _, self.level, self.seasonal, errors, self.alpha, self.gamma = best
+        self.sigma = errors[:, m:].std(axis=1) if Y.shape[1] > m else np.zeros(len(Y))
+        self.n_periods = Y.shape[1]
+        return self
+
+    def predict(self, horizon):
+        steps = self.n_periods + np.arange(horizon)
+        mean = self.level[:, None] + self.seasonal[:, steps % self.season]
+        return np.clip(mean, 0, None), np.repeat(self.sigma[:, None], horizon, axis=1)
+
+
+class ForestModel:
+    """
+    Une forêt pour toutes les séries : features = derniers retards, position
+    dans la saison et numéro de série ; prévision récursive pas à pas
+    """
+
+    def __init__(self, season, n_lags=None):
+        self.season = season
+        self.n_lags = n_lags or 2 * season
+
+    def _features(self, window, positions, series):
+        return np.column_stack([window, window.mean(axis=1), positions % self.season, series])
+
+    def fit(self, Y):
+        from numpy.lib.stride_tricks import sliding_window_view
+        from ftq_backends import create_backend
+
+        S, T = Y.shape
+        if T <= self.n_lags + 1:
+            raise ValueError(f"Historique trop court pour {self.n_lags} retards")
+        windows = sliding_window_view(Y, self.n_lags, axis=1)[:, :-1]  # S × (T - lags) × lags
+        steps = T - self.n_lags
+        X = self._features(
+            windows.reshape(-1, self.n_lags),
+            np.tile(np.arange(self.n_lags, T), S),
+            np.repeat(np.arange(S), steps),
+        )
+        y = Y[:, self.n_lags:].reshape(-1)
+        self.backend = create_backend('regressor', 'random_forest', {'n_estimators': 100, 'max_depth': 10,
+                                                                     'min_samples_leaf': 2})
+        self.backend.fit(X, y)
+        residuals = y - self.backend.predict(X)
+        self.sigma = residuals.reshape(S, steps).std(axis=1)
+        self.history = Y[:, -self.n_lags:].copy()
+        self.n_periods = T
+        return self
+
+    def predict(self, horizon):
+        S = len(self.history)
+        window = self.history.copy()
+        mean = np.zeros((S, horizon))
+        series = np.arange(S)
+        for h in range(horizon):
+            position = np.full(S, self.n_periods + h)
+            mean[:, h] = self.backend.predict(self._features(window, position, series))
+            window = np.column_stack([window[:, 1:], mean[:, h]])
+        # L'incertitude croît avec l'horizon de la récursion
+        sigma = self.sigma[:, None] * np.sqrt(np.arange(1, horizon + 1))[None, :]
+        return np.clip(mean, 0, None), sigma
+
+
+MODELS = {'seasonal': SeasonalModel, 'forest': ForestModel}
+
+
+class Forecaster:
+    """
+    Agrégation + modèle ajusté, réutilisable pour tous les horizons
+    """
+
+    def __init__(self, records, freq='day', method='seasonal'):
+        if method not in MODELS:
+            raise ValueError(f"method doit valoir {' ou '.join(MODELS)}")
+        self.freq = freq
+        self.method = method
+        self.series, self.labels, self.counts = aggregate(records, freq)
+        self.model = MODELS[method](SEASONS[freq]).fit(self.counts)
+
+    def planned_per_period(self, daily_production):
+        return daily_production / (1 if self.freq == 'day' else len(SHIFTS))
+
+    def forecast(self, horizon, daily_production=PRODUCTION_TARGET / 30, history=None):
+        mean, sigma = self.model.predict(horizon)
+        lower = np.clip(mean - Z_80 * sigma, 0, None)
+        upper = mean + Z_80 * sigma
+        planned = self.planned_per_period(daily_production)
+        history = history if history is not None else SEASONS[self.freq] * 2
+
+        def ftq(defects):
+            return np.clip((planned - defects) / planned * 100, *FTQ_RANGE)
+
+        def share(defects, total):
+            return round(float(defects / total), 3) if total > 0 else None
+
+        labels = future_labels(self.labels[-1], self.freq, horizon)
+        total = mean.sum(axis=0)
+        past_total = self.counts.sum(axis=0)
+        series = []
+        for i, (area, line) in enumerate(self.series):
+            series.append({
+                'area': area,
+                'line': line,
+                'history': [
+                    {'period': label, 'defects': int(count), 'share': share(count, past)}
+                    for label, count, past in zip(self.labels[-history:], self.counts[i, -history:],
+                                                  past_total[-history:])
+                ],
+                'forecast': [
+                    {
+                        'period': labels[h],
+                        'defects': round(float(mean[i, h]), 2),
+                        'defects_lower': round(float(lower[i, h]), 2),
+                        'defects_upper': round(float(upper[i, h]), 2),
+                        'share': share(mean[i, h], total[h]),
+                    }
+                    for h in range(horizon)
+                ],
+            })
+
+        # Erreurs des lignes supposées indépendantes ; plus de défauts = FTQ
+        # plus bas, les bornes s'inversent
+        total_sigma = np.sqrt((sigma ** 2).sum(axis=0))
+        total_lower = np.clip(total - Z_80 * total_sigma, 0, None)
+        total_upper = total + Z_80 * total_sigma
+        return {
+            'freq': self.freq,
+            'method': self.method,
+            'horizon': horizon,
+            'history_periods': len(self.labels),
+            'planned_per_period': round(planned, 2),
+            'series': series,
+            'plant': [
+                {
+                    'period': labels[h],
+                    'defects': round(float(total[h]), 2),
+                    'ftq': round(float(ftq(total[h])), 1),
+                    'ftq_lower': round(float(ftq(total_upper[h])), 1),
+                    'ftq_upper': round(float(ftq(total_lower[h])), 1),
+                }
+                for h in range(horizon)
+            ],
+        }
+
+
+def backtest(records, freq='day', method='seasonal', holdout=None):
+    """
+    Erreur absolue moyenne (défauts par période) sur les dernières périodes
+    tenues à l'écart, comparée à la prévision naïve saisonnière
+    """
+    series, labels, counts = aggregate(records, freq)
+    m = SEASONS[freq]
+    holdout = holdout or m
+    train, test = counts[:, :-holdout], counts[:, -holdout:]
+    mean, _ = MODELS[method](m).fit(train).predict(holdout)
+    naive = train[:, -m:][:, np.arange(holdout) % m]
+    return {
+        'method': method,
+        'freq': freq,
+        'holdout': holdout,
+        'mae': round(float(np.abs(mean - test).mean()), 3),
+        'naive_mae': round(float(np.abs(naive - test).mean()), 3),
+    }
+
+
+def main():
+    import sys
+    import os
+    import time
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+    from dataset import DATA_FILE, Dataset
+
+    parser = argparse.ArgumentParser(description="Prévision FTQ par ligne")
+    parser.add_argument('--data', default=None, help="data.json (défaut : REWORK_DATA_FILE)")
+    parser.add_argument('--freq', choices=sorted(SEASONS), default='day')
+    parser.add_argument('--horizon', type=int, default=7)
+    args = parser.parse_args()
+
+    records = Dataset(args.data or DATA_FILE).records()
+    for method in MODELS:
+        start = time.perf_counter()
+        forecaster = Forecaster(records, args.freq, method)
+        fit_ms = (time.perf_counter() - start) * 1000
+        result = forecaster.forecast(args.horizon)
+        print(json.dumps({**backtest(records, args.freq, method), 'series': len(forecaster.series),
+                          'fit_ms': round(fit_ms, 1)}))
+        print("   plant:", json.dumps(result['plant'][:3]))
+
+
+if __name__ == "__main__":
+    main()
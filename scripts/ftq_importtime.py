@@ -0,0 +1,89 @@
+"""
+Benchmark du temps d'import des APIs FTQ (python -X importtime)
+
+Chaque module est importé dans un interpréteur neuf. Le script échoue
+(code 1) si pandas, numpy ou sklearn sont chargés dès l'import, ou si le
+budget de temps est dépassé : ils ne doivent l'être qu'à la première
+prédiction (ou au préchauffage).
+
+Usage :
+    python ftq_importtime.py
+    python ftq_importtime.py --budget-ms 500 --top 10
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (dossier, module) importés au démarrage des serveurs
+TARGETS = [
+    ('python-api', 'app'),
+    ('python-api', 'asgi_app'),
+    ('scripts', 'ftq_api'),
+]
+HEAVY_MODULES = ('pandas', 'numpy', 'sklearn', 'scipy')
+# Budget par module (import seul, en ms), vérifié aussi par tests/test_importtime.py
+BUDGET_MS = 1000
+
+
+def import_time(directory, module):
+    """
+    Importer un module dans un nouveau processus et analyser la sortie de -X importtime
+    """
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.join(ROOT, directory), capture_output=True, text=True
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if process.returncode != 0:
+        raise RuntimeError(f"import {module} a échoué:\n{process.stderr[-2000:]}")
+
+    entries = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        entries.append((name.rstrip(), int(self_us), int(cumulative_us)))
+
+    target = next(cumulative for name, _, cumulative in entries if name.strip() == module)
+    loaded = {name.strip() for name, _, _ in entries}
+    return {
+        'module': f"{directory}/{module}",
+        'import_ms': round(target / 1000, 1),
+        'interpreter_ms': round(wall_ms, 1),
+        'heavy_loaded': sorted(m for m in HEAVY_MODULES if m in loaded),
+        'slowest': sorted(((name.strip(), self_us) for name, self_us, _ in entries),
+                          key=lambda item: item[1], reverse=True),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Temps d'import des APIs FTQ")
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS, help="Budget par module (import seul)")
+    parser.add_argument('--top', type=int, default=5, help="Modules les plus lents à afficher")
+    args = parser.parse_args()
+
+    failed = False
+    for directory, module in TARGETS:
+        result = import_time(directory, module)
+        over_budget = result['import_ms'] > args.budget_ms
+        ok = not result['heavy_loaded'] and not over_budget
+        failed = failed or not ok
+
+        print(f"{'✅' if ok else '❌'} {result['module']}: {result['import_ms']} ms "
+              f"(interpréteur compris: {result['interpreter_ms']} ms)")
+        if result['heavy_loaded']:
+            print(f"   ⚠️  chargés à l'import: {', '.join(result['heavy_loaded'])}")
+        for name, self_us in result['slowest'][:args.top]:
+            print(f"   - {name}: {self_us / 1000:.1f} ms")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,132 @@
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.metrics import mean_squared_error, r2_score
 import json
+import os
+import sys
 import datetime
 import warnings
 warnings.filterwarnings('ignore')
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+# Fournisseur du jeu de données partagé avec le backend temps réel
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from ftq_backends import create_backend, load_backend
+
 class FTQPredictor:
     """
     Prédicteur FTQ utilisant Random Forest avec scikit-learn
     Concepts ML : Feature Engineering, Random Forest, Cross-validation
+
+    Le modèle vient d'un backend interchangeable (ftq_backends.py) :
+    random_forest (défaut), hist_gradient_boosting ou logistic
     """
     
-    def __init__(self):
-        self.model = RandomForestRegressor(
-            n_estimators=100,      # 100 arbres dans la forêt
-            max_depth=10,          # Profondeur maximale des arbres
-            min_samples_split=5,   # Minimum d'échantillons pour diviser un nœud
-            min_samples_leaf=2,    # Minimum d'échantillons dans une feuille
-            random_state=42,       # Pour la reproductibilité
-            n_jobs=-1             # Utiliser tous les processeurs
-        )
+    def __init__(self, params=None, backend=None):
+        self.backend = create_backend('regressor', backend, params)
+        self.params = self.backend.params
+        self.model = self.backend.model
+        from sklearn.preprocessing import StandardScaler
         self.scaler = StandardScaler()
         self.label_encoders = {}
         self.is_trained = False
+        # Instantané des distributions d'entraînement (ftq_drift.py)
+        self.drift_reference = None
         
-    def load_data(self, json_file_path):
+    def export_serving(self, directory):
+        """
+        Écrire l'état entraîné (modèle, scaler, encodeurs) dans un dossier
+        que d'autres processus chargent avec from_serving
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.backend.save(directory)
+        meta = {
+            'backend': self.backend.name,
+            'params': self.params,
+            'feature_columns': self.feature_columns,
+            'scaler': {
+                'mean': self.scaler.mean_.tolist(),
+                'scale': self.scaler.scale_.tolist(),
+                'var': self.scaler.var_.tolist(),
+                'n_samples_seen': int(self.scaler.n_samples_seen_),
+            },
+            'label_encoders': {
+                feature: encoder.classes_.tolist() for feature, encoder in self.label_encoders.items()
+            },
+            'drift_reference': self.drift_reference,
+        }
+        with open(os.path.join(directory, 'predictor.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+
+    @classmethod
+    def from_serving(cls, directory, mmap_mode='r'):
+        """
+        Prédicteur prêt à l'emploi, sans entraînement : les tableaux du modèle
+        sont mappés en lecture seule et partagés entre processus
+        """
+        from sklearn.preprocessing import LabelEncoder
+
+        with open(os.path.join(directory, 'predictor.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        predictor = cls(params=meta['params'], backend=meta['backend'])
+        predictor.backend = load_backend(directory, meta['backend'], 'regressor', meta['params'], mmap_mode)
+        predictor.model = predictor.backend.model
+
+        scaler = meta['scaler']
+        predictor.scaler.mean_ = np.asarray(scaler['mean'])
+        predictor.scaler.scale_ = np.asarray(scaler['scale'])
+        predictor.scaler.var_ = np.asarray(scaler['var'])
+        predictor.scaler.n_samples_seen_ = scaler['n_samples_seen']
+        predictor.scaler.n_features_in_ = len(scaler['mean'])
+
+        for feature, classes in meta['label_encoders'].items():
+            encoder = LabelEncoder()
+            encoder.classes_ = np.asarray(classes)
+            predictor.label_encoders[feature] = encoder
+
+        predictor.feature_columns = meta['feature_columns']
+        predictor.drift_reference = meta.get('drift_reference')
+        predictor.is_trained = True
+        return predictor
+
+    def refresh(self, df, change):
         """
-        Charger et préprocesser les données de défauts
+        Réentraînement partiel : renouveler la part `change` des arbres sur les
+        données récentes, avec les mêmes encodeurs et le même scaler. Lève
+        ValueError si une catégorie est inconnue (il faut alors tout réentraîner).
         """
+        from ftq_drift import trees_to_refresh
+
+        flat = getattr(self.backend, 'flat', None)
+        if flat is None:
+            raise ValueError(f"Réentraînement partiel impossible pour {self.backend.name}")
+        required = ['REWORK_DATE', 'Rework_time', 'Area', 'Line']
+        missing = [column for column in required if column not in df.columns]
+        if missing:
+            raise ValueError(f"Colonnes manquantes: {', '.join(missing)}")
+        df = df.dropna(subset=required).copy()
+
+        df, feature_columns = self.feature_engineering(df)
+        df = self.calculate_ftq_target(df)
+        X = self.scaler.transform(df[feature_columns])
+
+        count = trees_to_refresh(flat.n_estimators, change)
+        fresh = create_backend('regressor', self.backend.name, {**self.params, 'n_estimators': count})
+        fresh.fit(X, df['ftq_target'])
+        self.backend.flat = flat.replace_trees(fresh.flat, count)
+        print(f"🔁 {count}/{flat.n_estimators} arbres renouvelés sur {len(df)} lignes récentes")
+        return count
+
+    def load_data(self, json_file_path=None):
+        """
+        Charger les données de défauts via le fournisseur partagé (dataset.py) :
+        fichier du backend temps réel par défaut, journal des mises à jour compris
+        """
+        from dataset import DATA_FILE, Dataset
         try:
-            with open(json_file_path, 'r') as f:
-                data = json.load(f)
-            
-            df = pd.DataFrame(data)
+            dataset = Dataset(json_file_path or DATA_FILE)
+            if not dataset.exists():
+                raise FileNotFoundError(dataset.path)
+            df = pd.DataFrame(dataset.records())
             print(f"📊 Données chargées: {len(df)} défauts")
             return df
         except Exception as e:
@@ -89,6 +179,10 @@ class FTQPredictor:
         """
         print("🔧 Feature Engineering...")
         
+        # Les données réelles utilisent 'Defect_type', les synthétiques 'defect_type'
+        if 'defect_type' not in df.columns and 'Defect_type' in df.columns:
+            df['defect_type'] = df['Defect_type']
+
         # Convertir la date
         df['REWORK_DATE'] = pd.to_datetime(df['REWORK_DATE'])
         
@@ -102,6 +196,7 @@ class FTQPredictor:
         categorical_features = ['Area', 'Line', 'defect_type']
         for feature in categorical_features:
             if feature not in self.label_encoders:
+                from sklearn.preprocessing import LabelEncoder
                 self.label_encoders[feature] = LabelEncoder()
                 df[f'{feature}_encoded'] = self.label_encoders[feature].fit_transform(df[feature])
             else:
@@ -144,7 +239,13 @@ class FTQPredictor:
         """
         Entraîner le modèle Random Forest
         """
-        print("🌲 Entraînement du modèle Random Forest...")
+        from sklearn.model_selection import train_test_split
+        from sklearn.metrics import mean_squared_error, r2_score
+
+        from ftq_drift import DriftMonitor
+
+        print(f"🌲 Entraînement du modèle {self.backend.label}...")
+        self.drift_reference = DriftMonitor.snapshot(df.to_dict('records'))
         
         # Feature engineering
         df, feature_columns = self.feature_engineering(df)
@@ -165,11 +266,12 @@ class FTQPredictor:
         X_train_scaled = self.scaler.fit_transform(X_train)
         X_test_scaled = self.scaler.transform(X_test)
         
-        # Entraînement du Random Forest
-        self.model.fit(X_train_scaled, y_train)
+        # Entraînement du modèle
+        self.backend.fit(X_train_scaled, y_train)
+        self.model = self.backend.model
         
         # Évaluation
-        y_pred = self.model.predict(X_test_scaled)
+        y_pred = self.backend.predict(X_test_scaled)
         mse = mean_squared_error(y_test, y_pred)
         r2 = r2_score(y_test, y_pred)
         
@@ -179,9 +281,10 @@ class FTQPredictor:
         print(f"   - Features: {len(feature_columns)}")
         
         # Importance des features
+        importances = self.backend.feature_importance(feature_columns)
         feature_importance = pd.DataFrame({
-            'feature': feature_columns,
-            'importance': self.model.feature_importances_
+            'feature': list(importances),
+            'importance': list(importances.values())
         }).sort_values('importance', ascending=False)
         
         print("\n📊 Importance des features:")
@@ -238,7 +341,8 @@ class FTQPredictor:
         
         # Normaliser et prédire
         features_scaled = self.scaler.transform(features)
-        predicted_ftq = self.model.predict(features_scaled)[0]
+        predictions, spread = self.backend.predict_with_spread(features_scaled)
+        predicted_ftq = predictions[0]
         
         # Calculer le FTQ actuel
         production_target = 1000
@@ -246,8 +350,11 @@ class FTQPredictor:
         current_ftq = max(85, min(98, current_ftq))
         
         # Calculer la confiance (basée sur la variance des prédictions des arbres)
-        tree_predictions = [tree.predict(features_scaled)[0] for tree in self.model.estimators_]
-        confidence = 1 - (np.std(tree_predictions) / np.mean(tree_predictions))
+        if spread is not None:
+            confidence = 1 - (spread[0] / predicted_ftq)
+        else:
+            # Pas de dispersion disponible : confiance minimale
+            confidence = 0.7
         confidence = max(0.7, min(0.95, confidence))
         
         # Analyser les lignes les plus/moins performantes
@@ -262,9 +369,9 @@ class FTQPredictor:
             'improvement': round(predicted_ftq - current_ftq, 1),
             'line_analysis': line_analysis,
             'model_info': {
-                'algorithm': 'Random Forest',
-                'n_estimators': self.model.n_estimators,
-                'max_depth': self.model.max_depth,
+                'algorithm': self.backend.label,
+                'n_estimators': self.backend.describe()['n_estimators'],
+                'max_depth': self.backend.describe()['max_depth'],
                 'features_used': len(self.feature_columns)
             }
         }
@@ -325,7 +432,7 @@ def main():
     # Charger les données (ou générer des données synthétiques)
     try:
         # Essayer de charger les vraies données
-        df = predictor.load_data('public/backend/data/data.json')
+        df = predictor.load_data()
     except:
         # Utiliser des données synthétiques
         df = predictor.generate_synthetic_data(800)
@@ -0,0 +1,229 @@
+"""
+Service du modèle FTQ partagé entre processus workers
+
+Un seul processus entraîne le FTQPredictor et le publie dans un dossier
+versionné (forêt aplatie en .npy, scaler, encodeurs). Tous les workers
+chargent cette version en mémoire mappée : les pages du modèle existent une
+seule fois en RAM, quel que soit le nombre de workers, et aucun worker ne
+relit ni ne parse data.json.
+
+Organisation de SERVING_DIR :
+    <version>/        artefact complet, jamais modifié après publication
+    CURRENT           nom de la version servie (remplacé atomiquement)
+    .lock             verrou : un seul entraînement à la fois
+
+Publier une nouvelle version (les workers la chargent au prochain contrôle) ;
+les données sont celles du backend temps réel (REWORK_DATA_FILE, par défaut
+backend/data/data.json), sauf --data :
+    python ftq_serving.py publish
+    python ftq_serving.py publish --data ../backend/data/data.json
+    python ftq_serving.py status
+    python ftq_serving.py bench --workers 4
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus
+    fcntl = None
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+SERVING_DIR = os.environ.get(
+    'FTQ_SERVING_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'serving')
+)
+# Versions conservées sur disque (la version servie en fait toujours partie)
+KEEP_VERSIONS = int(os.environ.get('FTQ_SERVING_KEEP', 3))
+
+
+def current_version(root=SERVING_DIR):
+    try:
+        with open(os.path.join(root, 'CURRENT'), 'r', encoding='utf-8') as f:
+            version = f.read().strip()
+    except OSError:
+        return None
+    return version if version and os.path.isdir(os.path.join(root, version)) else None
+
+
+@contextlib.contextmanager
+def training_lock(root=SERVING_DIR):
+    """
+    Verrou exclusif sur root/.lock, libéré automatiquement si le processus meurt
+    """
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, '.lock'), 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def publish(predictor, root=SERVING_DIR, keep=KEEP_VERSIONS):
+    """
+    Écrire une nouvelle version puis basculer CURRENT dessus
+    """
+    os.makedirs(root, exist_ok=True)
+    # Triable par date ; le suffixe aléatoire évite toute collision entre deux
+    # publications rapprochées (même processus, même microseconde)
+    version = datetime.datetime.now().strftime('%Y%m%dT%H%M%S%f') + f'-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+    tmp_dir = os.path.join(root, f'.{version}.tmp')
+    predictor.export_serving(tmp_dir)
+    os.replace(tmp_dir, os.path.join(root, version))
+
+    tmp_pointer = os.path.join(root, 'CURRENT.tmp')
+    with open(tmp_pointer, 'w', encoding='utf-8') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_pointer, os.path.join(root, 'CURRENT'))
+
+    # Les workers qui mappent encore une ancienne version gardent leurs
+    # pages : un fichier supprimé reste lisible tant qu'il est ouvert/mappé
+    versions = sorted(name for name in os.listdir(root) if not name.startswith('.') and name != 'CURRENT'
+                      and os.path.isdir(os.path.join(root, name)))
+    for old in versions[:-keep] if keep > 0 else []:
+        if old != version:
+            shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    return version
+
+
+def load(version, root=SERVING_DIR, mmap_mode='r'):
+    from ftq_predictor import FTQPredictor
+    return FTQPredictor.from_serving(os.path.join(root, version), mmap_mode)
+
+
+def load_or_train(train_fn, root=SERVING_DIR):
+    """
+    (prédicteur, version) : la version publiée si elle existe, sinon un seul
+    worker entraîne (train_fn) et publie pendant que les autres attendent le verrou
+    """
+    version = current_version(root)
+    if version is None:
+        with training_lock(root):
+            version = current_version(root)
+            if version is None:
+                version = publish(train_fn(), root)
+    return load(version, root), version
+
+
+# ------------------ CLI ------------------
+def train_from_file(data_path):
+    from ftq_predictor import FTQPredictor
+    predictor = FTQPredictor()
+    predictor.train_model(predictor.load_data(data_path))
+    return predictor
+
+
+def _memory_kb():
+    """
+    (Rss, Pss, Private) du processus : Pss répartit les pages partagées entre processus
+    """
+    values = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:', 'Private_Clean:', 'Private_Dirty:'):
+                values[parts[0][:-1]] = int(parts[1])
+    return values['Rss'], values['Pss'], values['Private_Clean'] + values['Private_Dirty']
+
+
+def _bench_worker(directory, mmap_mode, ready, release, results):
+    import numpy as np
+    from ftq_flat_forest import FlatForest
+    _, _, before = _memory_kb()
+    flat = FlatForest.load(directory, mmap_mode)
+    # Parcourir toute la forêt, comme le ferait un lot de prédictions
+    flat.predict(np.random.default_rng(0).normal(size=(2000, 9)), return_std=True)
+    ready.wait()
+    release.wait()
+    _, pss, private = _memory_kb()
+    results.put({'pss_kb': pss, 'model_private_kb': private - before})
+
+
+def bench(workers, n_rows=20000, n_trees=100):
+    """
+    Mémoire par worker pour une forêt de la taille de production, mappée
+    (mmap_mode='r') ou copiée dans chaque processus (None). La cible FTQ
+    réelle étant presque constante, la forêt est entraînée sur des données
+    synthétiques pour avoir des arbres complets.
+    """
+    import tempfile
+    import numpy as np
+    from sklearn.ensemble import RandomForestRegressor
+    from ftq_backends import RandomForestBackend
+    from ftq_flat_forest import FlatForest
+
+    rng = np.random.default_rng(42)
+    X = rng.normal(size=(n_rows, 9))
+    y = X[:, 0] * 3 + X[:, 7] ** 2 + rng.normal(size=n_rows)
+    params = {**RandomForestBackend.defaults['regressor'], 'n_estimators': n_trees, 'max_depth': None}
+    forest = FlatForest.from_estimator(RandomForestRegressor(**params, random_state=42).fit(X, y))
+
+    report = []
+    with tempfile.TemporaryDirectory() as directory:
+        forest.save(directory)
+        artifact_kb = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)) // 1024
+        for mmap_mode in ('r', None):
+            ready = multiprocessing.Barrier(workers + 1)
+            release = multiprocessing.Event()
+            results = multiprocessing.Queue()
+            processes = [
+                multiprocessing.Process(target=_bench_worker, args=(directory, mmap_mode, ready, release, results))
+                for _ in range(workers)
+            ]
+            for process in processes:
+                process.start()
+            ready.wait()
+            release.set()
+            samples = [results.get() for _ in processes]
+            for process in processes:
+                process.join()
+            report.append({
+                'mode': 'mmap' if mmap_mode else 'copy',
+                'workers': workers,
+                'artifact_kb': artifact_kb,
+                'model_private_kb_per_worker': round(sum(s['model_private_kb'] for s in samples) / workers),
+                'pss_kb_per_worker': round(sum(s['pss_kb'] for s in samples) / workers),
+            })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Service partagé du modèle FTQ")
+    parser.add_argument('command', choices=['publish', 'status', 'bench'])
+    parser.add_argument('--data', default=None, help="data.json (défaut : REWORK_DATA_FILE)")
+    parser.add_argument('--root', default=SERVING_DIR)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    if args.command == 'publish':
+        with training_lock(args.root):
+            version = publish(train_from_file(args.data), args.root)
+        print(f"📦 Version publiée: {version}")
+    elif args.command == 'status':
+        print(json.dumps({
+            'current': current_version(args.root),
+            'versions': sorted(name for name in os.listdir(args.root)
+                               if os.path.isdir(os.path.join(args.root, name)) and not name.startswith('.'))
+            if os.path.isdir(args.root) else [],
+        }, indent=2))
+    else:
+        for result in bench(args.workers):
+            print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Recherche d'hyperparamètres hors ligne pour les forêts FTQ
+
+Validation croisée temporelle (plis découpés par REWORK_DATE), candidats
+évalués en parallèle sur tous les cœurs, meilleure configuration écrite
+dans l'artefact lu par les APIs (models/ftq_model.json).
+
+Usage :
+    python ftq_tuning.py --data ../frontend/public/backend/data/data.json --task regressor
+    python ftq_tuning.py --task classifier --folds 5 --candidates 40 --jobs -1
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.metrics import log_loss, mean_squared_error
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from ftq_backends import MODEL_CONFIG_PATH, RandomForestBackend
+from ftq_predictor import FTQPredictor
+
+SEARCH_SPACE = {
+    'n_estimators': [50, 100, 200, 400],
+    'max_depth': [6, 10, 16, None],
+    'min_samples_split': [2, 5, 10],
+    'min_samples_leaf': [1, 2, 4],
+}
+
+# Tâche -> (estimateur, métrique à minimiser)
+TASKS = {
+    'regressor': (RandomForestRegressor, 'rmse'),
+    'classifier': (RandomForestClassifier, 'log_loss'),
+}
+
+
+def regressor_matrix(df):
+    """
+    Features et cible du FTQPredictor (FTQ journalier, scripts/ftq_api.py)
+    """
+    predictor = FTQPredictor()
+    df, feature_columns = predictor.feature_engineering(df.copy())
+    df = predictor.calculate_ftq_target(df)
+    return df['REWORK_DATE'], df[feature_columns].to_numpy(float), df['ftq_target'].to_numpy(float)
+
+
+def classifier_matrix(df):
+    """
+    Features et cible de train_and_predict (Success, python-api/app.py)
+    """
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python-api'))
+    from app import build_features, ingest_records
+
+    df, feature_columns, _ = build_features(ingest_records(df.to_dict('records'), source="tuning"))
+    return df['REWORK_DATE'], df[feature_columns].fillna(0).to_numpy(float), df['Success'].to_numpy(int)
+
+
+def time_folds(dates, n_folds):
+    """
+    Plis à fenêtre croissante : on entraîne sur les jours passés et on valide
+    sur le bloc de jours suivant. Un même jour n'est jamais des deux côtés.
+    """
+    days = pd.to_datetime(dates).dt.normalize()
+    unique_days = np.sort(days.unique())
+    if len(unique_days) < n_folds + 1:
+        raise ValueError(f"{len(unique_days)} jours distincts : pas assez pour {n_folds} plis temporels")
+    blocks = np.array_split(unique_days, n_folds + 1)
+    folds = []
+    for k in range(1, n_folds + 1):
+        train_mask = days < blocks[k][0]
+        val_mask = days.isin(blocks[k])
+        folds.append((np.flatnonzero(train_mask), np.flatnonzero(val_mask)))
+    return folds
+
+
+def build_fold_cache(X, y, folds):
+    """
+    Matrices de chaque pli calculées une seule fois et partagées par tous les candidats
+    (joblib les passe aux workers en mémoire mappée)
+    """
+    return [
+        (np.ascontiguousarray(X[train]), y[train], np.ascontiguousarray(X[val]), y[val])
+        for train, val in folds
+    ]
+
+
+def candidate_grid(n_candidates, seed=42):
+    grid = [dict(zip(SEARCH_SPACE, values)) for values in itertools.product(*SEARCH_SPACE.values())]
+    if n_candidates and n_candidates < len(grid):
+        grid = random.Random(seed).sample(grid, n_candidates)
+    return grid
+
+
+def score_candidate(task, params, fold_cache):
+    """
+    Score moyen (plus bas = meilleur) d'un candidat sur tous les plis
+    """
+    estimator, metric = TASKS[task]
+    scores = []
+    start = time.perf_counter()
+    for X_train, y_train, X_val, y_val in fold_cache:
+        model = estimator(**params, random_state=42, n_jobs=1)
+        model.fit(X_train, y_train)
+        if metric == 'rmse':
+            scores.append(float(np.sqrt(mean_squared_error(y_val, model.predict(X_val)))))
+        else:
+            proba = np.zeros((len(X_val), 2))
+            proba[:, model.classes_.astype(int)] = model.predict_proba(X_val)
+            scores.append(float(log_loss(y_val, proba, labels=[0, 1])))
+    return {
+        'params': params,
+        'score': float(np.mean(scores)),
+        'fold_scores': [round(s, 4) for s in scores],
+        'fit_seconds': round(time.perf_counter() - start, 2),
+    }
+
+
+def tune(df, task='regressor', n_folds=5, n_candidates=24, n_jobs=-1):
+    """
+    Validation croisée temporelle de tous les candidats, en parallèle
+    """
+    dates, X, y = (regressor_matrix if task == 'regressor' else classifier_matrix)(df)
+    fold_cache = build_fold_cache(X, y, time_folds(dates, n_folds))
+    candidates = candidate_grid(n_candidates)
+
+    print(f"🔍 {len(candidates)} candidats × {n_folds} plis temporels ({task}, {len(X)} lignes)")
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(score_candidate)(task, params, fold_cache) for params in candidates
+    )
+    results.sort(key=lambda r: r['score'])
+    return results
+
+
+def write_artifact(task, results, n_folds, path=MODEL_CONFIG_PATH):
+    """
+    Écrire la meilleure configuration dans l'artefact partagé, sans toucher aux autres tâches
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            artifact = json.load(f)
+    except (OSError, ValueError):
+        artifact = {}
+
+    best = results[0]
+    now = datetime.datetime.now()
+    artifact['version'] = now.strftime('%Y%m%dT%H%M%S')
+    artifact[task] = {
+        'backend': RandomForestBackend.name,
+        'params': best['params'],
+        'cv': {
+            'metric': TASKS[task][1],
+            'score': round(best['score'], 4),
+            'fold_scores': best['fold_scores'],
+            'folds': n_folds,
+            'candidates': len(results),
+            'split': 'time (REWORK_DATE, expanding window)',
+        },
+        'leaderboard': [
+            {'params': r['params'], 'score': round(r['score'], 4)} for r in results[:5]
+        ],
+        'tuned_at': now.isoformat(timespec='seconds'),
+    }
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(artifact, f, indent=2)
+    os.replace(tmp_path, path)
+    return artifact
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tuning des forêts FTQ")
+    parser.add_argument('--data', default=None, help="Fichier JSON des reworks (défaut : REWORK_DATA_FILE)")
+    parser.add_argument('--task', choices=sorted(TASKS), default='regressor')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--candidates', type=int, default=24, help="0 = grille complète")
+    parser.add_argument('--jobs', type=int, default=-1, help="Processus en parallèle (-1 = tous les cœurs)")
+    parser.add_argument('--output', default=MODEL_CONFIG_PATH)
+    args = parser.parse_args()
+
+    df = FTQPredictor().load_data(args.data)
+    results = tune(df, args.task, args.folds, args.candidates, args.jobs)
+    write_artifact(args.task, results, args.folds, args.output)
+
+    best = results[0]
+    print(f"\n🏆 Meilleure configuration ({TASKS[args.task][1]} = {best['score']:.4f}):")
+    for key, value in best['params'].items():
+        print(f"   - {key}: {value}")
+    print(f"💾 Artefact écrit: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
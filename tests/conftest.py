@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+for source in ("backend", "scripts", "python-api"):
+    sys.path.insert(0, str(ROOT / source))
+
+# backend/main.py opens (and locks) its data file at import: never the real one
+os.environ["REWORK_DATA_FILE"] = str(Path(tempfile.mkdtemp(prefix="rework-tests-")) / "data.json")
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app as flask_app
+import asgi_app
+from dataset import Dataset
+
+RECORDS = [
+    {"ORDNR": "ORD1", "REWORK_DATE": "2024-01-02 08:00:00", "Rework_time": 30,
+     "Area": "Motor", "Line": "Line 1", "Defect_type": "Terminal", "Success": 1},
+]
+
+
+@pytest.fixture
+def data_file(tmp_path, monkeypatch):
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps(RECORDS))
+    monkeypatch.setattr(flask_app, "dataset", Dataset(path))
+    return path
+
+
+@pytest.fixture
+def client():
+    # No startup event: no process pool needed to serve the file
+    return TestClient(asgi_app.app)
+
+
+def test_asgi_data_file_revalidates_with_etag(data_file, client):
+    first = client.get("/backend/data/data.json")
+    assert first.status_code == 200
+    assert first.json()[0]["ORDNR"] == "ORD1"
+    etag = first.headers["ETag"]
+
+    again = client.get("/backend/data/data.json", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.content == b""
+
+
+def test_asgi_data_file_is_compressed(data_file, client):
+    response = client.get("/backend/data/data.json", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert response.json()[0]["ORDNR"] == "ORD1"
+
+
+def test_asgi_and_flask_share_the_etag(data_file, client):
+    asgi = client.get("/backend/data/data.json")
+    flask = flask_app.app.test_client().get("/backend/data/data.json")
+    assert flask.status_code == 200
+    assert flask.headers["ETag"] == asgi.headers["ETag"]
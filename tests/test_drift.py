@@ -0,0 +1,64 @@
+import copy
+import random
+
+import pytest
+
+from ftq_drift import DriftMonitor
+
+
+def make_records(n, seed=0):
+    rng = random.Random(seed)
+    records = []
+    for i in range(n):
+        # Plusieurs défauts par ordre : la clé (ORDNR, REWORK_DATE) se répète
+        order = i // 3
+        records.append({
+            "ORDNR": f"ORD{order:05d}",
+            "REWORK_DATE": f"2024-01-{1 + order % 28:02d} {order % 24:02d}:00:00",
+            "Rework_time": rng.randint(5, 90),
+            "Area": rng.choice(["Motor", "Interior"]),
+            "Line": rng.choice(["Line 1", "Line 2", "Line 3"]),
+            "Defect_type": rng.choice(["Soudure", "Peinture", "Montage"]),
+            "shift": rng.choice(["matin", "soir", "nuit"]),
+            "Success": rng.randint(0, 1),
+        })
+    return records
+
+
+@pytest.fixture
+def records():
+    return make_records(1200)
+
+
+def test_posting_the_same_data_again_does_not_retrain(records):
+    monitor = DriftMonitor(DriftMonitor.snapshot(records))
+    for _ in range(3):
+        monitor.observe(copy.deepcopy(records))
+    assert monitor.rows == 0
+    assert len(monitor.window) == 0
+    assert monitor.decision()["retrain"] is False
+
+
+def test_only_appended_rows_are_counted(records):
+    monitor = DriftMonitor(DriftMonitor.snapshot(records[:900]))
+    monitor.observe(records)
+    monitor.observe(records)
+    assert monitor.rows == 300
+    assert list(monitor.window) == records[900:]
+
+
+def test_repeated_keys_count_as_new_occurrences(records):
+    monitor = DriftMonitor(DriftMonitor.snapshot(records))
+    # Même ordre, même date : un défaut de plus sur cet ordre
+    monitor.observe(records + [dict(records[0], Defect_type="Montage")])
+    assert monitor.rows == 1
+
+
+def test_rebase_keeps_observed_rows_known(records):
+    monitor = DriftMonitor(DriftMonitor.snapshot(records[:600]))
+    monitor.observe(records)
+    monitor.rebase()
+    assert monitor.reference["rows"] == 1200
+    restarted = DriftMonitor(copy.deepcopy(monitor.reference))
+    restarted.observe(records)
+    assert restarted.rows == 0
@@ -0,0 +1,69 @@
+import asyncio
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app as flask_app
+import asgi_app
+
+
+def make_defects(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            "ORDNR": f"ORD{i:04d}",
+            "REWORK_DATE": f"2024-01-{1 + i % 28:02d} {i % 24:02d}:00:00",
+            "Rework_time": rng.randint(5, 90),
+            "Area": rng.choice(["Motor", "Interior"]),
+            "Line": rng.choice(["Line 1", "Line 2", "Line 3"]),
+            "Defect_type": rng.choice(["Terminal", "Connector", "Security"]),
+            "Success": rng.randint(0, 1),
+        }
+        for i in range(n)
+    ]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Threads instead of the process pool: same code path, faster to start
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(asgi_app, "_executor", executor)
+    monkeypatch.setattr(asgi_app, "_slots", asyncio.Semaphore(2))
+    yield TestClient(asgi_app.app)
+    executor.shutdown()
+
+
+def test_asgi_explain(client):
+    response = client.post("/api/ftq/explain", json={"defects": make_defects(60)})
+    assert response.status_code == 200
+    assert response.json()["status"] == "success"
+
+
+def test_explain_too_few_records_is_a_bad_request(client):
+    response = client.post("/api/ftq/explain", json={"defects": make_defects(3)})
+    assert response.status_code == 400
+    assert "At least 10 records" in response.json()["error"]
+
+    flask = flask_app.app.test_client().post("/api/ftq/explain", json={"defects": make_defects(3)})
+    assert flask.status_code == 400
+
+
+def test_asgi_whatif(client):
+    response = client.post("/api/ftq/whatif", json={
+        "defects": make_defects(60),
+        "interventions": [{"action": "scale", "field": "Rework_time", "factor": 0.5}],
+        "samples": 20,
+    })
+    assert response.status_code == 200, response.text
+    assert response.json()["status"] == "success"
+
+
+def test_whatif_validation_is_a_bad_request_in_english(client):
+    response = client.post("/api/ftq/whatif", json={
+        "defects": make_defects(60),
+        "interventions": [{"action": "teleport"}],
+    })
+    assert response.status_code == 400
+    assert response.json()["error"].startswith("Intervention 0: action must be one of")
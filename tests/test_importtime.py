@@ -0,0 +1,10 @@
+import pytest
+
+import ftq_importtime
+
+
+@pytest.mark.parametrize("directory,module", ftq_importtime.TARGETS)
+def test_api_imports_within_budget(directory, module):
+    result = ftq_importtime.import_time(directory, module)
+    assert result["heavy_loaded"] == []
+    assert result["import_ms"] <= ftq_importtime.BUDGET_MS, result["slowest"][:5]
@@ -0,0 +1,75 @@
+import csv
+import io
+import json
+import sqlite3
+
+import pytest
+
+import export
+from records import ReworkTable
+from store import AnalyticsStore
+
+RECORDS = [
+    {"REWORK_ID": 1, "ORDNR": "ORD1", "REWORK_DATE": "2024-01-02 08:00:00", "Rework_time": 30.0,
+     "Area": "Motor", "Line": "Line 1", "Defect_type": "Terminal", "Success": 1,
+     "Operator": "B12", "Tags": ["urgent"]},
+    {"REWORK_ID": 2, "ORDNR": "ORD1", "REWORK_DATE": "2024-01-02 23:30:00", "Rework_time": 45.0,
+     "Area": "Motor", "Line": "Line 2", "Defect_type": "Terminal", "Success": 0},
+    {"REWORK_ID": 3, "ORDNR": "ORD2", "REWORK_DATE": "2024-01-03 06:00:00", "Rework_time": 20.0,
+     "Area": "Interior", "Line": "Line 1", "Defect_type": "Montage", "Success": 1},
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = AnalyticsStore(tmp_path / "analytics.sqlite")
+    store.rebuild(ReworkTable.from_records(RECORDS), 1)
+    yield store
+    store.close()
+
+
+def exported(store, fmt, params=None):
+    _, batches = store.export(params)
+    return b"".join(export.stream(batches, fmt))
+
+
+# ------------------ Export ------------------
+def test_jsonl_export_keeps_keys_outside_fields(store):
+    lines = exported(store, "jsonl").decode("utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == RECORDS
+
+
+def test_csv_export_has_an_extra_column(store):
+    rows = list(csv.DictReader(io.StringIO(exported(store, "csv").decode("utf-8"))))
+    assert list(rows[0]) == list(export.COLUMNS)
+    assert json.loads(rows[0]["extra"]) == {"Operator": "B12", "Tags": ["urgent"]}
+    assert rows[1]["extra"] == ""
+
+
+def test_parquet_export_has_an_extra_column(store):
+    pq = pytest.importorskip("pyarrow.parquet")
+    table = pq.read_table(io.BytesIO(exported(store, "parquet")))
+    assert table.column_names == list(export.COLUMNS)
+    assert table.column("REWORK_ID").to_pylist() == [1, 2, 3]
+    assert json.loads(table.column("extra")[0].as_py()) == {"Operator": "B12", "Tags": ["urgent"]}
+
+
+def test_store_from_an_older_schema_is_rebuilt(tmp_path, store):
+    store.close()
+    with sqlite3.connect(tmp_path / "analytics.sqlite") as conn:
+        conn.execute("ALTER TABLE reworks DROP COLUMN extra")
+    reopened = AnalyticsStore(tmp_path / "analytics.sqlite")
+    # Revision unknown: the manager rebuilds it from the dataset
+    assert reopened.revision == -1
+    reopened.rebuild(ReworkTable.from_records(RECORDS), 1)
+    assert len(exported(reopened, "jsonl").splitlines()) == 3
+    reopened.close()
+
+
+# ------------------ Filters ------------------
+def test_date_to_a_bare_day_includes_that_day(store):
+    rows = store.query("daily_ftq", {"date_to": "2024-01-02"})["rows"]
+    assert [(row["day"], row["reworks"]) for row in rows] == [("2024-01-02", 2)]
+    assert len(exported(store, "jsonl", {"date_from": "2024-01-02", "date_to": "2024-01-02"}).splitlines()) == 2
+    # A full timestamp stays an inclusive bound
+    assert store.query("daily_ftq", {"date_to": "2024-01-02 08:00:00"})["rows"][0]["reworks"] == 1
@@ -0,0 +1,117 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+BACKEND = Path(__file__).resolve().parents[1] / "backend"
+
+RECORD = {"ORDNR": "ORD1", "REWORK_DATE": "2024-01-02 08:00:00", "Rework_time": 30,
+          "Area": "Motor", "Line": "Line 1", "Defect_type": "Terminal", "Success": 1}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def node_env(tmp_path, **extra):
+    return {
+        **os.environ,
+        "REWORK_DATA_FILE": str(tmp_path / "data" / "data.json"),
+        "BUS_URL": f"unix://{tmp_path / 'bus'}",
+        "JOURNAL_CHECKPOINT_DELAY": "0.2",
+        **extra,
+    }
+
+
+def start_node(tmp_path, port, **extra):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND, env=node_env(tmp_path, **extra), stderr=subprocess.PIPE, text=True,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(process.stderr.read())
+        try:
+            httpx.get(url + "/data/data.json", timeout=1)
+            return process, url
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"node on port {port} did not start")
+
+
+def stop_node(process):
+    process.terminate()
+    process.wait(timeout=10)
+
+
+@pytest.fixture
+def nodes(tmp_path):
+    (tmp_path / "data").mkdir()
+    writer, writer_url = start_node(tmp_path, free_port())
+    try:
+        follower, follower_url = start_node(tmp_path, free_port(), REWORK_WRITER_URL=writer_url)
+    except Exception:
+        stop_node(writer)
+        raise
+    yield writer_url, follower_url
+    for process in (follower, writer):
+        if process.poll() is None:
+            stop_node(process)
+
+
+def orders(url):
+    return sorted(record["ORDNR"] for record in httpx.get(url + "/api/data").json())
+
+
+def test_writes_through_both_nodes_are_all_kept(nodes, tmp_path):
+    writer_url, follower_url = nodes
+    for i in range(20):
+        url = follower_url if i % 2 else writer_url
+        response = httpx.post(url + "/api/data/batch", json={"records": [{**RECORD, "ORDNR": f"ORD{i}"}]})
+        assert response.status_code == 200, response.text
+        # Each node serves its own write as soon as it is answered
+        assert f"ORD{i}" in orders(url)
+    # Let a checkpoint fold the journal into data.json
+    time.sleep(0.5)
+
+    expected = sorted(f"ORD{i}" for i in range(20))
+    assert orders(writer_url) == expected
+    assert orders(follower_url) == expected
+    assert httpx.get(writer_url + "/api/data").headers["X-Data-Revision"] == \
+        httpx.get(follower_url + "/api/data").headers["X-Data-Revision"]
+    on_disk = json.loads((tmp_path / "data" / "data.json").read_text())
+    assert sorted(record["ORDNR"] for record in on_disk) == expected
+
+
+def test_follower_forwards_conflicts_and_history(nodes):
+    writer_url, follower_url = nodes
+    revision = int(httpx.post(follower_url + "/api/data/batch", json={"records": [RECORD]})
+                   .headers["X-Data-Revision"])
+
+    stale = httpx.patch(follower_url + "/api/data/ORD1", json={"changes": {"Status": "Failed"}, "revision": revision - 1})
+    assert stale.status_code == 409
+    assert stale.headers["X-Data-Revision"] == str(revision)
+
+    patched = httpx.patch(follower_url + "/api/data/ORD1", json={"changes": {"Status": "Failed"}, "revision": revision})
+    assert patched.status_code == 200
+    assert httpx.get(follower_url + "/api/data").json()[0]["Success"] == 0
+    assert httpx.get(follower_url + "/api/history").json()["current_revision"] == revision + 1
+
+
+def test_second_writer_refuses_to_start(nodes, tmp_path):
+    result = subprocess.run([sys.executable, "-c", "import main"], cwd=BACKEND, env=node_env(tmp_path),
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode != 0
+    assert "WriterLocked" in result.stderr
+    assert "REWORK_WRITER_URL" in result.stderr
@@ -0,0 +1,255 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+import main
+from cluster import WriterLocked
+from dataset import journal_path, load, revision_path
+from main import AmbiguousRecord, JSONDataManager, RevisionConflict
+
+RECORDS = [
+    {"ORDNR": f"ORD{i}", "REWORK_DATE": f"2024-01-0{i + 1} 08:00:00", "Rework_time": 20 + i,
+     "Area": "Motor", "Line": "Line 1", "Defect_type": "Terminal", "Success": 1}
+    for i in range(3)
+]
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps(RECORDS))
+    return path
+
+
+def run(manager, coroutine):
+    async def main_task():
+        try:
+            return await coroutine
+        finally:
+            await manager.stop()
+    return asyncio.run(main_task())
+
+
+# ------------------ Journal ------------------
+def test_journal_is_replayed_after_a_crash_mid_checkpoint(data_file):
+    manager = JSONDataManager(data_file)
+    run(manager, manager.upsert_records([{**RECORDS[0], "ORDNR": "ORD9"}]))
+    manager.close()
+    manager = JSONDataManager(data_file)
+    run(manager, manager.patch_record("ORD1", {"Status": "Failed"}))
+    revision = manager.revision
+    assert journal_path(data_file).read_text().count("\n") == 0  # folded by stop()
+
+    # Crash between data.json being replaced and the journal being truncated
+    manager.close()
+    manager = JSONDataManager(data_file)
+
+    async def crash():
+        await manager.upsert_records([{**RECORDS[0], "ORDNR": "ORD10"}])
+        await manager.patch_record("ORD2", {"Rework_time": 99})
+        manager.write_data(manager.table.to_records())
+        manager._writer.cancel()
+    asyncio.run(crash())
+    manager.close()
+    with open(journal_path(data_file), "a") as f:
+        f.write('{"revision": 99, "op": "ups')  # torn tail of an interrupted append
+
+    data, replayed_revision, entries = load(data_file)
+    assert entries == 2
+    assert replayed_revision == revision + 2
+    records = {record["ORDNR"]: record for record in data.to_records()}
+    assert sorted(records) == ["ORD0", "ORD1", "ORD10", "ORD2", "ORD9"]
+    assert records["ORD1"]["Success"] == 0
+    assert records["ORD2"]["Rework_time"] == 99
+
+    restarted = JSONDataManager(data_file)
+    assert restarted.revision == revision + 2
+    assert len(restarted.read_data()) == 5
+    restarted.close()
+
+
+def test_failed_append_keeps_what_is_durable(data_file, monkeypatch):
+    manager = JSONDataManager(data_file)
+
+    def failing_append(*args):
+        raise OSError("disk full")
+    monkeypatch.setattr(manager, "_append_journal", failing_append)
+    with pytest.raises(OSError):
+        run(manager, manager.upsert_records([{**RECORDS[0], "ORDNR": "ORD9"}]))
+    assert manager.revision == 0
+    assert [record["ORDNR"] for record in manager.read_data()] == ["ORD0", "ORD1", "ORD2"]
+    manager.close()
+
+
+def test_reads_during_a_commit_never_see_its_rows(data_file, monkeypatch):
+    manager = JSONDataManager(data_file)
+    appending = threading.Event()
+
+    def slow_failing_append(*args):
+        appending.set()
+        time.sleep(0.2)
+        raise OSError("disk full")
+    monkeypatch.setattr(manager, "_append_journal", slow_failing_append)
+    request = Request({"type": "http", "headers": []})
+
+    async def writes():
+        write = asyncio.ensure_future(manager.upsert_records([{**RECORDS[0], "ORDNR": "ORD9"}]))
+        await asyncio.to_thread(appending.wait)
+        # Rendered once the commit is rolled back, not from the pending rows
+        response = await asyncio.to_thread(manager.http_response, request)
+        with pytest.raises(OSError):
+            await write
+        return response
+    response = run(manager, writes())
+    assert response.headers["ETag"] == '"rev-0"'
+    assert [record["ORDNR"] for record in json.loads(response.body)] == ["ORD0", "ORD1", "ORD2"]
+    assert manager.http_response(request).body == response.body
+    manager.close()
+
+
+# ------------------ Revisions ------------------
+def test_stale_revision_is_rejected(data_file):
+    manager = JSONDataManager(data_file)
+
+    async def writes():
+        await manager.upsert_records([{**RECORDS[0], "REWORK_ID": 1, "Rework_time": 50}], expected_revision=0)
+        with pytest.raises(RevisionConflict) as conflict:
+            await manager.patch_record("ORD0", {"Rework_time": 60}, expected_revision=0)
+        return conflict.value
+    conflict = run(manager, writes())
+    assert (conflict.expected, conflict.current) == (0, 1)
+    assert manager.read_data()[0]["Rework_time"] == 50
+    manager.close()
+
+
+# ------------------ Several reworks per order ------------------
+def test_new_reworks_of_an_order_are_appended(data_file):
+    manager = JSONDataManager(data_file)
+
+    async def writes():
+        await manager.upsert_records([{**RECORDS[0], "Rework_time": 40}, {**RECORDS[0], "Rework_time": 41}])
+        await manager.upsert_records([{"REWORK_ID": 5, "Rework_time": 42}])
+    run(manager, writes())
+    rows = [(record["REWORK_ID"], record["ORDNR"], record["Rework_time"]) for record in manager.read_data()]
+    assert rows == [(1, "ORD0", 20), (2, "ORD1", 21), (3, "ORD2", 22), (4, "ORD0", 40), (5, "ORD0", 42)]
+    manager.close()
+
+    # The journal replays onto the same rows
+    data, _, entries = load(data_file)
+    assert entries == 0 and len(data) == 5
+    restarted = JSONDataManager(data_file)
+    assert restarted.read_data() == manager.read_data()
+    restarted.close()
+
+
+def test_patch_of_an_order_with_several_reworks(data_file):
+    manager = JSONDataManager(data_file)
+
+    async def writes():
+        await manager.upsert_records([{**RECORDS[0], "Rework_time": 40}])
+        with pytest.raises(AmbiguousRecord) as ambiguous:
+            await manager.patch_record("ORD0", {"Status": "Failed"})
+        await manager.patch_record("ORD0", {"Status": "Failed"}, rework_id=4)
+        with pytest.raises(KeyError):
+            await manager.patch_record("ORD1", {"Status": "Failed"}, rework_id=4)
+        return ambiguous.value
+    assert run(manager, writes()).ids == [1, 4]
+    assert [(record["REWORK_ID"], record["Success"]) for record in manager.read_data()
+            if record["ORDNR"] == "ORD0"] == [(1, 1), (4, 0)]
+    manager.close()
+
+
+def test_journal_replay_keeps_new_reworks_apart(data_file):
+    manager = JSONDataManager(data_file)
+
+    async def crash():
+        await manager.upsert_records([{**RECORDS[1], "Rework_time": 40}])
+        await manager.patch_record("ORD1", {"Rework_time": 41}, rework_id=4)
+        manager._writer.cancel()
+    asyncio.run(crash())
+    manager.close()
+
+    data, _, entries = load(data_file)
+    assert entries == 2
+    assert [(record["REWORK_ID"], record["Rework_time"]) for record in data.to_records()
+            if record["ORDNR"] == "ORD1"] == [(2, 21), (4, 41)]
+
+
+# ------------------ Single writer ------------------
+def test_two_writers_on_one_file(data_file):
+    first = JSONDataManager(data_file)
+    with pytest.raises(WriterLocked):
+        JSONDataManager(data_file)
+    first.close()
+    # Released with its owner
+    JSONDataManager(data_file).close()
+
+
+def test_follower_applies_relayed_changes(data_file):
+    writer = JSONDataManager(data_file)
+    follower = JSONDataManager(data_file, follower=True)
+
+    async def relay(changes):
+        for revision, entry in changes:
+            await follower.follow(revision, entry)
+    writer.subscribe(relay)
+
+    async def writes():
+        await writer.upsert_records([{**RECORDS[0], "ORDNR": "ORD9"}])
+        await writer.patch_record("ORD9", {"Status": "Failed"})
+        # A replacement is only relayed as a revision: read from disk
+        await writer.update_data(lambda current: current.to_records()[:2])
+    run(writer, writes())
+    assert follower.revision == writer.revision == 3
+    assert follower.read_data() == writer.read_data()
+    with pytest.raises(RuntimeError):
+        asyncio.run(follower.upsert_records(RECORDS))
+    writer.close()
+
+
+# ------------------ REST ------------------
+@pytest.fixture
+def client():
+    with TestClient(main.app) as client:
+        assert client.post("/api/data", json={"data": RECORDS}).status_code == 200
+        yield client
+
+
+def test_rest_stale_revision_is_a_conflict(client):
+    revision = int(client.get("/api/data").headers["X-Data-Revision"])
+    assert client.post("/api/data/batch", json={"records": [RECORDS[0]], "revision": revision}).status_code == 200
+
+    stale = client.patch("/api/data/ORD0", json={"changes": {"Rework_time": 5}, "revision": revision})
+    assert stale.status_code == 409
+    assert stale.headers["X-Data-Revision"] == str(revision + 1)
+    assert client.post("/api/data", json={"data": [], "revision": revision}).status_code == 409
+
+
+def test_rest_patch_rederives_success_and_status(client):
+    failed = client.patch("/api/data/ORD0", json={"changes": {"Status": "Failed"}})
+    assert failed.status_code == 200
+    assert (failed.json()[0]["Status"], failed.json()[0]["Success"]) == ("Failed", 0)
+
+    repaired = client.patch("/api/data/ORD0", json={"changes": {"Success": 1}})
+    assert (repaired.json()[0]["Status"], repaired.json()[0]["Success"]) == ("Completed", 1)
+
+    contradiction = client.patch("/api/data/ORD0", json={"changes": {"Success": 1, "Status": "Failed"}})
+    assert contradiction.status_code == 400
+    assert client.get("/api/data").json()[0]["Success"] == 1
+
+
+def test_rest_patch_needs_the_rework_of_a_multi_rework_order(client):
+    assert client.post("/api/data/batch", json={"records": [{**RECORDS[0], "Rework_time": 40}]}).status_code == 200
+    ambiguous = client.patch("/api/data/ORD0", json={"changes": {"Status": "Failed"}})
+    assert ambiguous.status_code == 409
+    assert "REWORK_ID" in ambiguous.json()["detail"]
+
+    patched = client.patch("/api/data/ORD0", json={"changes": {"Status": "Failed"}, "rework_id": 4})
+    assert patched.status_code == 200
+    assert [(record["REWORK_ID"], record["Success"]) for record in patched.json()] == [(4, 0)]
+    assert client.patch("/api/data/ORD1", json={"changes": {"Status": "Failed"}, "rework_id": 4}).status_code == 404